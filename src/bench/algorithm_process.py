@@ -0,0 +1,90 @@
+import asyncio
+import multiprocessing as mp
+import socket
+import subprocess
+import time
+from typing import Optional
+
+from bench.stub_server import run_stub_server
+from comm import shm_transport
+from comm.shm_transport import SHM_TRANSPORT, TCP_TRANSPORT, channel_for_port
+
+DEFAULT_STARTUP_TIMEOUT = 10.0
+CONNECT_POLL_INTERVAL = 0.05
+
+
+def free_port(host: str = 'localhost') -> int:
+    with socket.socket() as sock:
+        sock.bind((host, 0))
+        return sock.getsockname()[1]
+
+
+class AlgorithmProcess:
+    """The algorithm a scenario or benchmark talks to: launched or already running.
+
+    The scenario's 'algorithm' entry is one of
+    - {"command": [...]}: a program started with {host}, {port}, {shm} and
+      {name} substituted in its arguments
+    - {"stub": {...}}: bench.stub_server with the given handler_cost, busy,
+      lumens and sample_concurrency
+    - {"host": ..., "port": ...}: an instance that is already running
+
+    A "transport" entry of "shm" reaches the algorithm over the shared
+    memory transport instead of TCP.
+    """
+    def __init__(self, scenario: dict, shm_name: str):
+        self.spec = scenario.get('algorithm') or {'stub': {}}
+        self.host = self.spec.get('host', 'localhost')
+        self.port = self.spec.get('port') or free_port(self.host)
+        self.transport = self.spec.get('transport', TCP_TRANSPORT)
+        self.shm_name = shm_name
+        self.name = scenario['name']
+        self._process = None
+
+    async def start(self):
+        if 'command' in self.spec:
+            arguments = [str(argument).format(host=self.host, port=self.port, shm=self.shm_name,
+                                              name=self.name)
+                         for argument in self.spec['command']]
+            self._process = subprocess.Popen(arguments)
+        elif 'stub' in self.spec:
+            stub = self.spec['stub']
+            self._process = mp.get_context('spawn').Process(
+                target=run_stub_server, daemon=True,
+                args=(self.host, self.port, stub.get('handler_cost', 0.0), stub.get('busy', False),
+                      stub.get('lumens', 20), stub.get('sample_concurrency', 1), self.transport))
+            self._process.start()
+        await self.wait_listening(self.spec.get('startup_timeout', DEFAULT_STARTUP_TIMEOUT))
+
+    @property
+    def pid(self) -> Optional[int]:
+        """Process id of a launched algorithm"""
+        return self._process.pid if self._process is not None else None
+
+    async def wait_listening(self, timeout: float):
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                if self.transport == SHM_TRANSPORT:
+                    _, writer = await shm_transport.open_connection(channel_for_port(self.port))
+                else:
+                    _, writer = await asyncio.open_connection(self.host, self.port)
+                writer.close()
+                return
+            except OSError:
+                if time.monotonic() >= deadline:
+                    raise TimeoutError(f"Algorithm not listening on {self.host}:{self.port}")
+                await asyncio.sleep(CONNECT_POLL_INTERVAL)
+
+    def stop(self):
+        if self._process is None:
+            return
+        self._process.terminate()
+        if isinstance(self._process, subprocess.Popen):
+            try:
+                self._process.wait(5)
+            except subprocess.TimeoutExpired:
+                self._process.kill()
+        else:
+            self._process.join(5)
+        self._process = None
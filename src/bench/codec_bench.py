@@ -0,0 +1,80 @@
+import argparse
+import json
+import time
+
+from comm.messages import binary_codec
+from comm.messages.messages import (CGSClock, CGSSample, Lumen,
+                                    UpdateAntennaSampleRequest,
+                                    UpdateAntennaSampleResponse)
+
+
+def make_request(msg_id: int) -> UpdateAntennaSampleRequest:
+    """Build a representative antenna sample request"""
+    request = UpdateAntennaSampleRequest(
+        pc_time=int(time.time() * 1000),
+        cgs_time=CGSClock(),
+        cgs_sample=CGSSample({'x': 1.5, 'y': -2.25, 'z': 30.125,
+                              'q0': 1.0, 'q1': 0.0, 'q2': 0.0, 'q3': 0.0})
+    )
+    request.id = msg_id
+    return request
+
+
+def make_response(msg_id: int, lumen_count: int) -> UpdateAntennaSampleResponse:
+    """Build a representative antenna sample response"""
+    response = UpdateAntennaSampleResponse(
+        pc_time=int(time.time() * 1000),
+        cgs_time=CGSClock(),
+        process_time=3.25,
+        lg_ct_position=[[1.0, 0.0, 0.0, 10.5],
+                        [0.0, 1.0, 0.0, -4.25],
+                        [0.0, 0.0, 1.0, 120.0],
+                        [0.0, 0.0, 0.0, 1.0]],
+        node_id=42,
+        lumens=[Lumen(i, i * 2, 5 + i % 7, i) for i in range(lumen_count)],
+        selections=[Lumen(10, 20, 8, 1)]
+    )
+    response.id = msg_id
+    return response
+
+
+def time_per_call(func, arg, iterations: int) -> float:
+    """Average wall time of func(arg) in microseconds"""
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func(arg)
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def bench_message(name: str, message, iterations: int):
+    """Compare the JSON path against the binary codec for one message"""
+    # The JSON path as used before the binary codec, with a uuid4 id
+    message.id = '6f1c2d0e-7a52-4c0b-9d38-6b1e2f3a4c5d'
+    json_payload = message.to_json().encode()
+    json_encode = time_per_call(lambda m: m.to_json().encode(), message, iterations)
+    json_decode = time_per_call(json.loads, json_payload, iterations)
+
+    message.id = 123456
+    binary_payload = binary_codec.encode(message)
+    binary_encode = time_per_call(binary_codec.encode, message, iterations)
+    binary_decode = time_per_call(binary_codec.decode, binary_payload, iterations)
+
+    print(f"{name:<44}{'encode us':>12}{'decode us':>12}{'bytes':>10}")
+    print(f"{'  json':<44}{json_encode:>12.2f}{json_decode:>12.2f}{len(json_payload):>10}")
+    print(f"{'  ' + binary_codec.BINARY_CODEC:<44}{binary_encode:>12.2f}"
+          f"{binary_decode:>12.2f}{len(binary_payload):>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="JSON vs binary codec benchmark")
+    parser.add_argument('--iterations', type=int, default=20000)
+    parser.add_argument('--lumens', type=int, default=50)
+    args = parser.parse_args()
+
+    bench_message('UpdateAntennaSampleRequest', make_request(1), args.iterations)
+    bench_message(f'UpdateAntennaSampleResponse ({args.lumens} lumens)',
+                  make_response(1, args.lumens), args.iterations)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+import argparse
+import asyncio
+import json
+import multiprocessing as mp
+import time
+
+from bench.stub_server import run_stub_server
+from bench.transport_bench import wait_connected
+from comm.comm_service import CommunicationService
+from comm.frame_stream import (DEFAULT_ENCODE_WORKERS, DEFAULT_JPEG_QUALITY,
+                               DEFAULT_KEYFRAME_INTERVAL, ENCODINGS)
+from comm.metrics import LatencyHistogram
+from video.channel_registry import ChannelRegistry, open_channel
+from video.frame_sources import RingSource
+from video.video_loader_writer import video_loader_writer
+
+SOURCE_CHANNEL = 'bench_stream_source'
+RECEIVED_CHANNEL = 'bench_stream_received'
+CHANNEL_WAIT = 10.0
+
+
+def read_received(duration: float) -> dict:
+    """Read the ring the stub republishes streamed frames into, as the algorithm would"""
+    reader = open_channel(RECEIVED_CHANNEL, CHANNEL_WAIT)
+    latency = LatencyHistogram()
+    frames = 0
+    started = time.perf_counter()
+    try:
+        while time.perf_counter() - started < duration:
+            frame = reader.wait_next(0.5)
+            if frame is None:
+                continue
+            latency.record((time.time_ns() - frame.timestamp_ns) / 1000)
+            frames += 1
+    finally:
+        reader.close()
+    return {'frames': frames, 'fps': frames / duration, 'latency_us': latency.snapshot()}
+
+
+async def measure(args, encoding: str) -> dict:
+    server = mp.Process(target=run_stub_server, daemon=True,
+                        kwargs={'port': args.port, 'frame_ring': RECEIVED_CHANNEL})
+    loader = mp.Process(target=video_loader_writer, daemon=True,
+                        kwargs={'video_path': args.video, 'shared_memory_name': SOURCE_CHANNEL,
+                                'fps': args.fps})
+    server.start()
+    loader.start()
+    client = CommunicationService(port=args.port)
+    source = None
+    try:
+        receive_task = await wait_connected(client)
+        streamer = client.enable_frame_streaming(encoding, args.quality,
+                                                 args.keyframe_interval, args.workers)
+        source = await asyncio.get_running_loop().run_in_executor(
+            None, RingSource, SOURCE_CHANNEL, CHANNEL_WAIT)
+        stream_task = asyncio.create_task(streamer.stream(source))
+        received = await asyncio.get_running_loop().run_in_executor(
+            None, read_received, args.duration)
+        stream_task.cancel()
+        stats = streamer.stats()
+        await client.close()
+        await receive_task
+    finally:
+        if source is not None:
+            source.close()
+        for process in (loader, server):
+            process.terminate()
+            process.join()
+    return {'encoding': encoding, 'streamer': stats, 'received': received}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stream a video to the stub algorithm over "
+                                                 "localhost and measure what arrives")
+    parser.add_argument('video')
+    parser.add_argument('--port', type=int, default=8300)
+    parser.add_argument('--fps', type=float, default=None,
+                        help="Publish rate, default the video's own; 0 for as fast as possible")
+    parser.add_argument('--duration', type=float, default=10.0, help="Seconds per encoding")
+    parser.add_argument('--encodings', nargs='+', choices=ENCODINGS, default=list(ENCODINGS))
+    parser.add_argument('--quality', type=int, default=DEFAULT_JPEG_QUALITY)
+    parser.add_argument('--keyframe-interval', type=int, default=DEFAULT_KEYFRAME_INTERVAL)
+    parser.add_argument('--workers', type=int, default=DEFAULT_ENCODE_WORKERS)
+    parser.add_argument('--output', default='')
+    args = parser.parse_args()
+
+    results = []
+    for encoding in args.encodings:
+        result = asyncio.run(measure(args, encoding))
+        # Rings of processes that were terminated are left for the registry to clean up
+        registry = ChannelRegistry()
+        registry.prune()
+        registry.close()
+        results.append(result)
+        streamer, received = result['streamer'], result['received']
+        sent = max(streamer['sent'], 1)
+        print(f"{encoding:>5}: offered {streamer['offered']:5d}  sent {streamer['sent']:5d}  "
+              f"dropped {streamer['dropped']:5d}  {streamer['bytes_sent'] / sent / 1024:8.1f} KiB/frame  "
+              f"encode p50 {streamer['encode_us']['p50'] / 1000:6.2f} ms  |  "
+              f"received {received['fps']:6.1f} fps  latency p50 "
+              f"{received['latency_us']['p50'] / 1000:6.2f} ms  "
+              f"p99 {received['latency_us']['p99'] / 1000:6.2f} ms")
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,209 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import time
+from typing import Callable, List, Tuple
+
+from bench.algorithm_process import AlgorithmProcess
+from bench.process_stats import ProcessSampler
+from comm.comm_service import CommunicationService
+from comm.messages.message_base import InitContinuesRegistrationRequest
+from comm.messages.messages import (CGSClock, CGSSample, LoadPlanningDataRequest,
+                                    StartRegistrationRequest, StopRegistrationRequest,
+                                    TranslationVector, UpdateAntennaSampleRequest, Vector3)
+from comm.metrics import LatencyHistogram
+from comm.sample_coalescer import DEFAULT_MAX_QUEUED, OVERLOAD_POLICIES, SampleDropped
+from comm.shm_transport import TCP_TRANSPORT, TRANSPORTS
+from video.multi_source_loader import MultiSourceLoader
+
+BENCH_SHARED_MEMORY_NAME = 'bench_video_frame_shm'
+
+
+def build_stages(rate: float, ramp: str, duration: float) -> List[Tuple[float, float]]:
+    """(target rate, duration) per stage, from a fixed rate or a start:stop:steps ramp"""
+    if not ramp:
+        return [(rate, duration)]
+    start, stop, steps = ramp.split(':')
+    start, stop, steps = float(start), float(stop), int(steps)
+    if steps <= 1:
+        return [(start, duration)]
+    step = (stop - start) / (steps - 1)
+    return [(start + step * index, duration) for index in range(steps)]
+
+
+def make_sample(index: int) -> UpdateAntennaSampleRequest:
+    return UpdateAntennaSampleRequest(
+        pc_time=time.monotonic_ns() // 1000,
+        cgs_time=CGSClock(),
+        cgs_sample=CGSSample({'x': float(index % 100), 'y': 1.0, 'z': 2.0,
+                              'q0': 1.0, 'q1': 0.0, 'q2': 0.0, 'q3': 0.0})
+    )
+
+
+async def run_stage(client: CommunicationService, rate: float, duration: float,
+                    sample_factory: Callable[[int], UpdateAntennaSampleRequest] = make_sample) -> dict:
+    """Stream samples at a fixed open-loop rate and measure latency.
+
+    Latency is measured from each sample's scheduled send time, not its
+    actual one, so time spent waiting for the in-flight window shows up
+    in the percentiles instead of being hidden by it. Samples discarded
+    by the client's overload policy are counted as dropped.
+    """
+    latency = LatencyHistogram()
+    pending = set()
+    counts = {'sent': 0, 'responses': 0, 'failures': 0, 'dropped': 0}
+    interval = 1.0 / rate
+    started = time.perf_counter()
+    deadline = started + duration
+
+    def on_done(future, scheduled):
+        if not future.cancelled() and isinstance(future.exception(), SampleDropped):
+            counts['dropped'] += 1
+            return
+        if future.cancelled() or future.exception() is not None:
+            counts['failures'] += 1
+            return
+        counts['responses'] += 1
+        latency.record((time.perf_counter() - scheduled) * 1e6)
+
+    index = 0
+    while True:
+        scheduled = started + index * interval
+        if scheduled >= deadline:
+            break
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        future = await client.submit_sample(sample_factory(index))
+        counts['sent'] += 1
+        future.add_done_callback(lambda done, scheduled=scheduled: on_done(done, scheduled))
+        pending.add(future)
+        future.add_done_callback(pending.discard)
+        index += 1
+
+    send_elapsed = time.perf_counter() - started
+    if pending:
+        await asyncio.wait(list(pending))
+    elapsed = time.perf_counter() - started
+
+    return {
+        'target_rate': rate,
+        'duration': duration,
+        'sent': counts['sent'],
+        'responses': counts['responses'],
+        'failures': counts['failures'],
+        'dropped': counts['dropped'],
+        'send_rate': counts['sent'] / send_elapsed if send_elapsed > 0 else 0.0,
+        'throughput': counts['responses'] / elapsed if elapsed > 0 else 0.0,
+        'latency_us': latency.snapshot(),
+    }
+
+
+async def run_client(args, samplers: dict) -> dict:
+    client = CommunicationService(port=args.port, max_in_flight=args.window,
+                                  codecs=[args.codec] if args.codec else None,
+                                  transport=args.transport)
+    if args.overload != 'off':
+        client.enable_sample_coalescing(args.max_queued, policy=args.overload,
+                                        max_age=args.max_age)
+    if args.record:
+        client.enable_recording(args.record)
+    receive_task = asyncio.create_task(client.connect_client())
+    while not client.connected.is_set() and not receive_task.done():
+        await asyncio.sleep(0.01)
+    if receive_task.done():
+        raise ConnectionError(f"Could not connect to stub server on port {args.port}")
+
+    # Session setup exercises the same message classes as the UI
+    await client.send_message(InitContinuesRegistrationRequest(
+        configuration_dir_path='/bench/config',
+        shared_memory_name=BENCH_SHARED_MEMORY_NAME,
+        frame_width=720, frame_height=720, color_bytes=3))
+    await client.send_message(LoadPlanningDataRequest(
+        skeleton_dir_path='/bench/skeleton',
+        data_dir_file_path='/bench/data',
+        target_position=Vector3(1.0, 2.0, 3.0)))
+    await client.send_message(StartRegistrationRequest(
+        pst1_position=TranslationVector(1.0, 0.0, 0.0),
+        pst2_position=TranslationVector(0.0, 1.0, 0.0),
+        pst3_position=TranslationVector(0.0, 0.0, 1.0)))
+
+    stages = []
+    for rate, duration in build_stages(args.rate, args.ramp, args.duration):
+        for sampler in samplers.values():
+            sampler.start()
+        stage = await run_stage(client, rate, duration)
+        stage['processes'] = {name: sampler.stop() for name, sampler in samplers.items()}
+        stages.append(stage)
+        print(f"rate {rate:8.0f}/s  throughput {stage['throughput']:8.0f}/s  "
+              f"p50 {stage['latency_us']['p50']:8.0f} us  p99 {stage['latency_us']['p99']:8.0f} us  "
+              f"p999 {stage['latency_us']['p999']:8.0f} us  failures {stage['failures']}  "
+              f"dropped {stage['dropped']}")
+
+    await client.send_message(StopRegistrationRequest())
+    result = {'codec': client.codec, 'stages': stages, 'metrics': client.metrics.snapshot()}
+    await client.close()
+    await receive_task
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load benchmark against a local stub algorithm")
+    parser.add_argument('--port', type=int, default=8100)
+    parser.add_argument('--rate', type=float, default=1000.0, help="Samples per second")
+    parser.add_argument('--ramp', default='',
+                        help="start:stop:steps rate ramp, overrides --rate")
+    parser.add_argument('--duration', type=float, default=10.0, help="Seconds per stage")
+    parser.add_argument('--window', type=int, default=64, help="Max requests in flight")
+    parser.add_argument('--codec', default='', help="Force a codec, e.g. json")
+    parser.add_argument('--transport', choices=TRANSPORTS, default=TCP_TRANSPORT)
+    parser.add_argument('--handler-cost', type=float, default=0.0,
+                        help="Synthetic stub cost per sample in seconds")
+    parser.add_argument('--busy', action='store_true',
+                        help="Burn the stub cost on the CPU instead of sleeping")
+    parser.add_argument('--server-concurrency', type=int, default=1,
+                        help="Antenna samples the stub handles at once")
+    parser.add_argument('--overload', choices=('off',) + OVERLOAD_POLICIES, default='off',
+                        help="Client overload policy for samples the stub cannot keep up with")
+    parser.add_argument('--max-queued', type=int, default=DEFAULT_MAX_QUEUED,
+                        help="Samples queued before the overload policy applies")
+    parser.add_argument('--max-age', type=float, default=None,
+                        help="Drop samples queued for longer than this many seconds")
+    parser.add_argument('--record', default='',
+                        help="Session log to record the client's messages to, for replay")
+    parser.add_argument('--video', default='', help="Video to publish alongside the load")
+    parser.add_argument('--output', default='bench_results.json')
+    args = parser.parse_args()
+
+    server = AlgorithmProcess({'name': 'load_bench', 'algorithm': {
+        'port': args.port, 'transport': args.transport,
+        'stub': {'handler_cost': args.handler_cost, 'busy': args.busy,
+                 'sample_concurrency': args.server_concurrency}}}, BENCH_SHARED_MEMORY_NAME)
+    # Loaders exit cleanly on terminate(), removing their ring and registry entry
+    video = MultiSourceLoader([(BENCH_SHARED_MEMORY_NAME, args.video)] if args.video else [])
+    try:
+        asyncio.run(server.start())
+        video.start()
+
+        samplers = {'server': ProcessSampler(server.pid)}
+        if args.video:
+            samplers['video'] = ProcessSampler(video.processes[BENCH_SHARED_MEMORY_NAME].pid)
+        samplers['client'] = ProcessSampler(os.getpid())
+        result = asyncio.run(run_client(args, samplers))
+    finally:
+        server.stop()
+        video.stop()
+        video.cleanup()
+
+    result['config'] = vars(args)
+    result['host'] = {'platform': platform.platform(), 'python': platform.python_version(),
+                      'cpus': os.cpu_count()}
+    with open(args.output, 'w') as output:
+        json.dump(result, output, indent=2)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+import argparse
+import json
+import tracemalloc
+
+from bench.codec_bench import make_request, make_response, time_per_call
+from comm.messages import registry
+from comm.messages.message_base import MessageBase
+
+
+def retained_bytes(factory, count: int) -> float:
+    """Memory held per object when keeping `count` objects made by factory"""
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    objects = [factory() for _ in range(count)]
+    after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del objects
+    return (after - before) / count
+
+
+def bench_message(name: str, message, iterations: int, count: int):
+    """Decode and encode costs of the dict path against the compiled typed path"""
+    cls = type(message)
+    data = json.loads(message.to_json())
+    payload = json.dumps(data)
+
+    rows = [
+        ('json.loads -> dict', time_per_call(json.loads, payload, iterations),
+         retained_bytes(lambda: json.loads(payload), count)),
+        ('json.loads -> typed (compiled)',
+         time_per_call(lambda p: cls.from_dict(json.loads(p)), payload, iterations),
+         retained_bytes(lambda: cls.from_dict(json.loads(payload)), count)),
+        ('dict -> typed (compiled)', time_per_call(cls.from_dict, data, iterations), None),
+        ('dict -> typed (generic, no nesting)',
+         time_per_call(lambda d: MessageBase.from_dict.__func__(cls, d), data, iterations), None),
+        ('typed -> dict (compiled)', time_per_call(cls.to_dict, message, iterations), None),
+        ('typed -> dict (generic)', time_per_call(MessageBase.to_dict, message, iterations), None),
+    ]
+
+    print(f"{name:<44}{'us/msg':>10}{'bytes/msg':>12}")
+    for label, micros, size in rows:
+        size_text = f'{size:>12.0f}' if size is not None else f"{'':>12}"
+        print(f"  {label:<42}{micros:>10.2f}{size_text}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Typed message decode/encode benchmark")
+    parser.add_argument('--iterations', type=int, default=20000)
+    parser.add_argument('--count', type=int, default=10000,
+                        help="Messages kept alive when measuring memory")
+    parser.add_argument('--lumens', type=int, default=50)
+    args = parser.parse_args()
+
+    print(f"{len(registry.MESSAGE_CLASSES)} registered message types")
+    bench_message('UpdateAntennaSampleRequest', make_request(1), args.iterations, args.count)
+    bench_message(f'UpdateAntennaSampleResponse ({args.lumens} lumens)',
+                  make_response(1, args.lumens), args.iterations, args.count)
+
+
+if __name__ == '__main__':
+    main()
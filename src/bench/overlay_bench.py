@@ -0,0 +1,63 @@
+import argparse
+import json
+import time
+
+import cv2
+import numpy as np
+
+from bench.codec_bench import time_per_call
+from comm.messages.messages import Lumen
+from ui.overlay_renderer import OverlayRenderer
+
+
+def make_response(lumen_count: int, size: int, seed: int = 0) -> dict:
+    """Sample response dict with lumens spread over the frame"""
+    rng = np.random.default_rng(seed)
+    lumens = [Lumen(int(x), int(y), int(r), i).to_dict() for i, (x, y, r) in enumerate(zip(
+        rng.integers(0, size, lumen_count), rng.integers(0, size, lumen_count),
+        rng.integers(3, 25, lumen_count)))]
+    return {'lumens': lumens, 'selections': lumens[:5],
+            'lg_ct_position': [[1.0, 0.0, 0.0, size / 2], [0.0, 1.0, 0.0, size / 3],
+                               [0.0, 0.0, 1.0, 120.0], [0.0, 0.0, 0.0, 1.0]]}
+
+
+def draw_with_cv2(image: np.ndarray, response: dict):
+    """Per-circle drawing on every frame, for comparison"""
+    for lumen in response['lumens']:
+        cv2.circle(image, (lumen['x'], lumen['y']), lumen['radius'], (0, 255, 0), 1)
+    for lumen in response['selections']:
+        cv2.circle(image, (lumen['x'], lumen['y']), lumen['radius'], (255, 0, 0), 3)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Overlay rendering cost per display frame")
+    parser.add_argument('--lumens', type=int, nargs='+', default=[100, 300, 1000])
+    parser.add_argument('--size', type=int, default=720)
+    parser.add_argument('--iterations', type=int, default=2000)
+    args = parser.parse_args()
+
+    image = np.zeros((args.size, args.size, 3), dtype=np.uint8)
+    results = []
+    print(f"{'lumens':>8}{'build us':>12}{'rebuild us':>12}{'render us':>12}{'cv2 us':>12}")
+    for count in args.lumens:
+        renderer = OverlayRenderer((args.size, args.size))
+        response = make_response(count, args.size)
+        started = time.perf_counter()
+        renderer.update(response, 0)
+        build = (time.perf_counter() - started) * 1e6
+        # Same lumen map, new selections and position: outlines come from the cache
+        response['selections'] = response['lumens'][5:10]
+        started = time.perf_counter()
+        renderer.update(response, 1)
+        rebuild = (time.perf_counter() - started) * 1e6
+        render = time_per_call(lambda frame_id: renderer.render(image, frame_id), 1,
+                               args.iterations)
+        direct = time_per_call(lambda r: draw_with_cv2(image, r), response, args.iterations // 10)
+        results.append({'lumens': count, 'build_us': build, 'rebuild_us': rebuild,
+                        'render_us': render, 'cv2_us': direct})
+        print(f"{count:>8}{build:>12.0f}{rebuild:>12.0f}{render:>12.1f}{direct:>12.1f}")
+    print(json.dumps(results))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+import os
+import time
+
+CLOCK_TICKS = os.sysconf('SC_CLK_TCK')
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+# Process states of /proc/<pid>/stat that mean the process has exited
+EXITED_STATES = ('Z', 'X')
+
+
+def _read_stat(pid: int) -> list:
+    with open(f'/proc/{pid}/stat') as stat_file:
+        # The command name may contain spaces; fields resume after the last ')'
+        return stat_file.read().rsplit(')', 1)[1].split()
+
+
+def read_cpu_seconds(pid: int) -> float:
+    """User plus system CPU time of a process, from /proc"""
+    fields = _read_stat(pid)
+    utime, stime = int(fields[11]), int(fields[12])
+    return (utime + stime) / CLOCK_TICKS
+
+
+def has_exited(pid: int) -> bool:
+    """Whether a process is gone or a zombie waiting to be reaped"""
+    try:
+        return _read_stat(pid)[0] in EXITED_STATES
+    except (FileNotFoundError, ProcessLookupError):
+        return True
+
+
+def read_memory(pid: int) -> dict:
+    """Current and peak resident set size of a process in MB.
+
+    Zombies have no memory left and no VmRSS line; their sizes are None.
+    """
+    memory = {'rss_mb': None, 'peak_rss_mb': None}
+    with open(f'/proc/{pid}/status') as status_file:
+        for line in status_file:
+            if line.startswith('VmRSS:'):
+                memory['rss_mb'] = int(line.split()[1]) / 1024
+            elif line.startswith('VmHWM:'):
+                memory['peak_rss_mb'] = int(line.split()[1]) / 1024
+    return memory
+
+
+class ProcessSampler:
+    """Measures CPU utilisation and memory of a process between two points"""
+    def __init__(self, pid: int = None):
+        self.pid = pid or os.getpid()
+        self._cpu = None
+        self._wall = None
+
+    def start(self):
+        self._cpu = read_cpu_seconds(self.pid)
+        self._wall = time.monotonic()
+
+    def stop(self) -> dict:
+        """CPU percent of one core since start(), plus current memory.
+
+        A process that exited during the measurement, including a zombie
+        not yet reaped, is reported as 'exited' with rss_mb zeroed; peak_rss_mb
+        keeps the peak it reached, or 0 if that is gone too.
+        """
+        try:
+            cpu = read_cpu_seconds(self.pid) - self._cpu
+            stats = read_memory(self.pid)
+        except (FileNotFoundError, ProcessLookupError):
+            return {'cpu_percent': 0.0, 'rss_mb': 0.0, 'peak_rss_mb': 0.0, 'exited': True}
+        wall = time.monotonic() - self._wall
+        stats['cpu_percent'] = 100.0 * cpu / wall if wall > 0 else 0.0
+        if stats['rss_mb'] is None or has_exited(self.pid):
+            stats.update(rss_mb=0.0, peak_rss_mb=stats['peak_rss_mb'] or 0.0, exited=True)
+        return stats
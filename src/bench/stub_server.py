@@ -0,0 +1,127 @@
+import argparse
+import asyncio
+import time
+
+from comm.comm_service import CommunicationService
+from comm.dispatcher import DEFAULT_MAX_CONCURRENCY
+from comm.messages.message_base import InitContinuesRegistrationResponse, MessageTypes
+from comm.messages.messages import (CGSClock, Lumen, LoadPlanningDataResponse,
+                                    StartRegistrationResponse, StopRegistrationResponse,
+                                    UpdateAntennaSampleResponse)
+from comm.shm_transport import TCP_TRANSPORT, TRANSPORTS
+
+IDENTITY_POSITION = [[1.0, 0.0, 0.0, 0.0],
+                     [0.0, 1.0, 0.0, 0.0],
+                     [0.0, 0.0, 1.0, 0.0],
+                     [0.0, 0.0, 0.0, 1.0]]
+
+
+class StubAlgorithmServer:
+    """Stand-in for the registration algorithm with a configurable synthetic cost.
+
+    Every antenna sample costs `handler_cost` seconds, either awaited
+    (like an algorithm waiting on I/O or another process) or burned on the
+    CPU when `busy` is set. Responses carry `lumen_count` lumens so payload
+    sizes resemble the real algorithm's.
+    """
+    def __init__(self, host: str = 'localhost', port: int = 8000,
+                 handler_cost: float = 0.0, busy: bool = False, lumen_count: int = 20,
+                 sample_concurrency: int = 1, transport: str = TCP_TRANSPORT,
+                 frame_ring: str = None):
+        self.handler_cost = handler_cost
+        self.busy = busy
+        self.lumens = [Lumen(i * 10, i * 5, 4 + i % 5, i) for i in range(lumen_count)]
+        # Room for a control message next to a full sample lane
+        self.comm_service = CommunicationService(
+            host=host, port=port, transport=transport,
+            handler_concurrency=max(DEFAULT_MAX_CONCURRENCY, sample_concurrency + 1))
+        self.samples = 0
+        # Streamed video frames are republished into a local ring, as a remote algorithm would
+        if frame_ring:
+            self.comm_service.enable_frame_receiving(frame_ring)
+
+        for message_type, handler in (
+                (MessageTypes.INIT_CONTINUES_REGISTRATION_REQUEST, self.handle_init),
+                (MessageTypes.LOAD_PLANNING_DATA_REQUEST, self.handle_load_planning_data),
+                (MessageTypes.START_REGISTRATION_REQUEST, self.handle_start),
+                (MessageTypes.STOP_REGISTRATION_REQUEST, self.handle_stop)):
+            self.comm_service.register_handler(message_type, handler)
+        # Samples may be answered out of order when handled concurrently
+        self.comm_service.register_handler(MessageTypes.UPDATE_ANTENNA_SAMPLE_REQUEST,
+                                           self.handle_sample,
+                                           max_concurrency=sample_concurrency)
+
+    async def spend(self):
+        """Spend the configured synthetic cost"""
+        if self.handler_cost <= 0:
+            return
+        if self.busy:
+            deadline = time.perf_counter() + self.handler_cost
+            while time.perf_counter() < deadline:
+                pass
+        else:
+            await asyncio.sleep(self.handler_cost)
+
+    async def handle_init(self, message):
+        return InitContinuesRegistrationResponse(success=True)
+
+    async def handle_load_planning_data(self, message):
+        return LoadPlanningDataResponse(success=True)
+
+    async def handle_start(self, message):
+        return StartRegistrationResponse(success=True)
+
+    async def handle_stop(self, message):
+        return StopRegistrationResponse(success=True)
+
+    async def handle_sample(self, message):
+        started = time.perf_counter()
+        await self.spend()
+        self.samples += 1
+        return UpdateAntennaSampleResponse(
+            pc_time=message.pc_time,
+            cgs_time=CGSClock(),
+            process_time=(time.perf_counter() - started) * 1000.0,
+            lg_ct_position=IDENTITY_POSITION,
+            node_id=self.samples % 100,
+            lumens=self.lumens,
+            selections=self.lumens[:1]
+        )
+
+    async def serve(self):
+        await self.comm_service.start_server()
+
+
+def run_stub_server(host: str = 'localhost', port: int = 8000, handler_cost: float = 0.0,
+                    busy: bool = False, lumen_count: int = 20, sample_concurrency: int = 1,
+                    transport: str = TCP_TRANSPORT, frame_ring: str = None):
+    """Process entry point serving until terminated"""
+    server = StubAlgorithmServer(host, port, handler_cost, busy, lumen_count, sample_concurrency,
+                                 transport, frame_ring)
+    try:
+        asyncio.run(server.serve())
+    except KeyboardInterrupt:
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stub registration algorithm server")
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--handler-cost', type=float, default=0.0,
+                        help="Synthetic cost per antenna sample in seconds")
+    parser.add_argument('--busy', action='store_true',
+                        help="Burn the handler cost on the CPU instead of sleeping")
+    parser.add_argument('--lumens', type=int, default=20)
+    parser.add_argument('--sample-concurrency', type=int, default=1,
+                        help="Antenna samples handled at once")
+    parser.add_argument('--transport', choices=TRANSPORTS, default=TCP_TRANSPORT)
+    parser.add_argument('--frame-ring', default=None,
+                        help="Receive streamed video frames into this frame channel")
+    args = parser.parse_args()
+    run_stub_server(args.host, args.port, args.handler_cost, args.busy, args.lumens,
+                    args.sample_concurrency, args.transport, args.frame_ring)
+
+
+if __name__ == '__main__':
+    main()
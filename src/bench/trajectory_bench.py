@@ -0,0 +1,69 @@
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from bench.codec_bench import make_response
+from record.trajectory_store import TrajectoryStore
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Trajectory store append and query benchmark")
+    parser.add_argument('--rate', type=float, default=100.0, help="Responses per second")
+    parser.add_argument('--seconds', type=float, default=3600.0, help="Length of the run")
+    parser.add_argument('--lumens', type=int, default=20)
+    parser.add_argument('--queries', type=int, default=1000)
+    parser.add_argument('--path', default=None, help="Store directory, a temporary one by default")
+    args = parser.parse_args()
+
+    path = args.path or tempfile.mkdtemp(prefix='trajectory_')
+    count = int(args.rate * args.seconds)
+    response = make_response(1, args.lumens).to_dict()
+    interval_ms = 1000.0 / args.rate
+    try:
+        store = TrajectoryStore(path, 'a')
+        started = time.perf_counter()
+        for index in range(count):
+            response['pc_time'] = int(index * interval_ms)
+            store.append(response)
+        store.close()
+        append_seconds = time.perf_counter() - started
+        size = sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+        print(f"Appended {count} responses in {append_seconds:.2f} s "
+              f"({append_seconds / count * 1e6:.1f} us each), {size / 1024 ** 2:.1f} MB on disk")
+
+        started = time.perf_counter()
+        store = TrajectoryStore(path)
+        open_ms = (time.perf_counter() - started) * 1e3
+        print(f"Opened in {open_ms:.2f} ms")
+
+        rng = np.random.default_rng(0)
+        span_ms = int(args.seconds * 1000)
+        starts = rng.integers(0, span_ms, args.queries)
+        for width_s in (1, 60, 600):
+            started = time.perf_counter()
+            rows = 0
+            for start in starts:
+                columns = store.select(store.range(int(start), int(start) + width_s * 1000))
+                rows += len(columns['pc_time'])
+            elapsed = (time.perf_counter() - started) / args.queries * 1e3
+            print(f"  {width_s:>4} s range: {elapsed:.3f} ms per query, "
+                  f"{rows / args.queries:.0f} rows")
+
+        started = time.perf_counter()
+        rows = store.range(span_ms // 2, span_ms // 2 + 60_000)
+        lumens, offsets = store.ragged_range('lumens', rows)
+        translation = store['lg_ct_position'][rows][:, :3, 3]
+        elapsed = (time.perf_counter() - started) * 1e3
+        print(f"1 min of positions {translation.shape} and {len(lumens)} lumens in {elapsed:.2f} ms")
+        store.close()
+    finally:
+        if args.path is None:
+            shutil.rmtree(path, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+import argparse
+import asyncio
+import json
+import multiprocessing as mp
+import time
+
+from bench.load_bench import make_sample, run_stage
+from bench.stub_server import run_stub_server
+from comm.comm_service import CommunicationService
+from comm.metrics import LatencyHistogram
+from comm.shm_transport import TRANSPORTS
+
+
+async def wait_connected(client: CommunicationService, timeout: float = 5.0) -> asyncio.Task:
+    """Connect, retrying until the server is up"""
+    deadline = time.perf_counter() + timeout
+    while True:
+        receive_task = asyncio.create_task(client.connect_client())
+        while not client.connected.is_set() and not receive_task.done():
+            await asyncio.sleep(0.01)
+        if client.connected.is_set():
+            return receive_task
+        if time.perf_counter() > deadline:
+            raise ConnectionError(f"Could not connect over {client.transport}")
+        await asyncio.sleep(0.1)
+
+
+async def ping_pong(client: CommunicationService, count: int) -> dict:
+    """Round trips of one sample at a time, so nothing but the transport is measured"""
+    latency = LatencyHistogram()
+    for index in range(count):
+        started = time.perf_counter()
+        await client.send_message(make_sample(index))
+        latency.record((time.perf_counter() - started) * 1e6)
+    return latency.snapshot()
+
+
+async def measure(transport: str, port: int, codec: str, count: int, rate: float,
+                  duration: float) -> dict:
+    server = mp.Process(target=run_stub_server, daemon=True,
+                        args=('localhost', port, 0.0, False, 20, 1, transport))
+    server.start()
+    try:
+        client = CommunicationService(port=port, codecs=[codec] if codec else None,
+                                      transport=transport)
+        receive_task = await wait_connected(client)
+        await ping_pong(client, min(count, 1000))
+        result = {'transport': transport, 'codec': client.codec,
+                  'round_trip_us': await ping_pong(client, count),
+                  'pipelined': await run_stage(client, rate, duration)}
+        await client.close()
+        await receive_task
+        return result
+    finally:
+        server.terminate()
+        server.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Round trip latency of the TCP and shared "
+                                                 "memory transports against the stub algorithm")
+    parser.add_argument('--port', type=int, default=8200)
+    parser.add_argument('--count', type=int, default=20000, help="Sequential round trips")
+    parser.add_argument('--rate', type=float, default=5000.0, help="Pipelined samples per second")
+    parser.add_argument('--duration', type=float, default=5.0, help="Seconds of pipelined load")
+    parser.add_argument('--codec', default='', help="Force a codec, e.g. json")
+    parser.add_argument('--transports', nargs='+', choices=TRANSPORTS, default=list(TRANSPORTS))
+    parser.add_argument('--output', default='')
+    args = parser.parse_args()
+
+    results = []
+    for transport in args.transports:
+        result = asyncio.run(measure(transport, args.port, args.codec, args.count, args.rate,
+                                     args.duration))
+        results.append(result)
+        round_trip, pipelined = result['round_trip_us'], result['pipelined']
+        print(f"{transport:>4} {result['codec']:>6}  round trip p50 {round_trip['p50']:7.0f} us  "
+              f"p99 {round_trip['p99']:7.0f} us  p999 {round_trip['p999']:7.0f} us  |  "
+              f"{pipelined['throughput']:7.0f}/s pipelined, "
+              f"p50 {pipelined['latency_us']['p50']:7.0f} us  "
+              f"p99 {pipelined['latency_us']['p99']:7.0f} us")
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=2)
+
+
+if __name__ == '__main__':
+    main()
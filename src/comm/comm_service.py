@@ -2,22 +2,74 @@ import socket
 import threading
 import json
 import uuid
-from typing import Dict, Any, Callable
+import itertools
+from collections import deque
+from typing import Dict, Any, Callable, List, AsyncIterator, Iterable, Union, AsyncIterable
 import asyncio
 import logging
+import time
 
-from comm.messages.message_base import InitContinuesRegistrationResponse, MessageBase, MessageTypes
+from comm.dispatcher import (DEFAULT_MAX_CONCURRENCY, EXECUTOR_INLINE, HandlerPolicy,
+                             MessageDispatcher)
+from comm.frame_stream import (DEFAULT_ENCODE_WORKERS, DEFAULT_JPEG_QUALITY,
+                               DEFAULT_KEYFRAME_INTERVAL, ENCODING_JPEG, FrameReceiver,
+                               FrameStreamer)
+from comm.framing import READ_CHUNK_SIZE, FrameReader, write_frame
+from comm.metrics import CommMetrics, MetricsReporter
+from comm import shm_transport
+from comm.shm_transport import SHM_TRANSPORT, TCP_TRANSPORT, TRANSPORTS, channel_for_port
+from comm.messages import binary_codec
+from comm.messages.binary_codec import BINARY_CODEC, JSON_CODEC
+from comm.messages.message_base import (CodecNegotiationRequest, CodecNegotiationResponse,
+                                        InitContinuesRegistrationRequest, InitContinuesRegistrationResponse,
+                                        MessageBase, MessageTypes, to_serializable)
+from comm.messages.messages import (UpdateAntennaSampleBatchRequest, UpdateAntennaSampleBatchResponse,
+                                    UpdateAntennaSampleRequest)
+from comm.messages.registry import decode_dict
+from comm.sample_batcher import (DEFAULT_MAX_BATCH_SIZE, DEFAULT_MAX_LINGER, RESPONSE_COLUMNS,
+                                 SampleBatcher, split_batch_request)
+from comm.sample_coalescer import (DEFAULT_MAX_QUEUED, DEFAULT_STREAM, DEFAULT_STREAM_IN_FLIGHT,
+                                   OVERLOAD_LATEST, SampleCoalescer, SampleDropped, merge_samples)
+from record.alignment import DEFAULT_FRAME_CAPACITY, DEFAULT_SAMPLE_CAPACITY, AlignmentBuffer
+from record.session_log import (RECORD_MESSAGE_OUT, RECORD_NOTIFY_OUT, RECORD_RESPONSE_OUT,
+                                SessionRecorder)
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, 
                     format='%(asctime)s - %(levelname)s - %(message)s')
 
+DEFAULT_RESPONSE_TIMEOUT = 10.0
+# Per message type response timeouts, overridable per service
+DEFAULT_RESPONSE_TIMEOUTS = {
+    MessageTypes.LOAD_PLANNING_DATA_REQUEST: 60.0,
+    MessageTypes.UPDATE_ANTENNA_SAMPLE_REQUEST: 2.0,
+}
+DEFAULT_MAX_IN_FLIGHT = 64
+SAMPLE_MESSAGE_TYPES = (MessageTypes.UPDATE_ANTENNA_SAMPLE_REQUEST,
+                        MessageTypes.UPDATE_ANTENNA_SAMPLE_BATCH_REQUEST)
+
 
 class CommunicationService:
-    """Async TCP Communication Service"""
-    def __init__(self, host: str = 'localhost', port: int = 8000):
+    """Async Communication Service over TCP or same-host shared memory.
+
+    With the shared memory transport, messages go through a pair of
+    lock-free rings instead of a loopback socket; `channel` names the
+    server end and defaults to one derived from the port, so both peers
+    only have to agree on the transport. `handler_concurrency` caps the
+    incoming message handlers running at once; see MessageDispatcher.
+    """
+    def __init__(self, host: str = 'localhost', port: int = 8000,
+                 codecs: List[str] = None, negotiation_timeout: float = 1.0,
+                 max_in_flight: int = DEFAULT_MAX_IN_FLIGHT,
+                 response_timeouts: Dict[str, float] = None,
+                 transport: str = TCP_TRANSPORT, channel: str = None,
+                 handler_concurrency: int = DEFAULT_MAX_CONCURRENCY):
+        if transport not in TRANSPORTS:
+            raise ValueError(f"Unknown transport '{transport}'")
         self.host = host
         self.port = port
+        self.transport = transport
+        self.channel = channel or channel_for_port(port)
         self.server_socket = None
         self.client_socket = None
         self.is_running = False
@@ -25,10 +77,53 @@ class CommunicationService:
         self.pending_responses: Dict[str, asyncio.Future] = {}
         self.logger = logging.getLogger(self.__class__.__name__)
 
+        # Payload codecs this peer supports, in order of preference. The
+        # client connection starts on JSON until negotiation picks another.
+        self.codecs = codecs or [BINARY_CODEC, JSON_CODEC]
+        self.negotiation_timeout = negotiation_timeout
+        self.codec = JSON_CODEC
+        self.connection_codecs: Dict[asyncio.StreamWriter, str] = {}
+        # Set once the client connection is up and its codec agreed
+        self.connected = asyncio.Event()
+        self._message_ids = itertools.count(1)
+
+        # Pipelining: at most max_in_flight requests await a response at once
+        self.max_in_flight = max_in_flight
+        self.response_timeouts = dict(DEFAULT_RESPONSE_TIMEOUTS)
+        self.response_timeouts.update(response_timeouts or {})
+        self._window = asyncio.Semaphore(max_in_flight)
+
+        # Optional coalescing of individually sent antenna samples
+        self.sample_batcher: SampleBatcher = None
+        # Optional overload policy keeping sample streams current
+        self.sample_coalescer: SampleCoalescer = None
+
+        # Optional encoded video frames, for algorithms that cannot map the frame ring
+        self.frame_streamer: FrameStreamer = None
+        self.frame_receiver: FrameReceiver = None
+
+        # Optional SessionRecorder capturing every payload sent and received
+        self.recorder = None
+
+        # Optional AlignmentBuffer indexing incoming antenna samples by
+        # arrival time, for handlers to line them up with video frames
+        self.alignment: AlignmentBuffer = None
+
+        # Per message type counters and latency histograms
+        self.metrics = CommMetrics()
+        self.metrics_reporter: MetricsReporter = None
+
+        # Concurrent, prioritised execution of incoming message handlers
+        self.dispatcher = MessageDispatcher(handler_concurrency)
+
     async def start_server(self):
-        """Start TCP server"""
-        self.server_socket = await asyncio.start_server(
-            self.handle_client, self.host, self.port)
+        """Start TCP or shared memory server"""
+        if self.transport == SHM_TRANSPORT:
+            self.server_socket = await shm_transport.start_server(
+                self.handle_client, self.channel)
+        else:
+            self.server_socket = await asyncio.start_server(
+                self.handle_client, self.host, self.port)
         
         addr = self.server_socket.sockets[0].getsockname()
         self.logger.info(f'Serving on {addr}')
@@ -39,12 +134,21 @@ class CommunicationService:
     async def connect_client(self):
         """Connect as a client"""
         try:
-            self.client_socket = await asyncio.open_connection(
-                self.host, self.port)
-            self.logger.info(f'Connected to {self.host}:{self.port}')
+            if self.transport == SHM_TRANSPORT:
+                self.client_socket = await shm_transport.open_connection(self.channel)
+                self.logger.info(f'Connected to shared memory channel {self.channel}')
+            else:
+                self.client_socket = await asyncio.open_connection(
+                    self.host, self.port)
+                self.logger.info(f'Connected to {self.host}:{self.port}')
             
-            # Start receiving messages
-            await self.receive_messages()
+            # Start receiving messages, then agree on a payload codec; a new
+            # connection always starts out on JSON
+            self.codec = JSON_CODEC
+            receive_task = asyncio.ensure_future(self.receive_messages())
+            await self.negotiate_codec()
+            self.connected.set()
+            await receive_task
         except Exception as e:
             self.logger.error(f"Connection error: {e}")
 
@@ -55,82 +159,473 @@ class CommunicationService:
         self.logger.info(f'Received connection from {addr}')
         
         try:
-            while True:
-                data = await reader.read(4096)
-                if not data:
-                    break
-                
-                message = data.decode()
-                await self.process_message(message, writer)
+            await self.read_frames(reader, writer)
         except Exception as e:
             self.logger.error(f"Client handling error: {e}")
         finally:
+            self.connection_codecs.pop(writer, None)
             writer.close()
 
-    async def process_message(self, message: str, 
+    async def negotiate_codec(self):
+        """Agree on a payload codec with the server, falling back to JSON"""
+        if self.codecs == [JSON_CODEC]:
+            return
+        response = await self.send_message(
+            CodecNegotiationRequest(codecs=self.codecs),
+            timeout=self.negotiation_timeout)
+        codec = response.get('codec') if response else None
+        self.codec = codec if codec in self.codecs else JSON_CODEC
+        self.logger.info(f'Using {self.codec} codec')
+
+    def encode_message(self, message: MessageBase, codec: str = JSON_CODEC) -> bytes:
+        """Encode a message with the given codec, using JSON when it has no binary layout"""
+        if codec == BINARY_CODEC and binary_codec.can_encode(message):
+            return binary_codec.encode(message)
+        return message.to_json().encode()
+
+    def decode_message(self, payload) -> Dict[str, Any]:
+        """Decode a frame payload of either encoding into a message dict"""
+        if binary_codec.is_binary(payload):
+            return binary_codec.decode(payload).to_dict()
+        if not isinstance(payload, str):
+            payload = str(payload, 'utf-8')
+        return json.loads(payload)
+
+    def decode_payload(self, payload) -> Union[MessageBase, Dict[str, Any]]:
+        """Decode a frame payload as cheaply as possible.
+
+        Binary payloads come out as typed messages and JSON payloads as
+        plain dicts; both support get() for the id and type.
+        """
+        if binary_codec.is_binary(payload):
+            return binary_codec.decode(payload)
+        if not isinstance(payload, str):
+            payload = str(payload, 'utf-8')
+        return json.loads(payload)
+
+    async def read_frames(self, reader: asyncio.StreamReader,
+                          writer: asyncio.StreamWriter = None):
+        """Read length-prefixed frames until the peer closes the stream"""
+        frame_reader = FrameReader()
+        while True:
+            data = await reader.read(READ_CHUNK_SIZE)
+            if not data:
+                break
+
+            # A single read may complete several frames, or none at all
+            for frame in frame_reader.feed(data):
+                await self.process_message(frame, writer)
+
+    async def process_message(self, message, 
                                writer: asyncio.StreamWriter = None):
         """Process incoming messages"""
         try:
-            msg_dict = json.loads(message)
-            msg_type = msg_dict.get('type')
-            msg_id = msg_dict.get('id')
+            if self.recorder is not None:
+                self.recorder.record_message_in(message)
+            decoded = self.decode_payload(message)
+            msg_type = decoded.get('type')
+            msg_id = decoded.get('id')
+            self.metrics.message_received(msg_type, len(message))
 
-            # Check if it's a response to a previous request
+            # Check if it's a response to a previous request; callers get dicts
             if msg_id in self.pending_responses:
+                msg_dict = decoded if isinstance(decoded, dict) else decoded.to_dict()
+                self.record_process_time(msg_type, msg_dict)
                 future = self.pending_responses.pop(msg_id)
-                future.set_result(msg_dict)
+                if not future.done():
+                    future.set_result(msg_dict)
+                return
+
+            # Codec negotiation is answered by the service itself
+            if msg_type == MessageTypes.CODEC_NEGOTIATION_REQUEST and writer:
+                codec = next((c for c in decoded.get('codecs', [])
+                              if c in self.codecs), JSON_CODEC)
+                self.connection_codecs[writer] = codec
+                response = CodecNegotiationResponse(codec=codec)
+                response.id = msg_id
+                self.write_payload(writer, response.to_json().encode(), RECORD_RESPONSE_OUT)
+                await writer.drain()
                 return
 
-            # Handle message via registered handlers
-            if msg_type in self.message_handlers:
-                handler = self.message_handlers[msg_type]
-                response = await handler(msg_dict)
-                
-                # Send response back if possible
-                if writer and response:
-                    response_json = json.dumps(response)
-                    writer.write(response_json.encode())
-                    await writer.drain()
+            # Batches can be served one sample at a time by the single sample handler
+            handler = self.message_handlers.get(msg_type)
+            if (handler is None and msg_type == MessageTypes.UPDATE_ANTENNA_SAMPLE_BATCH_REQUEST
+                    and MessageTypes.UPDATE_ANTENNA_SAMPLE_REQUEST in self.message_handlers):
+                handler = self.handle_sample_batch
+
+            request = None
+            if self.alignment is not None and msg_type in SAMPLE_MESSAGE_TYPES:
+                request = decode_dict(decoded) if isinstance(decoded, dict) else decoded
+                self.alignment.add_message(request, time.time_ns())
+
+            # Handlers get typed messages and run in their type's dispatch
+            # lane, so a slow one does not hold up the rest of the connection
+            if handler is not None:
+                if request is None:
+                    request = decode_dict(decoded) if isinstance(decoded, dict) else decoded
+                # A full lane either pauses this connection or drops a call
+                await self.dispatcher.admit(msg_type)
+                if not self.dispatcher.submit(msg_type, lambda: self.run_handler(
+                        handler, msg_type, msg_id, request, writer)):
+                    self.logger.debug(f"{msg_type} lane is full, dropped {msg_id}")
         except Exception as e:
             self.logger.error(f"Message processing error: {e}")
 
-    async def send_message(self, message: MessageBase):
-        """Send message and wait for response"""
+    async def run_handler(self, handler: Callable, msg_type: str, msg_id: Any,
+                          request: Union[MessageBase, Dict[str, Any]],
+                          writer: asyncio.StreamWriter = None):
+        """Run a handler and write its response, correlated by request id"""
+        try:
+            started = time.perf_counter()
+            response = await self.dispatcher.call_handler(msg_type, handler, request)
+            self.metrics.handler_completed(msg_type, time.perf_counter() - started)
+
+            # Send response back if possible; responses may go out in any order
+            if writer and response:
+                if isinstance(response, MessageBase):
+                    response.id = msg_id
+                    codec = self.connection_codecs.get(writer, JSON_CODEC)
+                    payload = self.encode_message(response, codec)
+                else:
+                    response.setdefault('id', msg_id)
+                    payload = json.dumps(response).encode()
+                self.metrics.message_sent(response.get('type') if isinstance(response, dict)
+                                          else response.type, len(payload))
+                self.write_payload(writer, payload, RECORD_RESPONSE_OUT)
+                await writer.drain()
+        except Exception as e:
+            self.logger.error(f"{msg_type} handler error: {e}")
+
+    def record_process_time(self, msg_type: str, msg_dict: Dict[str, Any]):
+        """Feed algorithm reported process times into the metrics"""
+        if 'process_time' in msg_dict:
+            self.metrics.process_time_reported(msg_type, msg_dict['process_time'] or 0.0)
+        for process_time in msg_dict.get('process_times') or ():
+            self.metrics.process_time_reported(msg_type, process_time or 0.0)
+
+    def start_metrics_reporter(self, interval: float = 10.0, csv_path: str = None) -> asyncio.Task:
+        """Periodically log the metrics and append them to a CSV file"""
+        self.metrics_reporter = MetricsReporter(self.metrics, interval, csv_path)
+        return self.metrics_reporter.start()
+
+    def write_payload(self, writer: asyncio.StreamWriter, payload: bytes,
+                      record_kind: int = RECORD_MESSAGE_OUT):
+        """Frame and write a payload, recording it if a recorder is attached"""
+        write_frame(writer, payload)
+        if self.recorder is not None:
+            self.recorder.record(record_kind, payload)
+
+    @property
+    def in_flight(self) -> int:
+        """Number of requests still waiting for a response"""
+        return len(self.pending_responses)
+
+    def timeout_for(self, message_type: str) -> float:
+        """Response timeout for a message type"""
+        return self.response_timeouts.get(message_type, DEFAULT_RESPONSE_TIMEOUT)
+
+    async def submit(self, message: MessageBase, timeout: float = None) -> asyncio.Future:
+        """Send a message without waiting for its response.
+
+        Waits for room in the in-flight window first, which is what applies
+        backpressure to fast producers. The returned future resolves to the
+        response, or fails with asyncio.TimeoutError once the message type's
+        timeout expires. Its pending entry is removed however it completes.
+        """
+        # Binary connections correlate requests by numeric id
+        if self.codec == BINARY_CODEC:
+            message.id = next(self._message_ids)
+        payload = self.encode_message(message, self.codec)
+        return await self.submit_payload(payload, message.id, message.type, timeout)
+
+    async def submit_payload(self, payload: bytes, msg_id=None, msg_type: str = None,
+                             timeout: float = None) -> asyncio.Future:
+        """Send an already encoded request, as submit() does for message objects.
+
+        The id and type are read from the payload when not given, which is
+        how recorded sessions are replayed.
+        """
+        if msg_id is None:
+            msg_dict = self.decode_message(payload)
+            msg_id, msg_type = msg_dict.get('id'), msg_dict.get('type')
+
+        await self._window.acquire()
+        loop = asyncio.get_running_loop()
         try:
             # Create future for response tracking
-            future = asyncio.Future()
-            self.pending_responses[message.id] = future
-            
+            future = loop.create_future()
+            self.pending_responses[msg_id] = future
+
             # Send message
-            message_json = json.dumps(message.__dict__)
             reader, writer = self.client_socket
-            writer.write(message_json.encode())
+            self.write_payload(writer, payload)
+            self.metrics.request_sent(msg_type, len(payload))
+            sent_at = time.perf_counter()
             await writer.drain()
+        except BaseException:
+            self.pending_responses.pop(msg_id, None)
+            self._window.release()
+            raise
+
+        if timeout is None:
+            timeout = self.timeout_for(msg_type)
+        expiry = loop.call_later(timeout, self._expire_response, msg_id, future)
+
+        def on_done(done):
+            self.metrics.request_completed(
+                msg_type, time.perf_counter() - sent_at,
+                not done.cancelled() and done.exception() is None)
+            expiry.cancel()
+            if self.pending_responses.get(msg_id) is future:
+                del self.pending_responses[msg_id]
+            self._window.release()
+
+        future.add_done_callback(on_done)
+        return future
+
+    def _expire_response(self, msg_id, future: asyncio.Future):
+        """Fail a request whose response did not arrive in time"""
+        if not future.done():
+            future.set_exception(asyncio.TimeoutError(f"No response to {msg_id}"))
 
-            # Wait for response with timeout
-            response = await asyncio.wait_for(future, timeout=10.0)
-            return response
+    async def send_message(self, message: MessageBase, timeout: float = None):
+        """Send message and wait for response"""
+        try:
+            future = await self.submit(message, timeout)
+            return await future
         except asyncio.TimeoutError:
             self.logger.error("Message send timeout")
         except Exception as e:
             self.logger.error(f"Message send error: {e}")
 
-    def register_handler(self, message_type: str, handler: Callable):
-        """Register a message handler"""
+    async def notify(self, message: MessageBase):
+        """Send a message that gets no response, such as a video frame.
+
+        Messages with a binary layout always use it, so frames never go
+        through JSON. Waits only for the connection to take the payload.
+        """
+        # The binary layouts carry numeric ids only
+        if not isinstance(message.id, int):
+            message.id = next(self._message_ids)
+        await self.notify_payload(self.encode_message(message, BINARY_CODEC), message.type)
+
+    async def notify_payload(self, payload: bytes, msg_type: str = None):
+        """Send an already encoded message that gets no response, as notify() does.
+
+        Recorded as a notification, so replaying a session sends it the
+        same way instead of waiting for a response.
+        """
+        if msg_type is None:
+            msg_type = self.decode_payload(payload).get('type')
+        _, writer = self.client_socket
+        self.write_payload(writer, payload, RECORD_NOTIFY_OUT)
+        self.metrics.message_sent(msg_type, len(payload))
+        await writer.drain()
+
+    def enable_recording(self, path: str) -> SessionRecorder:
+        """Record every payload sent and received to a session log, for SessionReplayer"""
+        self.recorder = SessionRecorder(path)
+        return self.recorder
+
+    def enable_frame_streaming(self, encoding: str = ENCODING_JPEG,
+                               quality: int = DEFAULT_JPEG_QUALITY,
+                               keyframe_interval: int = DEFAULT_KEYFRAME_INTERVAL,
+                               workers: int = DEFAULT_ENCODE_WORKERS) -> FrameStreamer:
+        """Send video frames over this connection; see FrameStreamer.stream"""
+        self.frame_streamer = FrameStreamer(self, encoding, quality, keyframe_interval, workers)
+        return self.frame_streamer
+
+    def enable_frame_receiving(self, ring_name: str = None, on_frame: Callable = None,
+                               registry_name: str = None) -> FrameReceiver:
+        """Decode streamed video frames, optionally republishing them to a local frame ring"""
+        self.frame_receiver = FrameReceiver(ring_name, on_frame, registry_name=registry_name,
+                                            alignment=self.alignment)
+        self.register_handler(MessageTypes.VIDEO_FRAME, self.frame_receiver.handle_frame)
+        return self.frame_receiver
+
+    def enable_alignment(self, frame_capacity: int = DEFAULT_FRAME_CAPACITY,
+                         sample_capacity: int = DEFAULT_SAMPLE_CAPACITY) -> AlignmentBuffer:
+        """Index incoming antenna samples and video frames by time.
+
+        Samples are added as they arrive and streamed frames as they are
+        decoded. Frames read from a shared memory ring are added by passing
+        the buffer to RingSource as `alignment`.
+        """
+        self.alignment = AlignmentBuffer(frame_capacity, sample_capacity)
+        if self.frame_receiver is not None:
+            self.frame_receiver.alignment = self.alignment
+        return self.alignment
+
+    def enable_sample_batching(self, max_batch_size: int = DEFAULT_MAX_BATCH_SIZE,
+                               max_linger: float = DEFAULT_MAX_LINGER):
+        """Coalesce samples passed to send_sample into batch requests"""
+        self.sample_batcher = SampleBatcher(self, max_batch_size, max_linger)
+
+    def enable_sample_coalescing(self, max_queued: int = DEFAULT_MAX_QUEUED,
+                                 max_in_flight: int = DEFAULT_STREAM_IN_FLIGHT,
+                                 policy: str = OVERLOAD_LATEST, merge: Callable = merge_samples,
+                                 max_age: float = None) -> SampleCoalescer:
+        """Bound the samples queued per stream when the algorithm falls behind"""
+        self.sample_coalescer = SampleCoalescer(self, max_queued, max_in_flight, policy,
+                                                merge, max_age)
+        return self.sample_coalescer
+
+    async def submit_sample(self, request: UpdateAntennaSampleRequest,
+                            stream: str = DEFAULT_STREAM) -> asyncio.Future:
+        """Send an antenna sample without waiting for its response.
+
+        Goes through the overload policy and the batcher when enabled.
+        With an overload policy this never waits for the in-flight window,
+        and the future may fail with SampleDropped.
+        """
+        if self.sample_coalescer is not None:
+            return self.sample_coalescer.submit(request, stream)
+        if self.sample_batcher is not None:
+            return await self.sample_batcher.submit(request)
+        return await self.submit(request)
+
+    async def send_sample(self, request: UpdateAntennaSampleRequest,
+                          stream: str = DEFAULT_STREAM):
+        """Send an antenna sample and wait for its response.
+
+        Returns None if it failed, timed out or was dropped under overload.
+        """
+        try:
+            future = await self.submit_sample(request, stream)
+            return await future
+        except asyncio.TimeoutError:
+            self.logger.error("Sample send timeout")
+        except SampleDropped:
+            pass
+        except Exception as e:
+            self.logger.error(f"Sample send error: {e}")
+
+    async def handle_sample_batch(self, batch: Union[UpdateAntennaSampleBatchRequest,
+                                                     Dict[str, Any]]):
+        """Answer a batch request through the single sample handler"""
+        sample_type = MessageTypes.UPDATE_ANTENNA_SAMPLE_REQUEST
+        handler = self.message_handlers[sample_type]
+        samples = (batch.to_samples() if isinstance(batch, UpdateAntennaSampleBatchRequest)
+                   else split_batch_request(batch))
+        responses = [await self.dispatcher.call_handler(sample_type, handler, sample)
+                     for sample in samples]
+        if all(isinstance(response, MessageBase) for response in responses):
+            return UpdateAntennaSampleBatchResponse.from_responses(responses)
+
+        responses = [to_serializable(response) or {} for response in responses]
+        response = {'type': MessageTypes.UPDATE_ANTENNA_SAMPLE_BATCH_RESPONSE}
+        for column, field in RESPONSE_COLUMNS:
+            response[column] = [sample.get(field) for sample in responses]
+        return response
+
+    async def send_many(self, messages: Union[Iterable[MessageBase], AsyncIterable[MessageBase]],
+                        timeout: float = None) -> AsyncIterator[tuple]:
+        """Pipeline messages through the in-flight window.
+
+        Yields (message, response) pairs in send order, with None as the
+        response of requests that failed or timed out. New messages are
+        sent while earlier responses are outstanding, so the connection
+        stays busy as long as the window has room.
+        """
+        if not hasattr(messages, '__aiter__'):
+            messages = _as_async_iter(messages)
+
+        sent = deque()
+        async for message in messages:
+            sent.append((message, await self.submit(message, timeout)))
+            while sent and sent[0][1].done():
+                message, future = sent.popleft()
+                yield message, self._response_or_none(future)
+
+        while sent:
+            message, future = sent.popleft()
+            await asyncio.wait([future])
+            yield message, self._response_or_none(future)
+
+    def _response_or_none(self, future: asyncio.Future):
+        if future.cancelled():
+            return None
+        if future.exception() is not None:
+            self.logger.error(f"Pipelined message failed: {future.exception()}")
+            return None
+        return future.result()
+
+    async def disconnect(self):
+        """Close the client connection, keeping the service ready to reconnect.
+
+        Recording, metrics reporting, frame streaming and the other
+        optional components carry on across reconnects; close() stops them.
+        """
+        self.connected.clear()
+        if self.client_socket:
+            _, writer = self.client_socket
+            self.client_socket = None
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except (ConnectionError, OSError):
+                pass
+        if self.frame_streamer is not None:
+            self.frame_streamer.reset()
+
+    async def close(self):
+        """Close the client connection, stop serving and shut everything down"""
+        await self.disconnect()
+        if self.server_socket:
+            self.server_socket.close()
+        if self.metrics_reporter is not None:
+            self.metrics_reporter.stop()
+        if self.frame_streamer is not None:
+            self.frame_streamer.close()
+        if self.sample_coalescer is not None:
+            self.sample_coalescer.close()
+        if self.recorder is not None:
+            self.recorder.close()
+            self.recorder = None
+        self.dispatcher.close()
+        if self.frame_receiver is not None:
+            self.frame_receiver.close()
+
+    def register_handler(self, message_type: str, handler: Callable, priority: int = None,
+                         max_concurrency: int = None, executor: str = None,
+                         max_queued: int = None, overflow: str = None):
+        """Register a message handler.
+
+        priority, max_concurrency, executor, max_queued and overflow
+        override the dispatch policy of the message type; see HandlerPolicy. Handlers run in a thread or
+        process pool must be plain functions rather than coroutines.
+        """
+        policy = self.dispatcher.policy_for(message_type)
+        policy = HandlerPolicy(policy.priority if priority is None else priority,
+                               policy.max_concurrency if max_concurrency is None else max_concurrency,
+                               policy.executor if executor is None else executor,
+                               policy.max_queued if max_queued is None else max_queued,
+                               overflow if overflow is not None
+                               else policy.overflow if priority is None else None)
+        if policy.executor != EXECUTOR_INLINE and asyncio.iscoroutinefunction(handler):
+            raise TypeError(f"{message_type} handler must be a plain function to run "
+                            f"in a {policy.executor} pool")
+        self.dispatcher.set_policy(message_type, policy)
         self.message_handlers[message_type] = handler
 
     async def receive_messages(self):
         """Continuously receive messages"""
         reader, _ = self.client_socket
         try:
-            while True:
-                data = await reader.read(4096)
-                if not data:
-                    break
-                message = data.decode()
-                await self.process_message(message)
+            await self.read_frames(reader)
         except Exception as e:
             self.logger.error(f"Message receive error: {e}")
+        finally:
+            # Nothing more will arrive; fail whatever is still outstanding
+            self.connected.clear()
+            for future in list(self.pending_responses.values()):
+                if not future.done():
+                    future.set_exception(ConnectionError("Connection closed"))
+
+
+async def _as_async_iter(items: Iterable):
+    for item in items:
+        yield item
 
 # Example Usage
 async def example_usage():
@@ -151,4 +646,26 @@ async def example_usage():
     )
 
     # Start server in background
-    server_task = asyncio.create_
\ No newline at end of file
+    server_task = asyncio.create_task(server.start_server())
+    await asyncio.sleep(0.1)
+
+    # Client-side example
+    client = CommunicationService(port=8000)
+    receive_task = asyncio.create_task(client.connect_client())
+    await asyncio.sleep(0.1)
+
+    response = await client.send_message(InitContinuesRegistrationRequest(
+        configuration_dir_path='/path/to/config',
+        shared_memory_name='video_frame_shm',
+        frame_width=720,
+        frame_height=720
+    ))
+    print("Received response:", response)
+
+    await client.close()
+    await receive_task
+    server_task.cancel()
+
+
+if __name__ == '__main__':
+    asyncio.run(example_usage())
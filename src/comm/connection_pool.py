@@ -0,0 +1,282 @@
+import asyncio
+import logging
+import math
+import time
+from typing import Any, Dict, Hashable, Iterable, List, Tuple, Union
+
+from comm.comm_service import CommunicationService
+from comm.messages.message_base import MessageBase
+from comm.metrics import LatencyHistogram
+
+DEFAULT_RECONNECT_DELAY = 1.0
+DEFAULT_MAX_FAILURES = 3
+DEFAULT_RETRY_AFTER = 5.0
+# Weight of the newest sample in an endpoint's smoothed round trip time
+LATENCY_SMOOTHING = 0.2
+# Fields that legitimately differ between instances answering the same request
+BROADCAST_IGNORED_FIELDS = ('id', 'cgs_time', 'cgs_times', 'process_time', 'process_times')
+
+
+class EndpointUnavailableError(ConnectionError):
+    """No healthy endpoint can take the request"""
+
+
+class Endpoint:
+    """One algorithm instance in a ConnectionPool, with its health and latency.
+
+    An endpoint is healthy while it is connected and has not failed
+    `max_failures` requests in a row. After that it is skipped for
+    `retry_after` seconds and then tried again.
+    """
+    def __init__(self, host: str, port: int, service: CommunicationService,
+                 max_failures: int = DEFAULT_MAX_FAILURES, retry_after: float = DEFAULT_RETRY_AFTER):
+        self.host = host
+        self.port = port
+        self.name = f'{host}:{port}'
+        self.service = service
+        self.max_failures = max_failures
+        self.retry_after = retry_after
+        self.sessions = 0
+        self.requests = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.last_error = ''
+        self.latency_ewma = 0.0
+        self.round_trip = LatencyHistogram()
+        self._suspended_until = 0.0
+        self._task = None
+
+    @property
+    def connected(self) -> bool:
+        return self.service.connected.is_set()
+
+    @property
+    def healthy(self) -> bool:
+        return self.connected and time.monotonic() >= self._suspended_until
+
+    @property
+    def in_flight(self) -> int:
+        return self.service.in_flight
+
+    def load(self) -> tuple:
+        """Sort key for least-loaded balancing: queue depth, then latency"""
+        return self.in_flight, self.latency_ewma
+
+    def succeeded(self, round_trip: float):
+        self.consecutive_failures = 0
+        self.round_trip.record(round_trip * 1e6)
+        if self.latency_ewma:
+            self.latency_ewma += LATENCY_SMOOTHING * (round_trip - self.latency_ewma)
+        else:
+            self.latency_ewma = round_trip
+
+    def failed(self, error: str):
+        self.failures += 1
+        self.consecutive_failures += 1
+        self.last_error = error
+        if self.consecutive_failures >= self.max_failures:
+            self._suspended_until = time.monotonic() + self.retry_after
+
+    def stats(self) -> dict:
+        return {'connected': self.connected, 'healthy': self.healthy,
+                'codec': self.service.codec, 'sessions': self.sessions,
+                'in_flight': self.in_flight, 'requests': self.requests,
+                'failures': self.failures, 'consecutive_failures': self.consecutive_failures,
+                'last_error': self.last_error,
+                'latency_ewma_us': self.latency_ewma * 1e6,
+                'round_trip_us': self.round_trip.snapshot()}
+
+
+class BroadcastResult:
+    """Responses of every endpoint to one broadcast request"""
+    def __init__(self, responses: Dict[str, Any], differences: Dict[str, Dict[str, Any]]):
+        self.responses = responses
+        self.differences = differences
+
+    @property
+    def consistent(self) -> bool:
+        return not self.differences
+
+
+def compare_responses(responses: Dict[str, Any], ignored: Iterable[str] = BROADCAST_IGNORED_FIELDS,
+                      tolerance: float = 1e-9) -> Dict[str, Dict[str, Any]]:
+    """Fields on which the endpoints' responses disagree, with each endpoint's value.
+
+    A missing or failed response counts as a difference on the '<response>' key.
+    """
+    answered = {name: response for name, response in responses.items()
+                if isinstance(response, dict)}
+    differences = {}
+    if len(answered) != len(responses):
+        differences['<response>'] = {name: isinstance(response, dict)
+                                     for name, response in responses.items()}
+    if len(answered) < 2:
+        return differences
+    ignored = set(ignored)
+    keys = set().union(*(response.keys() for response in answered.values())) - ignored
+    for key in sorted(keys):
+        values = {name: response.get(key) for name, response in answered.items()}
+        first = next(iter(values.values()))
+        if any(not _values_match(first, value, tolerance) for value in values.values()):
+            differences[key] = values
+    return differences
+
+
+def _values_match(left, right, tolerance: float) -> bool:
+    if isinstance(left, float) or isinstance(right, float):
+        try:
+            return math.isclose(left, right, rel_tol=tolerance, abs_tol=tolerance)
+        except TypeError:
+            return False
+    if isinstance(left, list) and isinstance(right, list):
+        return len(left) == len(right) and all(
+            _values_match(a, b, tolerance) for a, b in zip(left, right))
+    if isinstance(left, dict) and isinstance(right, dict):
+        return left.keys() == right.keys() and all(
+            _values_match(left[key], right[key], tolerance) for key in left)
+    return left == right
+
+
+class ConnectionPool:
+    """Client side connections to several algorithm endpoints.
+
+    Each endpoint gets its own CommunicationService, kept connected in the
+    background. Requests can be routed three ways:
+
+    - by session: every request of a session goes to the endpoint the
+      session was first assigned to, since registration state lives there
+    - least loaded: independent requests go to the healthy endpoint with
+      the fewest requests in flight, then the lowest smoothed latency
+    - broadcast: the same request goes to every healthy endpoint and the
+      responses are compared, for running builds side by side
+    """
+    def __init__(self, endpoints: Iterable[Union[str, Tuple[str, int]]], codecs: List[str] = None,
+                 max_in_flight: int = None, reconnect_delay: float = DEFAULT_RECONNECT_DELAY,
+                 max_failures: int = DEFAULT_MAX_FAILURES, retry_after: float = DEFAULT_RETRY_AFTER):
+        self.endpoints: List[Endpoint] = []
+        for endpoint in endpoints:
+            host, port = endpoint.rsplit(':', 1) if isinstance(endpoint, str) else endpoint
+            service_options = {'codecs': codecs}
+            if max_in_flight is not None:
+                service_options['max_in_flight'] = max_in_flight
+            service = CommunicationService(host=host, port=int(port), **service_options)
+            self.endpoints.append(Endpoint(host, int(port), service, max_failures, retry_after))
+        self.reconnect_delay = reconnect_delay
+        self.sessions: Dict[Hashable, Endpoint] = {}
+        self.broadcasts = 0
+        self.broadcast_mismatches = 0
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+    async def start(self, timeout: float = None, min_connected: int = 1) -> int:
+        """Start connecting every endpoint and wait until min_connected are up.
+
+        Returns the number of connected endpoints.
+        """
+        for endpoint in self.endpoints:
+            endpoint._task = asyncio.ensure_future(self._maintain(endpoint))
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.connected_count() < min_connected:
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+            await asyncio.sleep(0.01)
+        return self.connected_count()
+
+    async def _maintain(self, endpoint: Endpoint):
+        """Keep one endpoint connected, reconnecting after it drops.
+
+        Only the connection is torn down between attempts; the service's
+        recorder, reporter and streamer last until close().
+        """
+        while True:
+            await endpoint.service.connect_client()
+            await endpoint.service.disconnect()
+            endpoint.consecutive_failures = 0
+            await asyncio.sleep(self.reconnect_delay)
+
+    def connected_count(self) -> int:
+        return sum(endpoint.connected for endpoint in self.endpoints)
+
+    def healthy_endpoints(self) -> List[Endpoint]:
+        return [endpoint for endpoint in self.endpoints if endpoint.healthy]
+
+    def least_loaded(self, by_sessions: bool = False) -> Endpoint:
+        healthy = self.healthy_endpoints()
+        if not healthy:
+            raise EndpointUnavailableError("No healthy algorithm endpoint")
+        if by_sessions:
+            return min(healthy, key=lambda endpoint: (endpoint.sessions,) + endpoint.load())
+        return min(healthy, key=Endpoint.load)
+
+    def endpoint_for(self, session: Hashable) -> Endpoint:
+        """The endpoint a session is bound to; new sessions go where the fewest are bound"""
+        endpoint = self.sessions.get(session)
+        if endpoint is None:
+            endpoint = self.sessions[session] = self.least_loaded(by_sessions=True)
+            endpoint.sessions += 1
+        return endpoint
+
+    def release_session(self, session: Hashable):
+        """Forget a finished session so its endpoint is free for others"""
+        endpoint = self.sessions.pop(session, None)
+        if endpoint is not None:
+            endpoint.sessions -= 1
+
+    async def send_to(self, endpoint: Endpoint, message: MessageBase, timeout: float = None):
+        """Send a request to one endpoint and wait for the response dict"""
+        endpoint.requests += 1
+        started = time.perf_counter()
+        try:
+            future = await endpoint.service.submit(message, timeout)
+            response = await future
+        except Exception as e:
+            endpoint.failed(repr(e))
+            raise
+        endpoint.succeeded(time.perf_counter() - started)
+        return response
+
+    async def send(self, message: MessageBase, session: Hashable = None, timeout: float = None):
+        """Send a request by session affinity, or to the least loaded endpoint.
+
+        A session whose endpoint has become unhealthy is not moved, since
+        its registration state would be lost; EndpointUnavailableError is
+        raised instead and the caller decides whether to release it.
+        """
+        if session is None:
+            endpoint = self.least_loaded()
+        else:
+            endpoint = self.endpoint_for(session)
+            if not endpoint.healthy:
+                raise EndpointUnavailableError(
+                    f"Endpoint {endpoint.name} of session {session!r} is unavailable")
+        return await self.send_to(endpoint, message, timeout)
+
+    async def broadcast(self, message: MessageBase, timeout: float = None,
+                        ignored: Iterable[str] = BROADCAST_IGNORED_FIELDS,
+                        tolerance: float = 1e-9) -> BroadcastResult:
+        """Send a request to every healthy endpoint and compare the responses.
+
+        Failed endpoints appear with None as their response.
+        """
+        endpoints = self.healthy_endpoints()
+        if not endpoints:
+            raise EndpointUnavailableError("No healthy algorithm endpoint")
+        results = await asyncio.gather(*(self.send_to(endpoint, message, timeout)
+                                         for endpoint in endpoints), return_exceptions=True)
+        responses = {endpoint.name: (None if isinstance(result, BaseException) else result)
+                     for endpoint, result in zip(endpoints, results)}
+        result = BroadcastResult(responses, compare_responses(responses, ignored, tolerance))
+        self.broadcasts += 1
+        if not result.consistent:
+            self.broadcast_mismatches += 1
+        return result
+
+    def stats(self) -> Dict[str, dict]:
+        """Health, load and latency per endpoint"""
+        return {endpoint.name: endpoint.stats() for endpoint in self.endpoints}
+
+    async def close(self):
+        for endpoint in self.endpoints:
+            if endpoint._task is not None:
+                endpoint._task.cancel()
+                endpoint._task = None
+            await endpoint.service.close()
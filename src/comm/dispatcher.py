@@ -0,0 +1,250 @@
+import asyncio
+import collections
+import concurrent.futures
+import logging
+from typing import Any, Awaitable, Callable, Deque, Dict, List
+
+from comm.messages.message_base import MessageTypes
+
+EXECUTOR_INLINE = 'inline'
+EXECUTOR_THREAD = 'thread'
+EXECUTOR_PROCESS = 'process'
+
+# Lower values are dispatched first when messages compete for a slot
+PRIORITY_REALTIME = 0
+PRIORITY_CONTROL = 1
+PRIORITY_DEFAULT = 2
+PRIORITY_BULK = 3
+
+DEFAULT_PRIORITIES = {
+    MessageTypes.UPDATE_ANTENNA_SAMPLE_REQUEST: PRIORITY_REALTIME,
+    MessageTypes.UPDATE_ANTENNA_SAMPLE_BATCH_REQUEST: PRIORITY_REALTIME,
+    MessageTypes.START_REGISTRATION_REQUEST: PRIORITY_CONTROL,
+    MessageTypes.STOP_REGISTRATION_REQUEST: PRIORITY_CONTROL,
+    MessageTypes.INIT_CONTINUES_REGISTRATION_REQUEST: PRIORITY_CONTROL,
+    MessageTypes.LOAD_PLANNING_DATA_REQUEST: PRIORITY_BULK,
+}
+# One handler call per type at a time keeps each type's messages in order
+DEFAULT_TYPE_CONCURRENCY = 1
+# Few enough handler calls at once that lanes compete for them, with slots
+# only realtime and control lanes may take, so bulk work cannot fill every slot
+DEFAULT_MAX_CONCURRENCY = 4
+DEFAULT_RESERVED_SLOTS = 1
+URGENT_PRIORITY = PRIORITY_CONTROL
+DEFAULT_MAX_QUEUED = 256
+
+# What a full lane does with a new call
+OVERFLOW_DROP_OLDEST = 'drop_oldest'  # the oldest queued call is discarded
+OVERFLOW_DROP_NEWEST = 'drop_newest'  # the new call is discarded
+OVERFLOW_BLOCK = 'block'              # the connection stops reading until there is room
+OVERFLOW_POLICIES = (OVERFLOW_DROP_OLDEST, OVERFLOW_DROP_NEWEST, OVERFLOW_BLOCK)
+# Stale samples are worth less than fresh ones; other messages must not be lost
+DEFAULT_OVERFLOW = {
+    PRIORITY_REALTIME: OVERFLOW_DROP_OLDEST,
+}
+
+
+class HandlerPolicy:
+    """How messages of one type are scheduled and where their handler runs.
+
+    Inline handlers are coroutine functions run on the event loop. Thread
+    and process handlers are plain functions for CPU-bound work; process
+    handlers, their messages and their responses must be picklable.
+
+    At most max_queued calls wait in the type's lane; overflow decides
+    what happens to the next one. Dropped calls are never answered, so
+    the peer sees them time out. By default realtime lanes drop their
+    oldest call and every other lane applies backpressure.
+    """
+    __slots__ = ('priority', 'max_concurrency', 'executor', 'max_queued', 'overflow')
+
+    def __init__(self, priority: int = PRIORITY_DEFAULT,
+                 max_concurrency: int = DEFAULT_TYPE_CONCURRENCY,
+                 executor: str = EXECUTOR_INLINE,
+                 max_queued: int = DEFAULT_MAX_QUEUED, overflow: str = None):
+        if executor not in (EXECUTOR_INLINE, EXECUTOR_THREAD, EXECUTOR_PROCESS):
+            raise ValueError(f"Unknown handler executor '{executor}'")
+        if overflow is None:
+            overflow = DEFAULT_OVERFLOW.get(priority, OVERFLOW_BLOCK)
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown lane overflow policy '{overflow}'")
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be at least 1")
+        if max_queued < 1:
+            raise ValueError("max_queued must be at least 1")
+        self.priority = priority
+        self.max_concurrency = max_concurrency
+        self.executor = executor
+        self.max_queued = max_queued
+        self.overflow = overflow
+
+
+class _Lane:
+    """Queued and running handler calls of one message type"""
+    __slots__ = ('message_type', 'policy', 'queue', 'running', 'completed', 'queued_peak',
+                 'dropped', 'room')
+
+    def __init__(self, message_type: str, policy: HandlerPolicy):
+        self.message_type = message_type
+        self.policy = policy
+        self.queue: Deque[Callable[[], Awaitable]] = collections.deque()
+        self.running = 0
+        self.completed = 0
+        self.queued_peak = 0
+        self.dropped = 0
+        # Set whenever a queued call starts, for connections waiting on a full lane
+        self.room = asyncio.Event()
+
+    @property
+    def ready(self) -> bool:
+        return bool(self.queue) and self.running < self.policy.max_concurrency
+
+    @property
+    def full(self) -> bool:
+        return len(self.queue) >= self.policy.max_queued
+
+
+class MessageDispatcher:
+    """Runs message handlers concurrently in per-type priority lanes.
+
+    Each message type gets a lane with its own concurrency limit. When
+    more work is waiting than `max_concurrency` allows overall, free slots
+    go to the lane with the most urgent priority first, and the last
+    `reserved_slots` slots only go to realtime and control lanes, so a
+    burst of slow bulk requests cannot hold up antenna samples.
+    """
+    def __init__(self, max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+                 thread_workers: int = None, process_workers: int = None,
+                 reserved_slots: int = DEFAULT_RESERVED_SLOTS):
+        if not 0 <= reserved_slots < max_concurrency:
+            raise ValueError("reserved_slots must leave at least one slot for every lane")
+        self.max_concurrency = max_concurrency
+        self.reserved_slots = reserved_slots
+        self.thread_workers = thread_workers
+        self.process_workers = process_workers
+        self.running = 0
+        self.policies: Dict[str, HandlerPolicy] = {}
+        self._lanes: Dict[str, _Lane] = {}
+        self._by_priority: List[_Lane] = []
+        self._tasks = set()
+        self._thread_pool = None
+        self._process_pool = None
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+    def set_policy(self, message_type: str, policy: HandlerPolicy):
+        self.policies[message_type] = policy
+        lane = self._lanes.get(message_type)
+        if lane is not None:
+            lane.policy = policy
+            self._by_priority.sort(key=lambda lane: lane.policy.priority)
+
+    def policy_for(self, message_type: str) -> HandlerPolicy:
+        policy = self.policies.get(message_type)
+        if policy is None:
+            policy = HandlerPolicy(DEFAULT_PRIORITIES.get(message_type, PRIORITY_DEFAULT))
+            self.policies[message_type] = policy
+        return policy
+
+    def _lane(self, message_type: str) -> _Lane:
+        lane = self._lanes.get(message_type)
+        if lane is None:
+            lane = self._lanes[message_type] = _Lane(message_type, self.policy_for(message_type))
+            self._by_priority.append(lane)
+            self._by_priority.sort(key=lambda lane: lane.policy.priority)
+        return lane
+
+    def call_handler(self, message_type: str, handler: Callable, message: Any) -> Awaitable:
+        """Await a handler according to its type's executor"""
+        executor = self.policy_for(message_type).executor
+        if executor == EXECUTOR_INLINE:
+            return handler(message)
+        loop = asyncio.get_running_loop()
+        if executor == EXECUTOR_THREAD:
+            if self._thread_pool is None:
+                self._thread_pool = concurrent.futures.ThreadPoolExecutor(
+                    self.thread_workers, thread_name_prefix='handler')
+            return loop.run_in_executor(self._thread_pool, handler, message)
+        if self._process_pool is None:
+            self._process_pool = concurrent.futures.ProcessPoolExecutor(self.process_workers)
+        return loop.run_in_executor(self._process_pool, handler, message)
+
+    async def admit(self, message_type: str):
+        """Wait until the type's lane has room, if it applies backpressure"""
+        lane = self._lane(message_type)
+        while lane.policy.overflow == OVERFLOW_BLOCK and lane.full:
+            lane.room.clear()
+            await lane.room.wait()
+
+    def submit(self, message_type: str, work: Callable[[], Awaitable]) -> bool:
+        """Queue a call in its type's lane; work() is started once a slot is free.
+
+        Returns False when the lane's overflow policy discarded the call.
+        """
+        lane = self._lane(message_type)
+        if lane.full:
+            if lane.policy.overflow == OVERFLOW_DROP_NEWEST:
+                lane.dropped += 1
+                return False
+            if lane.policy.overflow == OVERFLOW_DROP_OLDEST:
+                lane.queue.popleft()
+                lane.dropped += 1
+            # Blocking lanes only overfill for callers that did not await admit()
+        lane.queue.append(work)
+        lane.queued_peak = max(lane.queued_peak, len(lane.queue))
+        self._pump()
+        return True
+
+    def _pump(self):
+        while self.running < self.max_concurrency:
+            shared = self.running < self.max_concurrency - self.reserved_slots
+            lane = next((lane for lane in self._by_priority if lane.ready
+                         and (shared or lane.policy.priority <= URGENT_PRIORITY)), None)
+            if lane is None:
+                return
+            work = lane.queue.popleft()
+            lane.room.set()
+            lane.running += 1
+            self.running += 1
+            task = asyncio.ensure_future(work())
+            self._tasks.add(task)
+            task.add_done_callback(lambda done, lane=lane: self._finished(done, lane))
+
+    def _finished(self, task: asyncio.Task, lane: _Lane):
+        self._tasks.discard(task)
+        lane.running -= 1
+        lane.completed += 1
+        self.running -= 1
+        if not task.cancelled() and task.exception() is not None:
+            self.logger.error(f"{lane.message_type} handler error: {task.exception()}")
+        self._pump()
+
+    def stats(self) -> Dict[str, dict]:
+        """Queue depth and progress per lane"""
+        return {lane.message_type: {'priority': lane.policy.priority,
+                                    'max_concurrency': lane.policy.max_concurrency,
+                                    'executor': lane.policy.executor,
+                                    'max_queued': lane.policy.max_queued,
+                                    'overflow': lane.policy.overflow,
+                                    'queued': len(lane.queue),
+                                    'queued_peak': lane.queued_peak,
+                                    'dropped': lane.dropped,
+                                    'running': lane.running,
+                                    'completed': lane.completed}
+                for lane in self._by_priority}
+
+    async def join(self):
+        """Wait until every queued and running call has finished"""
+        while self._tasks:
+            await asyncio.wait(list(self._tasks))
+
+    def close(self):
+        """Cancel outstanding calls and shut the worker pools down"""
+        for lane in self._lanes.values():
+            lane.queue.clear()
+            lane.room.set()
+        for task in list(self._tasks):
+            task.cancel()
+        for pool in (self._thread_pool, self._process_pool):
+            if pool is not None:
+                pool.shutdown(wait=False, cancel_futures=True)
+        self._thread_pool = self._process_pool = None
@@ -0,0 +1,329 @@
+import asyncio
+import logging
+import time
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Deque, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from comm.messages.messages import VideoFrame
+from comm.metrics import LatencyHistogram
+from video.channel_registry import ChannelRegistry
+from video.frame_ring import FrameRing
+from video.frame_sources import FrameSource
+
+ENCODING_RAW = 'raw'
+ENCODING_ZLIB = 'zlib'
+ENCODING_PNG = 'png'
+ENCODING_JPEG = 'jpeg'
+ENCODINGS = (ENCODING_JPEG, ENCODING_PNG, ENCODING_ZLIB, ENCODING_RAW)
+# Differences to a key frame survive only lossless encodings
+DELTA_ENCODINGS = (ENCODING_PNG, ENCODING_ZLIB, ENCODING_RAW)
+
+DEFAULT_JPEG_QUALITY = 80
+# zlib level 1 and PNG level 1 trade some size for several times the speed
+FAST_COMPRESSION_LEVEL = 1
+DEFAULT_KEYFRAME_INTERVAL = 30
+DEFAULT_ENCODE_WORKERS = 2
+READ_TIMEOUT = 0.5
+
+
+def encode_image(image: np.ndarray, encoding: str, quality: int = DEFAULT_JPEG_QUALITY) -> bytes:
+    if encoding == ENCODING_JPEG:
+        ok, data = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    elif encoding == ENCODING_PNG:
+        ok, data = cv2.imencode('.png', image, [cv2.IMWRITE_PNG_COMPRESSION, FAST_COMPRESSION_LEVEL])
+    elif encoding == ENCODING_ZLIB:
+        return zlib.compress(image, FAST_COMPRESSION_LEVEL)
+    elif encoding == ENCODING_RAW:
+        return image.tobytes()
+    else:
+        raise ValueError(f"Unknown frame encoding '{encoding}'")
+    if not ok:
+        raise ValueError(f"Could not encode frame as {encoding}")
+    return data.tobytes()
+
+
+def decode_image(data: bytes, encoding: str, shape: Tuple[int, int, int]) -> np.ndarray:
+    if encoding in (ENCODING_JPEG, ENCODING_PNG):
+        image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_UNCHANGED)
+        if image is None:
+            raise ValueError(f"Could not decode {encoding} frame")
+        return image.reshape(shape)
+    if encoding == ENCODING_ZLIB:
+        data = zlib.decompress(data)
+    elif encoding != ENCODING_RAW:
+        raise ValueError(f"Unknown frame encoding '{encoding}'")
+    return np.frombuffer(data, dtype=np.uint8).reshape(shape)
+
+
+def encode_frame(frame_id: int, timestamp_ns: int, image: np.ndarray, encoding: str,
+                 quality: int, key: Optional[Tuple[int, np.ndarray]]) -> Tuple[VideoFrame, float]:
+    """Encode a frame on its own, or as its difference to a key frame; runs in the worker pool.
+
+    Differences wrap around modulo 256, so adding them back to the key
+    frame restores the image exactly. Returns the message and the encode
+    time in seconds.
+    """
+    started = time.perf_counter()
+    if key is None:
+        data = encode_image(image, encoding, quality)
+        base_frame_id = -1
+    else:
+        base_frame_id, key_image = key
+        data = encode_image(np.subtract(image, key_image, dtype=np.uint8), encoding, quality)
+    height, width = image.shape[:2]
+    channels = image.shape[2] if image.ndim == 3 else 1
+    message = VideoFrame(frame_id, timestamp_ns, width, height, channels, encoding,
+                         key is None, base_frame_id, data)
+    message.id = frame_id
+    return message, time.perf_counter() - started
+
+
+class FrameStreamer:
+    """Streams video frames over a CommunicationService connection.
+
+    Frames are encoded in a thread pool (OpenCV and zlib release the GIL)
+    and sent in order. At most `workers` frames are being encoded or
+    waiting to be sent; a frame offered while they are all taken waits
+    in a single slot, where a newer frame replaces it. When the link or
+    the encoders cannot keep up, stale frames are dropped there instead
+    of queueing, and what is sent stays close to live.
+
+    With a lossless encoding, every `keyframe_interval`th frame is a key
+    frame and the others are sent as their difference to it, which mostly
+    compresses to little for a steady endoscope view. JPEG frames are all
+    key frames.
+    """
+    def __init__(self, comm_service, encoding: str = ENCODING_JPEG,
+                 quality: int = DEFAULT_JPEG_QUALITY,
+                 keyframe_interval: int = DEFAULT_KEYFRAME_INTERVAL,
+                 workers: int = DEFAULT_ENCODE_WORKERS):
+        if encoding not in ENCODINGS:
+            raise ValueError(f"Unknown frame encoding '{encoding}'")
+        self.comm_service = comm_service
+        self.encoding = encoding
+        self.quality = quality
+        self.keyframe_interval = keyframe_interval if encoding in DELTA_ENCODINGS else 1
+        self.workers = workers
+        self.executor = ThreadPoolExecutor(workers, thread_name_prefix='frame-encoder')
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+        self._queue: Deque[asyncio.Future] = deque()
+        self._pending: Optional[Tuple[int, int, np.ndarray]] = None
+        self._ready = asyncio.Event()
+        self._sender: Optional[asyncio.Task] = None
+        self._key: Optional[Tuple[int, np.ndarray]] = None
+        self._since_key = 0
+
+        self.offered = 0
+        self.sent = 0
+        self.dropped = 0
+        self.keyframes = 0
+        self.bytes_sent = 0
+        self.encode_time = LatencyHistogram()
+
+    def offer(self, frame_id: int, timestamp_ns: int, image: np.ndarray):
+        """Queue a frame for sending; the image must not change afterwards"""
+        if self._sender is None:
+            self._sender = asyncio.ensure_future(self._send_frames())
+        self.offered += 1
+        if len(self._queue) < self.workers:
+            self._encode(frame_id, timestamp_ns, image)
+            return
+        if self._pending is not None:
+            self.dropped += 1
+        self._pending = (frame_id, timestamp_ns, image)
+
+    def _encode(self, frame_id: int, timestamp_ns: int, image: np.ndarray):
+        key = None
+        if self._key is None or self._since_key >= self.keyframe_interval - 1:
+            if self.keyframe_interval > 1:
+                self._key = (frame_id, image)
+            self._since_key = 0
+        else:
+            key = self._key
+            self._since_key += 1
+        loop = asyncio.get_running_loop()
+        self._queue.append(loop.run_in_executor(
+            self.executor, encode_frame, frame_id, timestamp_ns, image, self.encoding,
+            self.quality, key))
+        self._ready.set()
+
+    async def _send_frames(self):
+        while True:
+            if not self._queue:
+                self._ready.clear()
+                await self._ready.wait()
+                continue
+            try:
+                message, encode_time = await self._queue[0]
+                self.encode_time.record(encode_time * 1e6)
+                await self.comm_service.notify(message)
+                self.sent += 1
+                self.keyframes += message.keyframe
+                self.bytes_sent += len(message.data)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.logger.error(f"Frame streaming error: {e}")
+                # Later differences may refer to a key frame that never arrived
+                self._key = None
+            finally:
+                self._queue.popleft()
+            if self._pending is not None:
+                pending, self._pending = self._pending, None
+                self._encode(*pending)
+
+    async def stream(self, source: FrameSource):
+        """Offer every frame of a source until it ends or the task is cancelled"""
+        loop = asyncio.get_running_loop()
+        while not source.ended:
+            frame = await loop.run_in_executor(None, self._read_copy, source)
+            if frame is not None:
+                self.offer(*frame)
+
+    @staticmethod
+    def _read_copy(source: FrameSource):
+        """Read a frame and copy it out of memory the source reuses"""
+        frame = source.read(READ_TIMEOUT)
+        if frame is None:
+            return None
+        frame_id, timestamp_ns, image = frame
+        image = image.copy()
+        return (frame_id, timestamp_ns, image) if source.is_valid() else None
+
+    def reset(self):
+        """Start over from a key frame, for a new connection whose peer has none yet"""
+        self._key = None
+        self._pending = None
+
+    def stats(self) -> dict:
+        return {'offered': self.offered, 'sent': self.sent, 'dropped': self.dropped,
+                'keyframes': self.keyframes, 'bytes_sent': self.bytes_sent,
+                'encode_us': self.encode_time.snapshot()}
+
+    def close(self):
+        if self._sender is not None:
+            self._sender.cancel()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+class FrameReceiver:
+    """Decodes streamed frames on the algorithm side.
+
+    Decoded frames go to `on_frame` and, when `ring_name` is given, are
+    republished into a local frame ring of that name, so an algorithm that
+    reads frames from shared memory works unchanged on a remote host.
+    Their ids and timestamps are also added to `alignment`, an
+    AlignmentBuffer, when one is set.
+
+    Frames are decoded one at a time in a worker thread. Frames arriving
+    meanwhile wait in two slots, one for the latest key frame and one for
+    the latest difference frame, so a slow decoder drops stale frames
+    instead of falling behind. Difference frames whose key frame was lost
+    are skipped until the next key frame.
+    """
+    def __init__(self, ring_name: str = None,
+                 on_frame: Callable[[int, int, np.ndarray], None] = None,
+                 ring_slots: int = 8, registry_name: str = None, alignment=None):
+        self.ring_name = ring_name
+        self.alignment = alignment
+        self.on_frame = on_frame
+        self.ring_slots = ring_slots
+        self.registry_name = registry_name
+        self.ring: Optional[FrameRing] = None
+        self.registry: Optional[ChannelRegistry] = None
+        self.latest: Optional[Tuple[int, int, np.ndarray]] = None
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self._key: Optional[Tuple[int, np.ndarray]] = None
+        self._pending_key: Optional[VideoFrame] = None
+        self._pending_delta: Optional[VideoFrame] = None
+        self._decoder: Optional[asyncio.Task] = None
+
+        self.received = 0
+        self.decoded = 0
+        self.dropped = 0
+        self.skipped = 0
+        self.decode_time = LatencyHistogram()
+        # Time from capture to decode; only meaningful with synchronised clocks
+        self.latency = LatencyHistogram()
+
+    async def handle_frame(self, message: VideoFrame):
+        """Message handler: keep the frame for the decoder, replacing older waiting ones"""
+        self.received += 1
+        if message.keyframe:
+            self.dropped += (self._pending_key is not None) + (self._pending_delta is not None)
+            self._pending_key, self._pending_delta = message, None
+        else:
+            self.dropped += self._pending_delta is not None
+            self._pending_delta = message
+        if self._decoder is None or self._decoder.done():
+            self._decoder = asyncio.ensure_future(self._decode_pending())
+        return None
+
+    async def _decode_pending(self):
+        loop = asyncio.get_running_loop()
+        while self._pending_key is not None or self._pending_delta is not None:
+            if self._pending_key is not None:
+                message, self._pending_key = self._pending_key, None
+            else:
+                message, self._pending_delta = self._pending_delta, None
+            try:
+                await loop.run_in_executor(None, self.decode, message)
+            except Exception as e:
+                self.logger.error(f"Frame {message.frame_id} decode error: {e}")
+
+    def decode(self, message: VideoFrame):
+        """Decode one frame and hand it on"""
+        started = time.perf_counter()
+        shape = (message.height, message.width, message.channels)
+        if message.keyframe:
+            image = decode_image(message.data, message.encoding, shape)
+            self._key = (message.frame_id, image)
+        elif self._key is None or self._key[0] != message.base_frame_id:
+            self.skipped += 1
+            return
+        else:
+            delta = decode_image(message.data, message.encoding, shape)
+            image = np.add(delta, self._key[1], dtype=np.uint8)
+        self.decode_time.record((time.perf_counter() - started) * 1e6)
+        self.latency.record(max(time.time_ns() - message.timestamp_ns, 0) / 1000)
+        self.decoded += 1
+
+        self.latest = (message.frame_id, message.timestamp_ns, image)
+        if self.alignment is not None:
+            self.alignment.add_frame(message.frame_id, message.timestamp_ns)
+        if self.ring_name:
+            self._publish(image, message.timestamp_ns)
+        if self.on_frame is not None:
+            self.on_frame(message.frame_id, message.timestamp_ns, image)
+
+    def _publish(self, image: np.ndarray, timestamp_ns: int):
+        if self.ring is None:
+            self.registry = ChannelRegistry(self.registry_name)
+            self.registry.claim(self.ring_name)
+            height, width = image.shape[:2]
+            channels = image.shape[2] if image.ndim == 3 else 1
+            self.ring = FrameRing(self.ring_name, height, width, channels, self.ring_slots)
+            self.registry.publish(self.ring_name, (height, width, channels), 0.0)
+        self.ring.write(image.reshape(self.ring.height, self.ring.width, self.ring.channels),
+                        timestamp_ns)
+
+    def stats(self) -> dict:
+        return {'received': self.received, 'decoded': self.decoded, 'dropped': self.dropped,
+                'skipped': self.skipped,
+                'decode_us': self.decode_time.snapshot(), 'latency_us': self.latency.snapshot()}
+
+    def close(self):
+        if self._decoder is not None:
+            self._decoder.cancel()
+        if self.ring is not None:
+            self.ring.mark_ended()
+            self.registry.unpublish(self.ring_name)
+            self.registry.close()
+            self.ring.close()
+            self.ring = None
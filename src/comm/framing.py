@@ -0,0 +1,104 @@
+import struct
+from typing import List
+
+# Wire format: every message is a 4 byte big-endian payload length followed
+# by the payload itself.
+FRAME_HEADER = struct.Struct('!I')
+MAX_FRAME_SIZE = 64 * 1024 * 1024
+READ_CHUNK_SIZE = 64 * 1024
+
+
+class FrameTooLargeError(ValueError):
+    """Raised when a peer announces a frame larger than the allowed maximum"""
+
+
+def encode_frame(payload: bytes) -> bytes:
+    """Prefix a payload with its length header"""
+    return FRAME_HEADER.pack(len(payload)) + payload
+
+
+def write_frame(writer, payload: bytes):
+    """Write a single framed payload to a stream writer"""
+    writer.write(FRAME_HEADER.pack(len(payload)) + payload)
+
+
+class FrameReader:
+    """Reassembles length-prefixed frames from a byte stream.
+
+    Incoming chunks are parsed in place whenever possible. Only a trailing
+    partial frame is copied into a reusable receive buffer, and complete
+    frames are returned as memoryviews into either the chunk or that buffer.
+    The returned views are only valid until the next call to `feed`.
+    """
+    def __init__(self, initial_size: int = READ_CHUNK_SIZE,
+                 max_frame_size: int = MAX_FRAME_SIZE):
+        self.max_frame_size = max_frame_size
+        self._buffer = bytearray(initial_size)
+        self._view = memoryview(self._buffer)
+        self._start = 0
+        self._end = 0
+
+    @property
+    def buffered(self) -> int:
+        """Number of bytes waiting for the rest of their frame"""
+        return self._end - self._start
+
+    def feed(self, data: bytes) -> List[memoryview]:
+        """Consume a chunk and return every frame it completes"""
+        if self._start == self._end:
+            # Fast path: nothing pending, parse straight out of the chunk
+            self._start = self._end = 0
+            chunk = memoryview(data)
+            frames, consumed = self._parse(chunk, 0, len(chunk))
+            if consumed < len(chunk):
+                self._append(chunk[consumed:])
+            return frames
+
+        self._append(data)
+        frames, consumed = self._parse(self._view, self._start, self._end)
+        self._start = consumed
+        return frames
+
+    def _parse(self, view: memoryview, start: int, end: int):
+        """Split complete frames out of view[start:end]"""
+        frames = []
+        header_size = FRAME_HEADER.size
+        while end - start >= header_size:
+            (length,) = FRAME_HEADER.unpack_from(view, start)
+            if length > self.max_frame_size:
+                raise FrameTooLargeError(
+                    f"Frame of {length} bytes exceeds limit of {self.max_frame_size}")
+            frame_end = start + header_size + length
+            if frame_end > end:
+                break
+            frames.append(view[start + header_size:frame_end])
+            start = frame_end
+        return frames, start
+
+    def _append(self, data):
+        """Copy bytes behind the pending data, compacting or growing as needed"""
+        size = len(data)
+        if self._end + size > len(self._buffer):
+            self._reserve(self._end - self._start + size)
+        self._view[self._end:self._end + size] = data
+        self._end += size
+
+    def _reserve(self, needed: int):
+        """Make room for `needed` bytes starting at the pending data"""
+        pending = self._end - self._start
+        if self._start + needed <= len(self._buffer):
+            return
+        if needed <= len(self._buffer):
+            # Compact: move the pending tail to the front of the buffer
+            self._view[:pending] = self._view[self._start:self._end]
+        else:
+            # Grow into a fresh buffer; views handed out earlier keep the old one
+            size = len(self._buffer)
+            while size < needed:
+                size *= 2
+            buffer = bytearray(size)
+            buffer[:pending] = self._view[self._start:self._end]
+            self._buffer = buffer
+            self._view = memoryview(buffer)
+        self._start = 0
+        self._end = pending
@@ -0,0 +1,453 @@
+import struct
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from comm.messages.messages import (CGSClock, CGSSample, Lumen, MessageTypes,
+                                    UpdateAntennaSampleBatchRequest,
+                                    UpdateAntennaSampleBatchResponse,
+                                    UpdateAntennaSampleRequest,
+                                    UpdateAntennaSampleResponse, VideoFrame)
+
+# Codec names exchanged during per-connection negotiation
+JSON_CODEC = 'json'
+BINARY_CODEC = 'binary-v1'
+
+# Binary payloads start with a magic byte that can never open a JSON document
+BINARY_MAGIC = 0xB1
+
+KIND_UPDATE_ANTENNA_SAMPLE_REQUEST = 1
+KIND_UPDATE_ANTENNA_SAMPLE_RESPONSE = 2
+KIND_UPDATE_ANTENNA_SAMPLE_BATCH_REQUEST = 3
+KIND_UPDATE_ANTENNA_SAMPLE_BATCH_RESPONSE = 4
+KIND_VIDEO_FRAME = 5
+
+# magic, kind, correlation id
+PREAMBLE = struct.Struct('<BBQ')
+# pc_time, cgs_time (epoch ns), number of sample fields
+SAMPLE_REQUEST_HEADER = struct.Struct('<qqH')
+# sample field value
+SAMPLE_VALUE = struct.Struct('<d')
+# pc_time, cgs_time (epoch ns), process_time, node_id, matrix rows, matrix cols
+SAMPLE_RESPONSE_HEADER = struct.Struct('<qqdiBB')
+# lumen count, selection count
+LUMEN_COUNTS = struct.Struct('<II')
+# x, y, radius, fid
+LUMEN = struct.Struct('<4i')
+# sample count, then for requests the number of sample fields
+BATCH_COUNT = struct.Struct('<I')
+SAMPLE_FIELD_COUNT = struct.Struct('<H')
+# matrix rows, matrix cols, shared by every sample of a batch response
+MATRIX_SHAPE = struct.Struct('<BB')
+# frame id, timestamp (epoch ns), width, height, channels, keyframe, base frame id;
+# followed by the encoding name and the encoded image up to the end of the payload
+VIDEO_FRAME_HEADER = struct.Struct('<qqHHB?q')
+
+NS_PER_SECOND = 1_000_000_000
+
+# Value ranges of the fixed-width fields; anything outside them goes as JSON
+UINT64_RANGE = range(2 ** 64)
+INT64_RANGE = range(-2 ** 63, 2 ** 63)
+INT32_RANGE = range(-2 ** 31, 2 ** 31)
+UINT16_RANGE = range(2 ** 16)
+# Field and encoding names are prefixed by a single length byte
+MAX_NAME_LENGTH = 255
+# Matrix rows and columns are single bytes
+MAX_MATRIX_SIDE = 255
+
+
+class BinaryCodecError(ValueError):
+    """Raised when a binary payload is truncated or of an unknown kind"""
+
+
+def is_binary(payload) -> bool:
+    """Check whether a frame payload uses the binary encoding"""
+    return len(payload) > 0 and payload[0] == BINARY_MAGIC
+
+
+def clock_to_ns(clock: CGSClock) -> int:
+    """Convert a CGSClock to integer nanoseconds since the epoch"""
+    timestamp = clock.timestamp
+    return int(timestamp.timestamp()) * NS_PER_SECOND + timestamp.microsecond * 1000
+
+
+def clock_from_ns(ns: int) -> CGSClock:
+    """Rebuild a CGSClock from integer nanoseconds since the epoch"""
+    seconds, remainder = divmod(ns, NS_PER_SECOND)
+    timestamp = datetime.fromtimestamp(seconds).replace(microsecond=remainder // 1000)
+    return CGSClock(timestamp)
+
+
+def _new_message(cls, message_type: str):
+    """Create a message without running __init__, which would draw a fresh uuid"""
+    message = cls.__new__(cls)
+    message.id = 0
+    message.type = message_type
+    return message
+
+
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float))
+
+
+def _fits_int(value, value_range: range) -> bool:
+    return isinstance(value, int) and value in value_range
+
+
+def _fits_time(pc_time) -> bool:
+    """Whether a pc_time converts to the int64 the layouts store"""
+    try:
+        return int(pc_time or 0) in INT64_RANGE
+    except (TypeError, ValueError):
+        return False
+
+
+def _fits_name(name) -> bool:
+    return isinstance(name, str) and len(name.encode()) <= MAX_NAME_LENGTH
+
+
+def _fits_sample(data: dict) -> bool:
+    return all(_fits_name(key) and _is_number(value) for key, value in data.items())
+
+
+def _fits_lumens(lumens) -> bool:
+    return all(_fits_int(value, INT32_RANGE)
+               for lumen in lumens for value in (lumen.x, lumen.y, lumen.radius, lumen.fid))
+
+
+def _matrix_shape(matrix) -> Optional[Tuple[int, int]]:
+    """Rows and columns of a numeric matrix; None if it is ragged or too large"""
+    rows = len(matrix)
+    cols = len(matrix[0]) if rows else 0
+    if rows > MAX_MATRIX_SIDE or cols > MAX_MATRIX_SIDE:
+        return None
+    if not all(len(row) == cols and all(_is_number(value) for value in row)
+               for row in matrix):
+        return None
+    return rows, cols
+
+
+def can_encode(message) -> bool:
+    """Check whether a message has a binary layout.
+
+    Only the high-rate antenna sample messages and video frames are
+    covered, and only when they carry a numeric correlation id and every
+    field fits its fixed-width slot: numeric samples and matrices, pc
+    times convertible to int64, names of at most 255 bytes. Anything
+    else is sent as JSON rather than failing on the send path.
+    """
+    if not _fits_int(message.id, UINT64_RANGE):
+        return False
+    if message.type == MessageTypes.UPDATE_ANTENNA_SAMPLE_REQUEST:
+        return _fits_time(message.pc_time) and _fits_sample(message.cgs_sample.data)
+    if message.type == MessageTypes.UPDATE_ANTENNA_SAMPLE_RESPONSE:
+        return (_fits_time(message.pc_time) and _is_number(message.process_time)
+                and _fits_int(message.node_id, INT32_RANGE)
+                and _matrix_shape(message.lg_ct_position) is not None
+                and _fits_lumens(message.lumens) and _fits_lumens(message.selections))
+    if message.type == MessageTypes.UPDATE_ANTENNA_SAMPLE_BATCH_REQUEST:
+        count = len(message.pc_times)
+        if len(message.cgs_times) != count or len(message.cgs_samples) != count \
+                or not all(_fits_time(pc_time) for pc_time in message.pc_times):
+            return False
+        # Columnar samples need the same numeric fields in every sample
+        if not message.cgs_samples:
+            return True
+        keys = list(message.cgs_samples[0].data)
+        return all(list(sample.data) == keys and _fits_sample(sample.data)
+                   for sample in message.cgs_samples)
+    if message.type == MessageTypes.UPDATE_ANTENNA_SAMPLE_BATCH_RESPONSE:
+        count = len(message.pc_times)
+        columns = (message.cgs_times, message.process_times, message.lg_ct_positions,
+                   message.node_ids, message.lumens, message.selections)
+        if any(len(column) != count for column in columns):
+            return False
+        # A single matrix shape is stored for the whole batch
+        shapes = {_matrix_shape(matrix) for matrix in message.lg_ct_positions}
+        return (len(shapes) <= 1 and None not in shapes
+                and all(_fits_time(pc_time) for pc_time in message.pc_times)
+                and all(_is_number(value) for value in message.process_times)
+                and all(_fits_int(node_id, INT32_RANGE) for node_id in message.node_ids)
+                and all(_fits_lumens(lumens) for lumens in message.lumens)
+                and all(_fits_lumens(selections) for selections in message.selections))
+    if message.type == MessageTypes.VIDEO_FRAME:
+        return (_fits_name(message.encoding)
+                and _fits_int(message.frame_id, INT64_RANGE)
+                and _fits_int(message.timestamp_ns, INT64_RANGE)
+                and _fits_int(message.base_frame_id, INT64_RANGE)
+                and _fits_int(message.width, UINT16_RANGE)
+                and _fits_int(message.height, UINT16_RANGE)
+                and _fits_int(message.channels, range(256)))
+    return False
+
+
+def encode(message) -> bytes:
+    """Encode a supported message into its fixed binary layout"""
+    if message.type == MessageTypes.UPDATE_ANTENNA_SAMPLE_REQUEST:
+        return _encode_sample_request(message)
+    if message.type == MessageTypes.UPDATE_ANTENNA_SAMPLE_RESPONSE:
+        return _encode_sample_response(message)
+    if message.type == MessageTypes.UPDATE_ANTENNA_SAMPLE_BATCH_REQUEST:
+        return _encode_batch_request(message)
+    if message.type == MessageTypes.UPDATE_ANTENNA_SAMPLE_BATCH_RESPONSE:
+        return _encode_batch_response(message)
+    if message.type == MessageTypes.VIDEO_FRAME:
+        return _encode_video_frame(message)
+    raise BinaryCodecError(f"No binary layout for {message.type}")
+
+
+def decode(payload):
+    """Decode a binary payload into its message object"""
+    try:
+        magic, kind, msg_id = PREAMBLE.unpack_from(payload, 0)
+        if magic != BINARY_MAGIC:
+            raise BinaryCodecError("Payload is not binary encoded")
+        if kind == KIND_UPDATE_ANTENNA_SAMPLE_REQUEST:
+            message = _decode_sample_request(payload, PREAMBLE.size)
+        elif kind == KIND_UPDATE_ANTENNA_SAMPLE_RESPONSE:
+            message = _decode_sample_response(payload, PREAMBLE.size)
+        elif kind == KIND_UPDATE_ANTENNA_SAMPLE_BATCH_REQUEST:
+            message = _decode_batch_request(payload, PREAMBLE.size)
+        elif kind == KIND_UPDATE_ANTENNA_SAMPLE_BATCH_RESPONSE:
+            message = _decode_batch_response(payload, PREAMBLE.size)
+        elif kind == KIND_VIDEO_FRAME:
+            message = _decode_video_frame(payload, PREAMBLE.size)
+        else:
+            raise BinaryCodecError(f"Unknown binary message kind {kind}")
+    except struct.error as e:
+        raise BinaryCodecError(f"Truncated binary payload: {e}") from e
+    message.id = msg_id
+    return message
+
+
+def _encode_sample_request(message: UpdateAntennaSampleRequest) -> bytes:
+    sample = message.cgs_sample.data
+    parts = [
+        PREAMBLE.pack(BINARY_MAGIC, KIND_UPDATE_ANTENNA_SAMPLE_REQUEST, message.id),
+        SAMPLE_REQUEST_HEADER.pack(int(message.pc_time),
+                                   clock_to_ns(message.cgs_time), len(sample)),
+    ]
+    for key, value in sample.items():
+        name = key.encode()
+        parts.append(bytes((len(name),)))
+        parts.append(name)
+        parts.append(SAMPLE_VALUE.pack(value))
+    return b''.join(parts)
+
+
+def _decode_sample_request(payload, offset: int) -> UpdateAntennaSampleRequest:
+    pc_time, cgs_ns, field_count = SAMPLE_REQUEST_HEADER.unpack_from(payload, offset)
+    offset += SAMPLE_REQUEST_HEADER.size
+    sample = {}
+    for _ in range(field_count):
+        name_length = payload[offset]
+        offset += 1
+        name = str(payload[offset:offset + name_length], 'utf-8')
+        offset += name_length
+        (sample[name],) = SAMPLE_VALUE.unpack_from(payload, offset)
+        offset += SAMPLE_VALUE.size
+    message = _new_message(UpdateAntennaSampleRequest,
+                           MessageTypes.UPDATE_ANTENNA_SAMPLE_REQUEST)
+    message.pc_time = pc_time
+    message.cgs_time = clock_from_ns(cgs_ns)
+    message.cgs_sample = CGSSample(sample)
+    return message
+
+
+def _pack_lumens(lumens: List[Lumen]) -> bytes:
+    flat = [value for lumen in lumens
+            for value in (lumen.x, lumen.y, lumen.radius, lumen.fid)]
+    return struct.pack(f'<{len(flat)}i', *flat)
+
+
+def _unpack_lumens(payload, offset: int, count: int):
+    end = offset + count * LUMEN.size
+    lumens = [Lumen(*values) for values in LUMEN.iter_unpack(payload[offset:end])]
+    return lumens, end
+
+
+def _encode_sample_response(message: UpdateAntennaSampleResponse) -> bytes:
+    matrix = message.lg_ct_position
+    rows = len(matrix)
+    cols = len(matrix[0]) if rows else 0
+    flat = [value for row in matrix for value in row]
+    return b''.join((
+        PREAMBLE.pack(BINARY_MAGIC, KIND_UPDATE_ANTENNA_SAMPLE_RESPONSE, message.id),
+        SAMPLE_RESPONSE_HEADER.pack(int(message.pc_time or 0),
+                                    clock_to_ns(message.cgs_time),
+                                    message.process_time, message.node_id,
+                                    rows, cols),
+        struct.pack(f'<{len(flat)}d', *flat),
+        LUMEN_COUNTS.pack(len(message.lumens), len(message.selections)),
+        _pack_lumens(message.lumens),
+        _pack_lumens(message.selections),
+    ))
+
+
+def _decode_sample_response(payload, offset: int) -> UpdateAntennaSampleResponse:
+    (pc_time, cgs_ns, process_time, node_id,
+     rows, cols) = SAMPLE_RESPONSE_HEADER.unpack_from(payload, offset)
+    offset += SAMPLE_RESPONSE_HEADER.size
+    flat = struct.unpack_from(f'<{rows * cols}d', payload, offset)
+    offset += rows * cols * 8
+    matrix = [list(flat[row * cols:(row + 1) * cols]) for row in range(rows)]
+    lumen_count, selection_count = LUMEN_COUNTS.unpack_from(payload, offset)
+    offset += LUMEN_COUNTS.size
+    lumens, offset = _unpack_lumens(payload, offset, lumen_count)
+    selections, offset = _unpack_lumens(payload, offset, selection_count)
+    message = _new_message(UpdateAntennaSampleResponse,
+                           MessageTypes.UPDATE_ANTENNA_SAMPLE_RESPONSE)
+    message.pc_time = pc_time
+    message.cgs_time = clock_from_ns(cgs_ns)
+    message.process_time = process_time
+    message.lg_ct_position = matrix
+    message.node_id = node_id
+    message.lumens = lumens
+    message.selections = selections
+    return message
+
+
+def _pack_column(code: str, values) -> bytes:
+    return struct.pack(f'<{len(values)}{code}', *values)
+
+
+def _unpack_column(code: str, count: int, payload, offset: int):
+    values = struct.unpack_from(f'<{count}{code}', payload, offset)
+    return list(values), offset + struct.calcsize(f'<{count}{code}')
+
+
+def _encode_batch_request(message: UpdateAntennaSampleBatchRequest) -> bytes:
+    count = len(message.pc_times)
+    keys = list(message.cgs_samples[0].data) if message.cgs_samples else []
+    parts = [
+        PREAMBLE.pack(BINARY_MAGIC, KIND_UPDATE_ANTENNA_SAMPLE_BATCH_REQUEST, message.id),
+        BATCH_COUNT.pack(count),
+        _pack_column('q', [int(pc_time) for pc_time in message.pc_times]),
+        _pack_column('q', [clock_to_ns(clock) for clock in message.cgs_times]),
+        SAMPLE_FIELD_COUNT.pack(len(keys)),
+    ]
+    for key in keys:
+        name = key.encode()
+        parts.append(bytes((len(name),)))
+        parts.append(name)
+    # Sample values are stored field by field, one column per key
+    for key in keys:
+        parts.append(_pack_column('d', [sample.data[key] for sample in message.cgs_samples]))
+    return b''.join(parts)
+
+
+def _decode_batch_request(payload, offset: int) -> UpdateAntennaSampleBatchRequest:
+    (count,) = BATCH_COUNT.unpack_from(payload, offset)
+    offset += BATCH_COUNT.size
+    pc_times, offset = _unpack_column('q', count, payload, offset)
+    cgs_ns, offset = _unpack_column('q', count, payload, offset)
+    (field_count,) = SAMPLE_FIELD_COUNT.unpack_from(payload, offset)
+    offset += SAMPLE_FIELD_COUNT.size
+    keys = []
+    for _ in range(field_count):
+        name_length = payload[offset]
+        offset += 1
+        keys.append(str(payload[offset:offset + name_length], 'utf-8'))
+        offset += name_length
+    columns = []
+    for _ in keys:
+        column, offset = _unpack_column('d', count, payload, offset)
+        columns.append(column)
+    message = _new_message(UpdateAntennaSampleBatchRequest,
+                           MessageTypes.UPDATE_ANTENNA_SAMPLE_BATCH_REQUEST)
+    message.pc_times = pc_times
+    message.cgs_times = [clock_from_ns(ns) for ns in cgs_ns]
+    message.cgs_samples = [CGSSample(dict(zip(keys, values)))
+                           for values in zip(*columns)] if keys else \
+        [CGSSample() for _ in range(count)]
+    return message
+
+
+def _encode_batch_response(message: UpdateAntennaSampleBatchResponse) -> bytes:
+    count = len(message.pc_times)
+    matrices = message.lg_ct_positions
+    rows = len(matrices[0]) if matrices else 0
+    cols = len(matrices[0][0]) if rows else 0
+    flat = [value for matrix in matrices for row in matrix for value in row]
+    return b''.join((
+        PREAMBLE.pack(BINARY_MAGIC, KIND_UPDATE_ANTENNA_SAMPLE_BATCH_RESPONSE, message.id),
+        BATCH_COUNT.pack(count),
+        _pack_column('q', [int(pc_time or 0) for pc_time in message.pc_times]),
+        _pack_column('q', [clock_to_ns(clock) for clock in message.cgs_times]),
+        _pack_column('d', message.process_times),
+        _pack_column('i', message.node_ids),
+        MATRIX_SHAPE.pack(rows, cols),
+        _pack_column('d', flat),
+        _pack_column('I', [len(lumens) for lumens in message.lumens]),
+        _pack_column('I', [len(selections) for selections in message.selections]),
+        b''.join(_pack_lumens(lumens) for lumens in message.lumens),
+        b''.join(_pack_lumens(selections) for selections in message.selections),
+    ))
+
+
+def _decode_batch_response(payload, offset: int) -> UpdateAntennaSampleBatchResponse:
+    (count,) = BATCH_COUNT.unpack_from(payload, offset)
+    offset += BATCH_COUNT.size
+    pc_times, offset = _unpack_column('q', count, payload, offset)
+    cgs_ns, offset = _unpack_column('q', count, payload, offset)
+    process_times, offset = _unpack_column('d', count, payload, offset)
+    node_ids, offset = _unpack_column('i', count, payload, offset)
+    rows, cols = MATRIX_SHAPE.unpack_from(payload, offset)
+    offset += MATRIX_SHAPE.size
+    flat, offset = _unpack_column('d', count * rows * cols, payload, offset)
+    lumen_counts, offset = _unpack_column('I', count, payload, offset)
+    selection_counts, offset = _unpack_column('I', count, payload, offset)
+    lumens = []
+    for lumen_count in lumen_counts:
+        sample_lumens, offset = _unpack_lumens(payload, offset, lumen_count)
+        lumens.append(sample_lumens)
+    selections = []
+    for selection_count in selection_counts:
+        sample_selections, offset = _unpack_lumens(payload, offset, selection_count)
+        selections.append(sample_selections)
+
+    size = rows * cols
+    message = _new_message(UpdateAntennaSampleBatchResponse,
+                           MessageTypes.UPDATE_ANTENNA_SAMPLE_BATCH_RESPONSE)
+    message.pc_times = pc_times
+    message.cgs_times = [clock_from_ns(ns) for ns in cgs_ns]
+    message.process_times = process_times
+    message.lg_ct_positions = [
+        [flat[start + row * cols:start + (row + 1) * cols] for row in range(rows)]
+        for start in range(0, count * size, size)] if size else [[] for _ in range(count)]
+    message.node_ids = node_ids
+    message.lumens = lumens
+    message.selections = selections
+    return message
+
+
+def _encode_video_frame(message: VideoFrame) -> bytes:
+    encoding = message.encoding.encode()
+    return b''.join((
+        PREAMBLE.pack(BINARY_MAGIC, KIND_VIDEO_FRAME, message.id),
+        VIDEO_FRAME_HEADER.pack(message.frame_id, message.timestamp_ns, message.width,
+                                message.height, message.channels, message.keyframe,
+                                message.base_frame_id),
+        bytes((len(encoding),)),
+        encoding,
+        message.data,
+    ))
+
+
+def _decode_video_frame(payload, offset: int) -> VideoFrame:
+    (frame_id, timestamp_ns, width, height, channels, keyframe,
+     base_frame_id) = VIDEO_FRAME_HEADER.unpack_from(payload, offset)
+    offset += VIDEO_FRAME_HEADER.size
+    name_length = payload[offset]
+    offset += 1
+    message = _new_message(VideoFrame, MessageTypes.VIDEO_FRAME)
+    message.frame_id = frame_id
+    message.timestamp_ns = timestamp_ns
+    message.width = width
+    message.height = height
+    message.channels = channels
+    message.encoding = str(payload[offset:offset + name_length], 'utf-8')
+    message.keyframe = keyframe
+    message.base_frame_id = base_frame_id
+    # The payload may be a view into a receive buffer that is about to be reused
+    message.data = bytes(payload[offset + name_length:])
+    return message
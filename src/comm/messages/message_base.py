@@ -1,16 +1,85 @@
+import json
+import uuid
+from datetime import datetime
+from typing import List
+
+
+def to_serializable(value):
+    """Convert nested message fields into JSON compatible values"""
+    if hasattr(value, 'to_dict'):
+        return value.to_dict()
+    if isinstance(value, (list, tuple)):
+        return [to_serializable(item) for item in value]
+    if isinstance(value, dict):
+        return {key: to_serializable(item) for key, item in value.items()}
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if hasattr(value, '__dict__'):
+        return to_serializable(value.__dict__)
+    return value
+
 
 class MessageBase:
-    """Base class for all messages"""
+    """Base class for all messages.
+
+    Messages keep their fields in __slots__; `_fields` lists them for each
+    class, base fields first. Registered message classes get compiled
+    to_dict/from_dict methods from comm.messages.registry, the versions here
+    are the generic fallbacks. get() and item access mirror the message
+    dicts handlers used to receive.
+    """
+    __slots__ = ('id', 'type')
+    _fields = ('id', 'type')
+
     def __init__(self, message_type: str):
         self.id = str(uuid.uuid4())
         self.type = message_type
 
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        fields = []
+        for klass in reversed(cls.__mro__):
+            for name in klass.__dict__.get('__slots__', ()):
+                if name not in fields and name != '__dict__':
+                    fields.append(name)
+        cls._fields = tuple(fields)
+
+    def to_dict(self):
+        data = {name: to_serializable(getattr(self, name, None)) for name in self._fields}
+        # Subclasses without __slots__ may carry extra attributes
+        for key, value in getattr(self, '__dict__', {}).items():
+            data[key] = to_serializable(value)
+        return data
+
     def to_json(self):
-        return json.dumps(self.__dict__)
+        return json.dumps(self.to_dict())
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        message = cls.__new__(cls)
+        for name in cls._fields:
+            setattr(message, name, data.get(name))
+        return message
 
     @classmethod
     def from_json(cls, json_str: str):
-        return cls(**json.loads(json_str))
+        return cls.from_dict(json.loads(json_str))
+
+    def get(self, key: str, default=None):
+        return getattr(self, key, default)
+
+    def __getitem__(self, key: str):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def __contains__(self, key: str) -> bool:
+        return hasattr(self, key)
+
+    def __repr__(self):
+        fields = ', '.join(f'{name}={getattr(self, name, None)!r}' for name in self._fields)
+        return f'{self.__class__.__name__}({fields})'
 
 
 class MessageTypes:
@@ -23,9 +92,17 @@ class MessageTypes:
     STOP_REGISTRATION_REQUEST = "StopRegistrationRequest"
     UPDATE_ANTENNA_SAMPLE_REQUEST = "UpdateAntennaSampleRequest"
     UPDATE_ANTENNA_SAMPLE_RESPONSE = "UpdateAntennaSampleResponse"
+    UPDATE_ANTENNA_SAMPLE_BATCH_REQUEST = "UpdateAntennaSampleBatchRequest"
+    UPDATE_ANTENNA_SAMPLE_BATCH_RESPONSE = "UpdateAntennaSampleBatchResponse"
+    CODEC_NEGOTIATION_REQUEST = "CodecNegotiationRequest"
+    CODEC_NEGOTIATION_RESPONSE = "CodecNegotiationResponse"
+    VIDEO_FRAME = "VideoFrame"
 
 class InitContinuesRegistrationRequest(MessageBase):
     """Request for continuous registration initialization"""
+    __slots__ = ('configuration_dir_path', 'catheter_calibration_path', 'log_file_path',
+                 'shared_memory_name', 'frame_width', 'frame_height', 'color_bytes')
+
     def __init__(self, 
                  configuration_dir_path: str = '',
                  catheter_calibration_path: str = '',
@@ -46,9 +123,29 @@ class InitContinuesRegistrationRequest(MessageBase):
 
 class InitContinuesRegistrationResponse(MessageBase):
     """Response for continuous registration initialization"""
+    __slots__ = ('success', 'error_message')
+
     def __init__(self, 
                  success: bool = False, 
                  error_message: str = ''):
         super().__init__(MessageTypes.INIT_CONTINUES_REGISTRATION_RESPONSE)
         self.success = success
-        self.error_message = error_message
\ No newline at end of file
+        self.error_message = error_message
+
+
+class CodecNegotiationRequest(MessageBase):
+    """Offers the payload codecs a peer can decode, in order of preference"""
+    __slots__ = ('codecs',)
+
+    def __init__(self, codecs: List[str] = None):
+        super().__init__(MessageTypes.CODEC_NEGOTIATION_REQUEST)
+        self.codecs = codecs or []
+
+
+class CodecNegotiationResponse(MessageBase):
+    """Names the codec chosen for the rest of the connection"""
+    __slots__ = ('codec',)
+
+    def __init__(self, codec: str = ''):
+        super().__init__(MessageTypes.CODEC_NEGOTIATION_RESPONSE)
+        self.codec = codec
@@ -3,7 +3,6 @@ from typing import List, Optional
 from dataclasses import dataclass, field
 from datetime import datetime
 
-from comm.comm_service import CommunicationService
 from comm.messages.message_base import MessageBase
 
 # Existing Vector3 and MessageBase classes from previous implementation
@@ -18,8 +17,11 @@ class MessageTypes:
     STOP_REGISTRATION_RESPONSE = "StopRegistrationResponse"
     UPDATE_ANTENNA_SAMPLE_REQUEST = "UpdateAntennaSampleRequest"
     UPDATE_ANTENNA_SAMPLE_RESPONSE = "UpdateAntennaSampleResponse"
+    UPDATE_ANTENNA_SAMPLE_BATCH_REQUEST = "UpdateAntennaSampleBatchRequest"
+    UPDATE_ANTENNA_SAMPLE_BATCH_RESPONSE = "UpdateAntennaSampleBatchResponse"
+    VIDEO_FRAME = "VideoFrame"
 
-@dataclass
+@dataclass(slots=True)
 class TranslationVector:
     """Represents a translation vector with x, y, z coordinates"""
     x: float = 0.0
@@ -29,7 +31,11 @@ class TranslationVector:
     def to_dict(self):
         return {"x": self.x, "y": self.y, "z": self.z}
 
-@dataclass
+    @classmethod
+    def from_dict(cls, data: dict):
+        return cls(data.get("x", 0.0), data.get("y", 0.0), data.get("z", 0.0))
+
+@dataclass(slots=True)
 class Lumen:
     """Represents a lumen with position and radius"""
     x: int = 0
@@ -45,7 +51,11 @@ class Lumen:
             "fid": self.fid
         }
 
-@dataclass
+    @classmethod
+    def from_dict(cls, data: dict):
+        return cls(data.get("x", 0), data.get("y", 0), data.get("radius", 0), data.get("fid", 0))
+
+@dataclass(slots=True)
 class CGSClock:
     """Represents a clock with timestamp"""
     timestamp: datetime = field(default_factory=datetime.now)
@@ -53,7 +63,12 @@ class CGSClock:
     def to_dict(self):
         return {"timestamp": self.timestamp.isoformat()}
 
-@dataclass
+    @classmethod
+    def from_dict(cls, data: dict):
+        timestamp = data.get("timestamp")
+        return cls(datetime.fromisoformat(timestamp)) if timestamp else cls()
+
+@dataclass(slots=True)
 class CGSSample:
     """Represents a CGS sample"""
     # Add specific attributes as needed
@@ -61,18 +76,34 @@ class CGSSample:
 
     def to_dict(self):
         return self.data
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        return cls(data)
     
-@dataclass 
 class Vector3:
+    """Target position as sent by the planning data request"""
+    __slots__ = ('X', 'Y', 'Z')
+
     def __init__(self, x=0.0, y=0.0 , z=0.0):
         self.X = x
         self.Y = y
         self.Z = z
 
+    def to_dict(self):
+        return {"X": self.X, "Y": self.Y, "Z": self.Z}
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        # comm.messages.vector3.Vector3 is also sent here, with lower case keys
+        return cls(data.get("X", data.get("x", 0.0)), data.get("Y", data.get("y", 0.0)),
+                   data.get("Z", data.get("z", 0.0)))
+
 
-@dataclass
 class LoadPlanningDataRequest(MessageBase):
     """Request for loading planning data"""
+    __slots__ = ('skeleton_dir_path', 'data_dir_file_path', 'target_position')
+
     def __init__(self, 
                  skeleton_dir_path: str = '',
                  data_dir_file_path: str = '',
@@ -82,9 +113,10 @@ class LoadPlanningDataRequest(MessageBase):
         self.data_dir_file_path = data_dir_file_path
         self.target_position = target_position or Vector3()
 
-@dataclass
 class LoadPlanningDataResponse(MessageBase):
     """Response for loading planning data"""
+    __slots__ = ('success', 'error_message')
+
     def __init__(self, 
                  success: bool = False, 
                  error_message: str = ''):
@@ -92,9 +124,10 @@ class LoadPlanningDataResponse(MessageBase):
         self.success = success
         self.error_message = error_message
 
-@dataclass
 class StartRegistrationRequest(MessageBase):
     """Request to start registration"""
+    __slots__ = ('pst1_position', 'pst2_position', 'pst3_position')
+
     def __init__(self, 
                  pst1_position: TranslationVector = None,
                  pst2_position: TranslationVector = None,
@@ -104,9 +137,10 @@ class StartRegistrationRequest(MessageBase):
         self.pst2_position = pst2_position or TranslationVector()
         self.pst3_position = pst3_position or TranslationVector()
 
-@dataclass
 class StartRegistrationResponse(MessageBase):
     """Response for start registration"""
+    __slots__ = ('success', 'error_message')
+
     def __init__(self, 
                  success: bool = False, 
                  error_message: str = ''):
@@ -114,15 +148,17 @@ class StartRegistrationResponse(MessageBase):
         self.success = success
         self.error_message = error_message
 
-@dataclass
 class StopRegistrationRequest(MessageBase):
     """Request to stop registration"""
+    __slots__ = ()
+
     def __init__(self):
         super().__init__(MessageTypes.STOP_REGISTRATION_REQUEST)
 
-@dataclass
 class StopRegistrationResponse(MessageBase):
     """Response for stop registration"""
+    __slots__ = ('success', 'error_message')
+
     def __init__(self, 
                  success: bool = False, 
                  error_message: str = ''):
@@ -130,9 +166,10 @@ class StopRegistrationResponse(MessageBase):
         self.success = success
         self.error_message = error_message
 
-@dataclass
 class UpdateAntennaSampleRequest(MessageBase):
     """Request to update antenna sample"""
+    __slots__ = ('pc_time', 'cgs_time', 'cgs_sample')
+
     def __init__(self, 
                  pc_time: int = 0,
                  cgs_time: CGSClock = None,
@@ -142,9 +179,11 @@ class UpdateAntennaSampleRequest(MessageBase):
         self.cgs_time = cgs_time or CGSClock()
         self.cgs_sample = cgs_sample or CGSSample()
 
-@dataclass
 class UpdateAntennaSampleResponse(MessageBase):
     """Response for updating antenna sample"""
+    __slots__ = ('pc_time', 'cgs_time', 'process_time', 'lg_ct_position', 'node_id',
+                 'lumens', 'selections')
+
     def __init__(self, 
                  pc_time: str = '',
                  cgs_time: CGSClock = None,
@@ -162,14 +201,121 @@ class UpdateAntennaSampleResponse(MessageBase):
         self.lumens = lumens or []
         self.selections = selections or []
 
+class UpdateAntennaSampleBatchRequest(MessageBase):
+    """Columnar batch of antenna samples, one entry per sample in each list"""
+    __slots__ = ('pc_times', 'cgs_times', 'cgs_samples')
+
+    def __init__(self, 
+                 pc_times: List[int] = None,
+                 cgs_times: List[CGSClock] = None,
+                 cgs_samples: List[CGSSample] = None):
+        super().__init__(MessageTypes.UPDATE_ANTENNA_SAMPLE_BATCH_REQUEST)
+        self.pc_times = pc_times or []
+        self.cgs_times = cgs_times or []
+        self.cgs_samples = cgs_samples or []
+
+    def __len__(self):
+        return len(self.pc_times)
+
+    @classmethod
+    def from_samples(cls, samples: List[UpdateAntennaSampleRequest]):
+        """Gather individual sample requests into one batch"""
+        return cls(
+            pc_times=[sample.pc_time for sample in samples],
+            cgs_times=[sample.cgs_time for sample in samples],
+            cgs_samples=[sample.cgs_sample for sample in samples]
+        )
+
+    def to_samples(self) -> List[UpdateAntennaSampleRequest]:
+        """Split the batch back into individual sample requests sharing its id"""
+        samples = []
+        for pc_time, cgs_time, cgs_sample in zip(self.pc_times, self.cgs_times, self.cgs_samples):
+            # Skip __init__, which would draw a fresh uuid per sample
+            sample = UpdateAntennaSampleRequest.__new__(UpdateAntennaSampleRequest)
+            sample.id = self.id
+            sample.type = MessageTypes.UPDATE_ANTENNA_SAMPLE_REQUEST
+            sample.pc_time = pc_time
+            sample.cgs_time = cgs_time
+            sample.cgs_sample = cgs_sample
+            samples.append(sample)
+        return samples
+
+class UpdateAntennaSampleBatchResponse(MessageBase):
+    """Columnar batch of antenna sample results, in request order"""
+    __slots__ = ('pc_times', 'cgs_times', 'process_times', 'lg_ct_positions', 'node_ids',
+                 'lumens', 'selections')
+
+    def __init__(self, 
+                 pc_times: List[int] = None,
+                 cgs_times: List[CGSClock] = None,
+                 process_times: List[float] = None,
+                 lg_ct_positions: List[List[List[float]]] = None,
+                 node_ids: List[int] = None,
+                 lumens: List[List[Lumen]] = None,
+                 selections: List[List[Lumen]] = None):
+        super().__init__(MessageTypes.UPDATE_ANTENNA_SAMPLE_BATCH_RESPONSE)
+        self.pc_times = pc_times or []
+        self.cgs_times = cgs_times or []
+        self.process_times = process_times or []
+        self.lg_ct_positions = lg_ct_positions or []
+        self.node_ids = node_ids or []
+        self.lumens = lumens or []
+        self.selections = selections or []
+
+    def __len__(self):
+        return len(self.pc_times)
+
+    @classmethod
+    def from_responses(cls, responses: List[UpdateAntennaSampleResponse]):
+        """Gather individual sample responses into one batch"""
+        return cls(
+            pc_times=[response.pc_time for response in responses],
+            cgs_times=[response.cgs_time for response in responses],
+            process_times=[response.process_time for response in responses],
+            lg_ct_positions=[response.lg_ct_position for response in responses],
+            node_ids=[response.node_id for response in responses],
+            lumens=[response.lumens for response in responses],
+            selections=[response.selections for response in responses]
+        )
+
+class VideoFrame(MessageBase):
+    """An encoded video frame, streamed to algorithms that cannot map the frame ring.
+
+    Key frames are encoded on their own. Other frames hold the difference
+    to the key frame `base_frame_id` and are only decodable once it has
+    arrived. Frames get no response.
+    """
+    __slots__ = ('frame_id', 'timestamp_ns', 'width', 'height', 'channels', 'encoding',
+                 'keyframe', 'base_frame_id', 'data')
+
+    def __init__(self,
+                 frame_id: int = 0,
+                 timestamp_ns: int = 0,
+                 width: int = 0,
+                 height: int = 0,
+                 channels: int = 3,
+                 encoding: str = '',
+                 keyframe: bool = True,
+                 base_frame_id: int = -1,
+                 data: bytes = b''):
+        super().__init__(MessageTypes.VIDEO_FRAME)
+        self.frame_id = frame_id
+        self.timestamp_ns = timestamp_ns
+        self.width = width
+        self.height = height
+        self.channels = channels
+        self.encoding = encoding
+        self.keyframe = keyframe
+        self.base_frame_id = base_frame_id
+        self.data = data
+
 # Example usage in the communication service
-async def example_message_handlers(comm_service: CommunicationService):
+async def example_message_handlers(comm_service: 'CommunicationService'):
     """Example of registering handlers for different message types"""
     
-    # Handler for Load Planning Data Request
-    async def handle_load_planning_data(message):
+    # Handler for Load Planning Data Request; handlers receive typed messages
+    async def handle_load_planning_data(request: LoadPlanningDataRequest):
         # Process the request and return a response
-        request = LoadPlanningDataRequest(**message)
         response = LoadPlanningDataResponse(
             success=True, 
             error_message=""
@@ -177,8 +323,7 @@ async def example_message_handlers(comm_service: CommunicationService):
         return response.to_dict()
     
     # Handler for Start Registration Request
-    async def handle_start_registration(message):
-        request = StartRegistrationRequest(**message)
+    async def handle_start_registration(request: StartRegistrationRequest):
         response = StartRegistrationResponse(
             success=True, 
             error_message=""
@@ -197,6 +342,8 @@ async def example_message_handlers(comm_service: CommunicationService):
 
 # Demonstration of sending and receiving messages
 async def demonstration():
+    from comm.comm_service import CommunicationService
+
     # Create communication service
     comm_service = CommunicationService(host='localhost', port=8000)
     
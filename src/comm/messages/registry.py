@@ -0,0 +1,128 @@
+import typing
+from typing import Any, Dict, Union
+
+from comm.messages.message_base import (CodecNegotiationRequest, CodecNegotiationResponse,
+                                        InitContinuesRegistrationRequest,
+                                        InitContinuesRegistrationResponse, MessageBase,
+                                        to_serializable)
+from comm.messages.messages import (LoadPlanningDataRequest, LoadPlanningDataResponse,
+                                    StartRegistrationRequest, StartRegistrationResponse,
+                                    StopRegistrationRequest, StopRegistrationResponse,
+                                    UpdateAntennaSampleBatchRequest,
+                                    UpdateAntennaSampleBatchResponse, UpdateAntennaSampleRequest,
+                                    UpdateAntennaSampleResponse, VideoFrame)
+
+# Message type -> message class
+MESSAGE_CLASSES: Dict[str, type] = {}
+
+# Values of these types can be shared between messages as field defaults
+_IMMUTABLE_DEFAULTS = (int, float, str, bool, bytes, tuple, type(None))
+# Fields annotated with these go to JSON as they are
+_PLAIN_TYPES = (int, float, str, bool)
+
+
+def _nested_to_dict(value):
+    try:
+        return value.to_dict()
+    except AttributeError:
+        return to_serializable(value)
+
+
+def _decode_expression(annotation, value: str, namespace: dict, depth: int = 0) -> str:
+    """Python expression rebuilding `value` as `annotation` from its JSON form"""
+    if typing.get_origin(annotation) is list:
+        (item_type,) = typing.get_args(annotation) or (Any,)
+        item = f'item{depth}'
+        expression = _decode_expression(item_type, item, namespace, depth + 1)
+        return value if expression == item else f'[{expression} for {item} in {value}]'
+    if isinstance(annotation, type) and hasattr(annotation, 'from_dict'):
+        name = f'{annotation.__name__}_from_dict'
+        namespace[name] = annotation.from_dict
+        return f'{name}({value})'
+    return value
+
+
+def _encode_expression(annotation, value: str, depth: int = 0) -> str:
+    """Python expression turning `value` of type `annotation` into JSON compatible data"""
+    if typing.get_origin(annotation) is list:
+        (item_type,) = typing.get_args(annotation) or (Any,)
+        item = f'item{depth}'
+        expression = _encode_expression(item_type, item, depth + 1)
+        return value if expression == item else f'[{expression} for {item} in {value}]'
+    if annotation in _PLAIN_TYPES:
+        return value
+    if isinstance(annotation, type) and hasattr(annotation, 'to_dict'):
+        return f'_nested_to_dict({value})'
+    return f'to_serializable({value})'
+
+
+def compile_codec(cls) -> tuple:
+    """Generate a to_dict method and a from_dict function for a message class.
+
+    Field types come from the annotations of the class's __init__ and
+    defaults from an instance built with no arguments, so the generated
+    code rebuilds nested vectors, clocks, samples and lumens without any
+    per-field inspection at run time.
+    """
+    prototype = cls()
+    hints = typing.get_type_hints(cls.__init__)
+    fields = [name for name in cls._fields if name not in MessageBase._fields]
+    namespace = {'cls': cls, 'new': cls.__new__, 'MISSING': object(),
+                 'to_serializable': to_serializable, '_nested_to_dict': _nested_to_dict}
+
+    decode_lines = ['def from_dict(data):',
+                    '    message = new(cls)',
+                    "    message.id = data.get('id')",
+                    f"    message.type = data.get('type', {prototype.type!r})"]
+    encode_items = ["'id': self.id", "'type': self.type"]
+    for index, name in enumerate(fields):
+        annotation = hints.get(name, Any)
+        default = getattr(prototype, name)
+        if isinstance(default, _IMMUTABLE_DEFAULTS):
+            namespace[f'default{index}'] = default
+            default_expression = f'default{index}'
+        else:
+            # Lists, clocks and vectors need a fresh instance per message
+            namespace[f'factory{index}'] = type(default)
+            default_expression = f'factory{index}()'
+        decoded = _decode_expression(annotation, 'value', namespace)
+        # Like the constructors, nested fields sent as null get their default
+        missing = 'value is MISSING' if decoded == 'value' else 'value is MISSING or value is None'
+        decode_lines += [f'    value = data.get({name!r}, MISSING)',
+                         f'    message.{name} = {default_expression} if {missing} else {decoded}']
+        encode_items.append(f"{name!r}: {_encode_expression(annotation, f'self.{name}')}")
+    decode_lines.append('    return message')
+    encode_lines = ['def to_dict(self):', f"    return {{{', '.join(encode_items)}}}"]
+
+    exec('\n'.join(decode_lines), namespace)
+    exec('\n'.join(encode_lines), namespace)
+    return namespace['to_dict'], namespace['from_dict']
+
+
+def register_message(cls) -> type:
+    """Register a message class under its message type, compiling its codec"""
+    to_dict, from_dict = compile_codec(cls)
+    cls.to_dict = to_dict
+    cls.from_dict = staticmethod(from_dict)
+    MESSAGE_CLASSES[cls().type] = cls
+    return cls
+
+
+def message_class(message_type: str) -> type:
+    return MESSAGE_CLASSES.get(message_type)
+
+
+def decode_dict(data: Dict[str, Any]) -> Union[MessageBase, Dict[str, Any]]:
+    """Typed message for a decoded JSON dict, or the dict itself if its type is unknown"""
+    cls = MESSAGE_CLASSES.get(data.get('type'))
+    return cls.from_dict(data) if cls is not None else data
+
+
+for _cls in (InitContinuesRegistrationRequest, InitContinuesRegistrationResponse,
+             CodecNegotiationRequest, CodecNegotiationResponse,
+             LoadPlanningDataRequest, LoadPlanningDataResponse,
+             StartRegistrationRequest, StartRegistrationResponse,
+             StopRegistrationRequest, StopRegistrationResponse,
+             UpdateAntennaSampleRequest, UpdateAntennaSampleResponse,
+             UpdateAntennaSampleBatchRequest, UpdateAntennaSampleBatchResponse, VideoFrame):
+    register_message(_cls)
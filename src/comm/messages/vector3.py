@@ -1,5 +1,7 @@
 class Vector3:
     """Simple 3D Vector representation"""
+    __slots__ = ('x', 'y', 'z')
+
     def __init__(self, x: float = 0, y: float = 0, z: float = 0):
         self.x = x
         self.y = y
@@ -8,3 +10,6 @@ class Vector3:
     def to_dict(self):
         return {"x": self.x, "y": self.y, "z": self.z}
 
+    @classmethod
+    def from_dict(cls, data: dict):
+        return cls(data.get("x", 0), data.get("y", 0), data.get("z", 0))
@@ -0,0 +1,248 @@
+import asyncio
+import csv
+import logging
+import os
+import time
+from typing import Dict, List
+
+# Histograms keep 2**SUB_BUCKET_BITS linear sub-buckets per power of two,
+# which bounds the relative error of any reported value to about 3%.
+SUB_BUCKET_BITS = 5
+SUB_BUCKET_COUNT = 1 << SUB_BUCKET_BITS
+HALF_SUB_BUCKET_COUNT = SUB_BUCKET_COUNT // 2
+DEFAULT_MAX_VALUE_US = 600 * 1_000_000
+
+# The algorithm reports process_time in milliseconds
+PROCESS_TIME_UNIT_US = 1000.0
+
+SUMMARY_PERCENTILES = (50.0, 99.0, 99.9)
+CSV_FIELDS = ['time', 'message_type', 'requests', 'responses', 'failures', 'in_flight',
+              'bytes_out', 'bytes_in', 'round_trip_p50_us', 'round_trip_p99_us',
+              'round_trip_p999_us', 'handler_p50_us', 'handler_p99_us', 'handler_p999_us',
+              'process_time_p50_us', 'process_time_p99_us', 'process_time_p999_us']
+
+
+class LatencyHistogram:
+    """Log-linear latency histogram in the style of HdrHistogram.
+
+    Values are integer microseconds. Recording is a handful of integer
+    operations and memory use is fixed, so it is cheap enough to run on
+    every message.
+    """
+    def __init__(self, max_value_us: int = DEFAULT_MAX_VALUE_US):
+        self.max_value_us = max_value_us
+        self.counts = [0] * (self._index(max_value_us) + 1)
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    @staticmethod
+    def _index(value: int) -> int:
+        if value < SUB_BUCKET_COUNT:
+            return value
+        shift = value.bit_length() - SUB_BUCKET_BITS
+        return SUB_BUCKET_COUNT + (shift - 1) * HALF_SUB_BUCKET_COUNT + \
+            (value >> shift) - HALF_SUB_BUCKET_COUNT
+
+    @staticmethod
+    def _value(index: int) -> int:
+        """Midpoint of the values that fall into a bucket"""
+        if index < SUB_BUCKET_COUNT:
+            return index
+        shift, offset = divmod(index - SUB_BUCKET_COUNT, HALF_SUB_BUCKET_COUNT)
+        shift += 1
+        lower = (offset + HALF_SUB_BUCKET_COUNT) << shift
+        return lower + (1 << shift) // 2
+
+    def record(self, value_us: float):
+        value = min(max(int(value_us), 0), self.max_value_us)
+        self.counts[self._index(value)] += 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def percentile(self, percentile: float) -> float:
+        """Value below which the given percentage of recorded values fall"""
+        if not self.count:
+            return 0.0
+        target = max(1, int(round(self.count * percentile / 100.0)))
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= target:
+                return float(min(self._value(index), self.max))
+        return float(self.max)
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def reset(self):
+        self.counts = [0] * len(self.counts)
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def snapshot(self) -> dict:
+        snapshot = {'count': self.count, 'min': self.min or 0, 'max': self.max or 0,
+                    'mean': self.mean}
+        for percentile in SUMMARY_PERCENTILES:
+            snapshot[f'p{percentile:g}'.replace('.', '')] = self.percentile(percentile)
+        return snapshot
+
+
+class MessageTypeStats:
+    """Counters, gauges and latency histograms for one message type"""
+    def __init__(self):
+        self.requests = 0
+        self.responses = 0
+        self.failures = 0
+        self.in_flight = 0
+        self.bytes_out = 0
+        self.bytes_in = 0
+        self.round_trip = LatencyHistogram()
+        self.handler = LatencyHistogram()
+        self.process_time = LatencyHistogram()
+
+    def snapshot(self) -> dict:
+        return {
+            'requests': self.requests,
+            'responses': self.responses,
+            'failures': self.failures,
+            'in_flight': self.in_flight,
+            'bytes_out': self.bytes_out,
+            'bytes_in': self.bytes_in,
+            'round_trip_us': self.round_trip.snapshot(),
+            'handler_us': self.handler.snapshot(),
+            'process_time_us': self.process_time.snapshot(),
+        }
+
+
+class CommMetrics:
+    """Per message type metrics collected by CommunicationService.
+
+    Client side requests are counted under the request type, with their
+    round trip time; messages handled on the server side are counted
+    under their own type, with the handler duration. The algorithm's own
+    process_time is recorded under the response type that carried it.
+    """
+    def __init__(self):
+        self.types: Dict[str, MessageTypeStats] = {}
+        self.started = time.monotonic()
+
+    def stats(self, message_type: str) -> MessageTypeStats:
+        stats = self.types.get(message_type)
+        if stats is None:
+            stats = self.types[message_type] = MessageTypeStats()
+        return stats
+
+    def request_sent(self, message_type: str, size: int):
+        stats = self.stats(message_type)
+        stats.requests += 1
+        stats.in_flight += 1
+        stats.bytes_out += size
+
+    def request_completed(self, message_type: str, round_trip: float, success: bool):
+        """Close out a request; round_trip is in seconds"""
+        stats = self.stats(message_type)
+        stats.in_flight -= 1
+        if success:
+            stats.responses += 1
+            stats.round_trip.record(round_trip * 1e6)
+        else:
+            stats.failures += 1
+
+    def message_received(self, message_type: str, size: int):
+        self.stats(message_type).bytes_in += size
+
+    def message_sent(self, message_type: str, size: int):
+        self.stats(message_type).bytes_out += size
+
+    def handler_completed(self, message_type: str, duration: float):
+        """Record how long a handler took; duration is in seconds"""
+        self.stats(message_type).handler.record(duration * 1e6)
+
+    def process_time_reported(self, message_type: str, process_time: float):
+        """Record a process_time reported by the algorithm"""
+        self.stats(message_type).process_time.record(process_time * PROCESS_TIME_UNIT_US)
+
+    @property
+    def in_flight(self) -> int:
+        return sum(stats.in_flight for stats in self.types.values())
+
+    def snapshot(self) -> dict:
+        """Point in time copy of all metrics, keyed by message type"""
+        return {
+            'uptime': time.monotonic() - self.started,
+            'types': {message_type: stats.snapshot()
+                      for message_type, stats in self.types.items()},
+        }
+
+    def reset(self):
+        self.types = {}
+        self.started = time.monotonic()
+
+
+class MetricsReporter:
+    """Periodically logs a metrics summary and appends it to a CSV file"""
+    def __init__(self, metrics: CommMetrics, interval: float = 10.0, csv_path: str = None):
+        self.metrics = metrics
+        self.interval = interval
+        self.csv_path = csv_path
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self._task = None
+
+    def start(self) -> asyncio.Task:
+        self._task = asyncio.ensure_future(self._run())
+        return self._task
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            self.report()
+
+    def rows(self) -> List[dict]:
+        """One CSV row per message type"""
+        now = time.time()
+        rows = []
+        for message_type, stats in self.metrics.types.items():
+            row = {'time': f'{now:.3f}', 'message_type': message_type,
+                   'requests': stats.requests, 'responses': stats.responses,
+                   'failures': stats.failures, 'in_flight': stats.in_flight,
+                   'bytes_out': stats.bytes_out, 'bytes_in': stats.bytes_in}
+            for name, histogram in (('round_trip', stats.round_trip),
+                                    ('handler', stats.handler),
+                                    ('process_time', stats.process_time)):
+                row[f'{name}_p50_us'] = histogram.percentile(50.0)
+                row[f'{name}_p99_us'] = histogram.percentile(99.0)
+                row[f'{name}_p999_us'] = histogram.percentile(99.9)
+            rows.append(row)
+        return rows
+
+    def report(self):
+        rows = self.rows()
+        for row in rows:
+            self.logger.info(
+                f"{row['message_type']}: {row['requests']} req, {row['responses']} resp, "
+                f"{row['failures']} failed, {row['in_flight']} in flight, "
+                f"rtt p50/p99/p999 {row['round_trip_p50_us']:.0f}/"
+                f"{row['round_trip_p99_us']:.0f}/{row['round_trip_p999_us']:.0f} us, "
+                f"handler p99 {row['handler_p99_us']:.0f} us, "
+                f"process_time p99 {row['process_time_p99_us']:.0f} us")
+        if self.csv_path and rows:
+            write_header = not os.path.exists(self.csv_path)
+            with open(self.csv_path, 'a', newline='') as csv_file:
+                writer = csv.DictWriter(csv_file, fieldnames=CSV_FIELDS)
+                if write_header:
+                    writer.writeheader()
+                writer.writerows(rows)
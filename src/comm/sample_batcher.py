@@ -0,0 +1,132 @@
+import asyncio
+import logging
+from typing import Any, Dict, List, Tuple
+
+from comm.messages.messages import (MessageTypes, UpdateAntennaSampleBatchRequest,
+                                    UpdateAntennaSampleRequest)
+
+DEFAULT_MAX_BATCH_SIZE = 64
+DEFAULT_MAX_LINGER = 0.005
+
+# Columns of a batch response and the per-sample field each one fills
+RESPONSE_COLUMNS = (
+    ('pc_times', 'pc_time'),
+    ('cgs_times', 'cgs_time'),
+    ('process_times', 'process_time'),
+    ('lg_ct_positions', 'lg_ct_position'),
+    ('node_ids', 'node_id'),
+    ('lumens', 'lumens'),
+    ('selections', 'selections'),
+)
+REQUEST_COLUMNS = (
+    ('pc_times', 'pc_time'),
+    ('cgs_times', 'cgs_time'),
+    ('cgs_samples', 'cgs_sample'),
+)
+
+
+def split_batch(batch: Dict[str, Any], columns, message_type: str, msg_id=None) -> List[Dict[str, Any]]:
+    """Split a columnar batch dict into one dict per sample"""
+    count = len(batch.get(columns[0][0], []))
+    samples = []
+    for index in range(count):
+        sample = {'id': msg_id, 'type': message_type}
+        for column, field in columns:
+            values = batch.get(column)
+            sample[field] = values[index] if values else None
+        samples.append(sample)
+    return samples
+
+
+def split_batch_response(batch: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Split a batch response dict into per-sample response dicts"""
+    return split_batch(batch, RESPONSE_COLUMNS,
+                       MessageTypes.UPDATE_ANTENNA_SAMPLE_RESPONSE, batch.get('id'))
+
+
+def split_batch_request(batch: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Split a batch request dict into per-sample request dicts"""
+    return split_batch(batch, REQUEST_COLUMNS,
+                       MessageTypes.UPDATE_ANTENNA_SAMPLE_REQUEST, batch.get('id'))
+
+
+class SampleBatcher:
+    """Coalesces individually submitted antenna samples into batch requests.
+
+    A batch is sent as soon as it holds max_batch_size samples, or
+    max_linger seconds after its first sample arrived, whichever is first.
+    Every sample gets its own future that resolves to its slice of the
+    batch response.
+    """
+    def __init__(self, comm_service, max_batch_size: int = DEFAULT_MAX_BATCH_SIZE,
+                 max_linger: float = DEFAULT_MAX_LINGER):
+        self.comm_service = comm_service
+        self.max_batch_size = max_batch_size
+        self.max_linger = max_linger
+        self._pending: List[Tuple[UpdateAntennaSampleRequest, asyncio.Future]] = []
+        self._linger_handle = None
+        self._send_tasks = set()
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+    async def submit(self, request: UpdateAntennaSampleRequest) -> asyncio.Future:
+        """Queue a sample and return a future for its response.
+
+        Filling a batch sends it right away, so this waits for the in-flight
+        window just as CommunicationService.submit does.
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((request, future))
+        if len(self._pending) >= self.max_batch_size:
+            await self.flush()
+        elif self._linger_handle is None:
+            self._linger_handle = asyncio.get_running_loop().call_later(
+                self.max_linger, self._flush_later)
+        return future
+
+    def _flush_later(self):
+        self._linger_handle = None
+        task = asyncio.ensure_future(self.flush())
+        self._send_tasks.add(task)
+        task.add_done_callback(self._send_tasks.discard)
+
+    async def flush(self):
+        """Send whatever is queued as one batch"""
+        if self._linger_handle is not None:
+            self._linger_handle.cancel()
+            self._linger_handle = None
+        if not self._pending:
+            return
+        samples, self._pending = self._pending, []
+
+        batch = UpdateAntennaSampleBatchRequest.from_samples([request for request, _ in samples])
+        futures = [future for _, future in samples]
+        try:
+            batch_future = await self.comm_service.submit(batch)
+        except Exception as e:
+            for future in futures:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        batch_future.add_done_callback(lambda done: self._resolve(done, samples))
+
+    def _resolve(self, batch_future: asyncio.Future, samples):
+        """Hand each sample its slice of the batch response"""
+        if batch_future.cancelled() or batch_future.exception() is not None:
+            error = asyncio.CancelledError() if batch_future.cancelled() else batch_future.exception()
+            for _, future in samples:
+                if not future.done():
+                    future.set_exception(error)
+            return
+
+        responses = split_batch_response(batch_future.result())
+        if len(responses) != len(samples):
+            self.logger.error(f"Batch response holds {len(responses)} samples, "
+                              f"expected {len(samples)}")
+        for index, (request, future) in enumerate(samples):
+            if future.done():
+                continue
+            if index < len(responses):
+                responses[index]['id'] = request.id
+                future.set_result(responses[index])
+            else:
+                future.set_exception(ValueError("Sample missing from batch response"))
@@ -0,0 +1,202 @@
+import asyncio
+import collections
+import logging
+import time
+from typing import Callable, Dict, List
+
+from comm.messages.messages import CGSSample, UpdateAntennaSampleRequest
+from comm.metrics import LatencyHistogram
+
+DEFAULT_STREAM = 'antenna'
+DEFAULT_MAX_QUEUED = 1
+DEFAULT_STREAM_IN_FLIGHT = 1
+
+# What a full stream queue does with a new sample
+OVERLOAD_LATEST = 'latest'  # the newest sample replaces the oldest queued one
+OVERLOAD_OLDEST = 'oldest'  # queued samples are kept and the new one is dropped
+OVERLOAD_MERGE = 'merge'    # queued samples are folded into the new one
+OVERLOAD_POLICIES = (OVERLOAD_LATEST, OVERLOAD_OLDEST, OVERLOAD_MERGE)
+
+
+class SampleDropped(Exception):
+    """A sample was discarded by the overload policy before it was sent"""
+
+
+def merge_samples(samples: List[UpdateAntennaSampleRequest]) -> UpdateAntennaSampleRequest:
+    """Default merge rule: the newest sample, with fields it lacks taken from older ones.
+
+    Samples are given oldest first.
+    """
+    newest = samples[-1]
+    data = {}
+    for sample in samples:
+        data.update(sample.cgs_sample.data)
+    return UpdateAntennaSampleRequest(newest.pc_time, newest.cgs_time, CGSSample(data))
+
+
+class _QueuedSample:
+    __slots__ = ('request', 'futures', 'queued_at')
+
+    def __init__(self, request, futures: List[asyncio.Future], queued_at: float):
+        self.request = request
+        self.futures = futures
+        self.queued_at = queued_at
+
+
+class SampleStream:
+    """Queue, in-flight count and overload counters of one stream of samples"""
+    def __init__(self, name: str):
+        self.name = name
+        self.queue = collections.deque()
+        self.in_flight = 0
+        self.submitted = 0
+        self.sent = 0
+        self.answered = 0
+        self.failed = 0
+        self.dropped = 0
+        self.merged = 0
+        self.expired = 0
+        # From submission to response, including time spent queued
+        self.latency = LatencyHistogram()
+
+    def snapshot(self) -> dict:
+        return {'submitted': self.submitted, 'sent': self.sent, 'answered': self.answered,
+                'failed': self.failed, 'dropped': self.dropped, 'merged': self.merged,
+                'expired': self.expired, 'queued': len(self.queue),
+                'in_flight': self.in_flight, 'latency_us': self.latency.snapshot()}
+
+
+class SampleCoalescer:
+    """Keeps sample streams current when the algorithm cannot keep up.
+
+    Each stream sends at most max_in_flight samples at a time and queues
+    at most max_queued more. When the queue is full the overload policy
+    decides what goes: by default the newest sample replaces the oldest
+    queued one, so responses describe recent positions instead of a
+    backlog. Samples queued longer than max_age seconds are dropped as
+    well. Dropped samples fail with SampleDropped; samples merged into a
+    newer one resolve to that sample's response. Latency from submission
+    to response is therefore bounded by the queue, not the offered rate.
+    """
+    def __init__(self, comm_service, max_queued: int = DEFAULT_MAX_QUEUED,
+                 max_in_flight: int = DEFAULT_STREAM_IN_FLIGHT,
+                 policy: str = OVERLOAD_LATEST,
+                 merge: Callable[[List[UpdateAntennaSampleRequest]],
+                                 UpdateAntennaSampleRequest] = merge_samples,
+                 max_age: float = None):
+        if policy not in OVERLOAD_POLICIES:
+            raise ValueError(f"Unknown overload policy '{policy}'")
+        if max_queued < 1 or max_in_flight < 1:
+            raise ValueError("Streams need room for at least one queued and one sent sample")
+        self.comm_service = comm_service
+        self.max_queued = max_queued
+        self.max_in_flight = max_in_flight
+        self.policy = policy
+        self.merge = merge
+        self.max_age = max_age
+        self.streams: Dict[str, SampleStream] = {}
+        self._send_tasks = set()
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+    def stream(self, name: str = DEFAULT_STREAM) -> SampleStream:
+        stream = self.streams.get(name)
+        if stream is None:
+            stream = self.streams[name] = SampleStream(name)
+        return stream
+
+    def submit(self, request: UpdateAntennaSampleRequest,
+               stream: str = DEFAULT_STREAM) -> asyncio.Future:
+        """Queue a sample and return a future for its response; never waits"""
+        sample_stream = self.stream(stream)
+        sample_stream.submitted += 1
+        future = asyncio.get_running_loop().create_future()
+        queued = _QueuedSample(request, [future], time.perf_counter())
+        self._expire(sample_stream, queued.queued_at)
+
+        queue = sample_stream.queue
+        if len(queue) >= self.max_queued:
+            if self.policy == OVERLOAD_OLDEST:
+                sample_stream.dropped += 1
+                future.set_exception(SampleDropped(f"Stream '{stream}' is full"))
+                return future
+            if self.policy == OVERLOAD_MERGE:
+                # Everything queued becomes part of the new sample
+                merged = list(queue) + [queued]
+                queue.clear()
+                sample_stream.merged += len(merged) - 1
+                queued = _QueuedSample(self.merge([item.request for item in merged]),
+                                       [pending for item in merged for pending in item.futures],
+                                       merged[0].queued_at)
+            else:
+                while len(queue) >= self.max_queued:
+                    superseded = queue.popleft()
+                    sample_stream.dropped += len(superseded.futures)
+                    self._drop(superseded, "Superseded by a newer sample")
+        queue.append(queued)
+        self._pump(sample_stream)
+        return future
+
+    @staticmethod
+    def _drop(queued: _QueuedSample, reason: str):
+        for future in queued.futures:
+            if not future.done():
+                future.set_exception(SampleDropped(reason))
+
+    def _expire(self, stream: SampleStream, now: float):
+        """Drop queued samples that have waited longer than max_age"""
+        if self.max_age is None:
+            return
+        queue = stream.queue
+        while queue and now - queue[0].queued_at > self.max_age:
+            stream.expired += len(queue[0].futures)
+            self._drop(queue.popleft(), f"Queued for more than {self.max_age} s")
+
+    def _pump(self, stream: SampleStream):
+        """Send queued samples while the stream has room in flight"""
+        self._expire(stream, time.perf_counter())
+        while stream.queue and stream.in_flight < self.max_in_flight:
+            queued = stream.queue.popleft()
+            stream.in_flight += 1
+            task = asyncio.ensure_future(self._send(stream, queued))
+            self._send_tasks.add(task)
+            task.add_done_callback(self._send_tasks.discard)
+
+    async def _send(self, stream: SampleStream, queued: _QueuedSample):
+        try:
+            batcher = self.comm_service.sample_batcher
+            if batcher is not None:
+                response_future = await batcher.submit(queued.request)
+            else:
+                response_future = await self.comm_service.submit(queued.request)
+            stream.sent += 1
+            response = await response_future
+        except asyncio.CancelledError:
+            for future in queued.futures:
+                future.cancel()
+            raise
+        except Exception as e:
+            stream.failed += len(queued.futures)
+            for future in queued.futures:
+                if not future.done():
+                    future.set_exception(e)
+        else:
+            stream.answered += 1
+            stream.latency.record((time.perf_counter() - queued.queued_at) * 1e6)
+            for future in queued.futures:
+                if not future.done():
+                    future.set_result(response)
+        finally:
+            stream.in_flight -= 1
+            self._pump(stream)
+
+    def stats(self) -> Dict[str, dict]:
+        return {name: stream.snapshot() for name, stream in self.streams.items()}
+
+    def close(self):
+        """Cancel queued and in-flight samples"""
+        for stream in self.streams.values():
+            while stream.queue:
+                for future in stream.queue.popleft().futures:
+                    future.cancel()
+        for task in list(self._send_tasks):
+            task.cancel()
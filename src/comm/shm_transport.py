@@ -0,0 +1,483 @@
+import asyncio
+import json
+import os
+import socket
+import sys
+import tempfile
+import time
+import uuid
+from collections import deque
+from multiprocessing import resource_tracker, shared_memory
+from typing import Awaitable, Callable, List, Optional
+
+from video.frame_ring import attach_shared_memory
+
+TCP_TRANSPORT = 'tcp'
+SHM_TRANSPORT = 'shm'
+TRANSPORTS = (TCP_TRANSPORT, SHM_TRANSPORT)
+
+# Shared memory layout of a MessageRing, all headers are int64 words:
+#   header   HEADER_WORDS, head and tail on their own cache lines
+#   data     capacity bytes, a power of two
+RING_MAGIC = 0x474E49524753  # 'SGRING'
+HEADER_WORDS = 32
+HDR_MAGIC = 0
+HDR_CAPACITY = 1
+HDR_HEAD = 8
+HDR_TAIL = 16
+HDR_WAITING = 24
+
+DEFAULT_RING_CAPACITY = 4 * 1024 * 1024
+# A writer whose ring is full polls for room at this interval
+SPACE_POLL_INTERVAL = 0.0005
+# A reader with nothing to read keeps yielding to the event loop and
+# looking at its ring this long before it sleeps on its doorbell. On a
+# single core that only keeps the peer from running.
+DEFAULT_SPIN = 0.0001 if (os.cpu_count() or 1) > 1 else 0.0
+# A sleeping reader looks at its ring this often even without a wakeup,
+# which bounds the cost of a wakeup lost to store reordering
+IDLE_RECHECK_INTERVAL = 0.05
+HANDSHAKE_SIZE = 4096
+ACK = b'\x01'
+WAKEUP = (1).to_bytes(8, sys.byteorder)
+
+
+def channel_for_port(port: int) -> str:
+    """Default channel name of a service, so the TCP port doubles as its address"""
+    return f'algo_sim_{port}'
+
+
+def socket_path(channel: str) -> str:
+    """Unix socket a channel's server accepts connections on"""
+    return os.path.join(tempfile.gettempdir(), f'{channel}.sock')
+
+
+def _doorbell():
+    """Read and write descriptors of a wakeup channel: an eventfd, or a pipe where there is none"""
+    if hasattr(os, 'eventfd'):
+        fd = os.eventfd(0, os.EFD_NONBLOCK | os.EFD_CLOEXEC)
+        return fd, fd
+    read_fd, write_fd = os.pipe()
+    os.set_blocking(read_fd, False)
+    os.set_blocking(write_fd, False)
+    return read_fd, write_fd
+
+
+def _close_fds(*fds):
+    for fd in set(fds):
+        try:
+            os.close(fd)
+        except OSError:
+            pass
+
+
+class MessageRing:
+    """Single producer, single consumer byte ring in shared memory.
+
+    The producer only ever advances the tail and the consumer the head;
+    both are free running byte counts, so the ring is empty when they are
+    equal and full when they are `capacity` apart. Neither side takes a
+    lock. A consumer about to sleep sets the waiting word, and the
+    producer rings the consumer's doorbell only when it finds it set, so
+    a busy connection makes no wakeup syscalls at all.
+    """
+    def __init__(self, shm: shared_memory.SharedMemory):
+        self.shm = shm
+        self.name = shm.name
+        self._header = shm.buf[:HEADER_WORDS * 8].cast('q')
+        if self._header[HDR_MAGIC] != RING_MAGIC:
+            self._header.release()
+            raise ValueError(f"{shm.name} is not a message ring")
+        self.capacity = self._header[HDR_CAPACITY]
+        self._data = shm.buf[HEADER_WORDS * 8:HEADER_WORDS * 8 + self.capacity]
+
+    @classmethod
+    def create(cls, name: str, capacity: int = DEFAULT_RING_CAPACITY) -> 'MessageRing':
+        if capacity & (capacity - 1):
+            raise ValueError(f"Ring capacity must be a power of two, not {capacity}")
+        shm = shared_memory.SharedMemory(name=name, create=True, size=HEADER_WORDS * 8 + capacity)
+        header = shm.buf[:HEADER_WORDS * 8].cast('q')
+        header[HDR_CAPACITY] = capacity
+        header[HDR_MAGIC] = RING_MAGIC
+        header.release()
+        # Both peers map the ring and may share a resource tracker, so
+        # neither registers it; the creator unlinks it once both have it
+        resource_tracker.unregister(shm._name, 'shared_memory')
+        return cls(shm)
+
+    @classmethod
+    def attach(cls, name: str) -> 'MessageRing':
+        return cls(attach_shared_memory(name))
+
+    @property
+    def readable(self) -> int:
+        return self._header[HDR_TAIL] - self._header[HDR_HEAD]
+
+    @property
+    def waiting(self) -> bool:
+        return self._header[HDR_WAITING] != 0
+
+    @waiting.setter
+    def waiting(self, waiting: bool):
+        self._header[HDR_WAITING] = 1 if waiting else 0
+
+    def write(self, data) -> int:
+        """Copy as much of data into the ring as fits, returning the byte count"""
+        tail = self._header[HDR_TAIL]
+        count = min(len(data), self.capacity - (tail - self._header[HDR_HEAD]))
+        if count <= 0:
+            return 0
+        start = tail & (self.capacity - 1)
+        first = min(count, self.capacity - start)
+        self._data[start:start + first] = data[:first]
+        if first < count:
+            self._data[:count - first] = data[first:count]
+        # Publish only once the bytes are in place
+        self._header[HDR_TAIL] = tail + count
+        return count
+
+    def read(self, size: int) -> bytes:
+        """Copy out and consume up to size bytes"""
+        head = self._header[HDR_HEAD]
+        count = min(size, self._header[HDR_TAIL] - head)
+        if count <= 0:
+            return b''
+        start = head & (self.capacity - 1)
+        first = min(count, self.capacity - start)
+        if first == count:
+            data = bytes(self._data[start:start + count])
+        else:
+            data = bytes(self._data[start:]) + bytes(self._data[:count - first])
+        self._header[HDR_HEAD] = head + count
+        return data
+
+    def unlink(self):
+        # unlink() unregisters the segment again, so it has to be registered first
+        resource_tracker.register(self.shm._name, 'shared_memory')
+        self.shm.unlink()
+
+    def close(self):
+        if self._header is not None:
+            self._header.release()
+            self._data.release()
+            self._header = self._data = None
+            self.shm.close()
+
+
+class ShmConnection:
+    """Both directions of one shared memory connection.
+
+    Messages travel through two MessageRings. The Unix socket the
+    connection was set up on stays open only to tell each side when the
+    other has gone away.
+    """
+    def __init__(self, control: socket.socket, inbound: MessageRing, inbound_bell: int,
+                 outbound: MessageRing, outbound_bell: int, peer: str,
+                 spin: float = DEFAULT_SPIN):
+        self.loop = asyncio.get_running_loop()
+        self.control = control
+        self.inbound = inbound
+        self.inbound_bell = inbound_bell
+        self.outbound = outbound
+        self.outbound_bell = outbound_bell
+        self.peer = peer
+        self.spin = spin
+        self.closed = False
+        self.peer_closed = False
+        self.wakeups = 0
+        self._waiter: Optional[asyncio.Future] = None
+        self._recheck = None
+        self._pending = deque()
+        self.loop.add_reader(inbound_bell, self._on_doorbell)
+        self.loop.add_reader(control.fileno(), self._on_control)
+
+    def _wake(self):
+        if self._recheck is not None:
+            self._recheck.cancel()
+            self._recheck = None
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(None)
+
+    def _on_doorbell(self):
+        try:
+            os.read(self.inbound_bell, 64)
+        except BlockingIOError:
+            pass
+        self.wakeups += 1
+        self._wake()
+
+    def _on_control(self):
+        try:
+            data = self.control.recv(64)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            data = b''
+        if not data:
+            self.peer_closed = True
+            self.loop.remove_reader(self.control.fileno())
+            self._wake()
+
+    async def read(self, size: int = -1) -> bytes:
+        """Wait for inbound bytes; empty once the peer has closed and the ring is drained"""
+        if size < 0:
+            size = self.inbound.capacity
+        spin_until = None
+        while True:
+            if self.closed:
+                return b''
+            data = self.inbound.read(size)
+            if data:
+                return data
+            if self.peer_closed:
+                # Whatever the peer wrote before closing is in the ring already
+                return self.inbound.read(size)
+
+            # Replies from a busy peer usually come within microseconds
+            now = time.perf_counter()
+            if spin_until is None:
+                spin_until = now + self.spin
+            if now < spin_until:
+                await asyncio.sleep(0)
+                continue
+
+            self.inbound.waiting = True
+            if self.inbound.readable:
+                self.inbound.waiting = False
+                continue
+            self._waiter = self.loop.create_future()
+            self._recheck = self.loop.call_later(IDLE_RECHECK_INTERVAL, self._wake)
+            try:
+                await self._waiter
+            finally:
+                self._waiter = None
+                if not self.closed:
+                    self.inbound.waiting = False
+
+    def _ring_doorbell(self):
+        if self.outbound.waiting:
+            self.outbound.waiting = False
+            try:
+                os.write(self.outbound_bell, WAKEUP)
+            except BlockingIOError:
+                # The doorbell is already full of wakeups
+                pass
+
+    def write(self, data):
+        if self.closed or self.peer_closed:
+            raise ConnectionResetError("Shared memory connection closed")
+        if not self._pending:
+            written = self.outbound.write(data)
+            if written:
+                self._ring_doorbell()
+            if written == len(data):
+                return
+            data = data[written:]
+        self._pending.append(bytes(data))
+
+    def _flush_pending(self):
+        written = 0
+        while self._pending:
+            data = self._pending[0]
+            count = self.outbound.write(data)
+            written += count
+            if count < len(data):
+                self._pending[0] = data[count:]
+                break
+            self._pending.popleft()
+        if written:
+            self._ring_doorbell()
+
+    async def drain(self):
+        """Wait until everything written is in the ring"""
+        while self._pending:
+            if self.closed or self.peer_closed:
+                raise ConnectionResetError("Shared memory connection closed")
+            self._flush_pending()
+            if self._pending:
+                await asyncio.sleep(SPACE_POLL_INTERVAL)
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.loop.remove_reader(self.inbound_bell)
+        if not self.peer_closed:
+            self.loop.remove_reader(self.control.fileno())
+        self.control.close()
+        self._wake()
+        _close_fds(self.inbound_bell, self.outbound_bell)
+        self.inbound.close()
+        self.outbound.close()
+
+
+class ShmStreamReader:
+    """The part of asyncio.StreamReader the communication service reads frames with"""
+    def __init__(self, connection: ShmConnection):
+        self.connection = connection
+
+    async def read(self, n: int = -1) -> bytes:
+        return await self.connection.read(n)
+
+
+class ShmStreamWriter:
+    """The part of asyncio.StreamWriter the communication service writes frames with"""
+    def __init__(self, connection: ShmConnection):
+        self.connection = connection
+
+    def write(self, data):
+        self.connection.write(data)
+
+    async def drain(self):
+        await self.connection.drain()
+
+    def close(self):
+        self.connection.close()
+
+    def is_closing(self) -> bool:
+        return self.connection.closed
+
+    async def wait_closed(self):
+        pass
+
+    def get_extra_info(self, name: str, default=None):
+        if name == 'peername':
+            return self.connection.peer
+        return default
+
+
+def _streams(connection: ShmConnection):
+    return ShmStreamReader(connection), ShmStreamWriter(connection)
+
+
+async def _recv_fds(loop, sock: socket.socket, fd_count: int):
+    """recv_fds on a non-blocking socket, waiting for it to become readable"""
+    while True:
+        try:
+            return socket.recv_fds(sock, HANDSHAKE_SIZE, fd_count)
+        except BlockingIOError:
+            readable = loop.create_future()
+            loop.add_reader(sock.fileno(), readable.set_result, None)
+            try:
+                await readable
+            finally:
+                loop.remove_reader(sock.fileno())
+
+
+class ShmServer:
+    """Accepts shared memory connections on a channel, like an asyncio.Server.
+
+    Clients connect to the channel's Unix socket and hand over the names
+    of the two rings they created, with the doorbell descriptors as
+    SCM_RIGHTS ancillary data. Once the server has attached the rings the
+    client unlinks them, so nothing is left in /dev/shm when either side
+    dies.
+    """
+    def __init__(self, client_connected_cb: Callable[..., Awaitable], channel: str):
+        if not hasattr(socket, 'AF_UNIX'):
+            raise OSError("The shared memory transport needs Unix domain sockets")
+        self.client_connected_cb = client_connected_cb
+        self.channel = channel
+        self.path = socket_path(channel)
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self.listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.listener.bind(self.path)
+        self.listener.listen()
+        self.listener.setblocking(False)
+        self.sockets = [self.listener]
+        self.connections: List[ShmConnection] = []
+        self._tasks = set()
+        self._serving = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self.close()
+
+    async def serve_forever(self):
+        loop = asyncio.get_running_loop()
+        self._serving = asyncio.current_task()
+        while True:
+            sock, _ = await loop.sock_accept(self.listener)
+            task = asyncio.ensure_future(self._accept(sock))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _accept(self, sock: socket.socket):
+        loop = asyncio.get_running_loop()
+        sock.setblocking(False)
+        fds = []
+        try:
+            message, fds, _, _ = await _recv_fds(loop, sock, 2)
+            hello = json.loads(message)
+            inbound = MessageRing.attach(hello['to_server'])
+            outbound = MessageRing.attach(hello['to_client'])
+            connection = ShmConnection(sock, inbound, fds[0], outbound, fds[1],
+                                       f"pid {hello['pid']}")
+            await loop.sock_sendall(sock, ACK)
+        except Exception:
+            sock.close()
+            _close_fds(*fds)
+            raise
+        self.connections.append(connection)
+        try:
+            await self.client_connected_cb(*_streams(connection))
+        finally:
+            connection.close()
+            self.connections.remove(connection)
+
+    def close(self):
+        self.listener.close()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        if self._serving is not None and self._serving is not asyncio.current_task():
+            self._serving.cancel()
+
+    async def wait_closed(self):
+        pass
+
+
+async def start_server(client_connected_cb: Callable[..., Awaitable], channel: str) -> ShmServer:
+    """Shared memory counterpart of asyncio.start_server"""
+    return ShmServer(client_connected_cb, channel)
+
+
+async def open_connection(channel: str, capacity: int = DEFAULT_RING_CAPACITY):
+    """Shared memory counterpart of asyncio.open_connection, returning (reader, writer)"""
+    loop = asyncio.get_running_loop()
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.setblocking(False)
+    token = uuid.uuid4().hex[:12]
+    rings, fds = [], []
+    try:
+        await loop.sock_connect(sock, socket_path(channel))
+        to_server = MessageRing.create(f'{channel}_{token}_s', capacity)
+        rings.append(to_server)
+        to_client = MessageRing.create(f'{channel}_{token}_c', capacity)
+        rings.append(to_client)
+        server_read, server_write = _doorbell()
+        client_read, client_write = _doorbell()
+        fds = [server_read, server_write, client_read, client_write]
+
+        hello = json.dumps({'to_server': to_server.name, 'to_client': to_client.name,
+                            'pid': os.getpid()}).encode()
+        socket.send_fds(sock, [hello], [server_read, client_write])
+        if await loop.sock_recv(sock, 1) != ACK:
+            raise ConnectionError(f"Channel {channel} refused the connection")
+    except BaseException:
+        sock.close()
+        for ring in rings:
+            ring.close()
+            ring.unlink()
+        _close_fds(*fds)
+        raise
+
+    # The server holds its own copies of the doorbell ends it needs
+    for ring in rings:
+        ring.unlink()
+    _close_fds(*{server_read, client_write} - {client_read, server_write})
+    connection = ShmConnection(sock, to_client, client_read, to_server, server_write,
+                               f'channel {channel}')
+    return _streams(connection)
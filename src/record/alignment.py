@@ -0,0 +1,290 @@
+import json
+import threading
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from comm.messages import binary_codec
+from comm.messages.message_base import MessageTypes
+from comm.messages.registry import decode_dict
+from record.session_log import RECORD_FRAME, RECORD_MESSAGE_OUT, SessionLog
+
+DEFAULT_FRAME_CAPACITY = 1024
+DEFAULT_SAMPLE_CAPACITY = 16384
+# Antenna sample values kept per sample, from CGSSample.data
+SAMPLE_FIELDS = ('x', 'y', 'z', 'q0', 'q1', 'q2', 'q3')
+SAMPLE_TYPES = (MessageTypes.UPDATE_ANTENNA_SAMPLE_REQUEST,
+                MessageTypes.UPDATE_ANTENNA_SAMPLE_BATCH_REQUEST)
+
+# A time series entry: timestamp in ns, id and value row
+Entry = Tuple[int, int, np.ndarray]
+
+
+class TimeSeries:
+    """Fixed-capacity, time ordered series on preallocated NumPy arrays.
+
+    Every entry is written twice, at position k and k + capacity, so the
+    newest `capacity` entries are always one contiguous slice and every
+    lookup is a np.searchsorted over it. Entries must arrive in time
+    order; older ones are rejected and counted. Arrays returned by window()
+    are views and are overwritten once `capacity` more entries arrive.
+    """
+    def __init__(self, capacity: int, width: int = 0, dtype=np.float64):
+        if capacity < 1:
+            raise ValueError("A time series needs a capacity of at least 1")
+        self.capacity = capacity
+        self.width = width
+        self._times = np.zeros(2 * capacity, dtype=np.int64)
+        self._ids = np.full(2 * capacity, -1, dtype=np.int64)
+        self._values = np.zeros((2 * capacity, width), dtype=dtype)
+        self._next = 0
+        self._lock = threading.Lock()
+        self.rejected = 0
+
+    def __len__(self) -> int:
+        return min(self._next, self.capacity)
+
+    @property
+    def appended(self) -> int:
+        return self._next
+
+    def _view(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        with self._lock:
+            count = min(self._next, self.capacity)
+            start = (self._next - count) % self.capacity
+        end = start + count
+        return self._times[start:end], self._ids[start:end], self._values[start:end]
+
+    def append(self, timestamp_ns: int, value=None, ident: int = -1) -> bool:
+        """Add one entry; False if it is older than the newest one"""
+        with self._lock:
+            if self._next and timestamp_ns < self._times[(self._next - 1) % self.capacity]:
+                self.rejected += 1
+                return False
+            position = self._next % self.capacity
+            for index in (position, position + self.capacity):
+                self._times[index] = timestamp_ns
+                self._ids[index] = ident
+                if self.width:
+                    self._values[index] = value
+            self._next += 1
+        return True
+
+    def extend(self, timestamps_ns: np.ndarray, values: np.ndarray = None,
+               ids: np.ndarray = None) -> int:
+        """Add many time ordered entries at once; returns how many were kept.
+
+        Entries older than the newest one already held are rejected.
+        """
+        timestamps_ns = np.asarray(timestamps_ns, dtype=np.int64)
+        if np.any(np.diff(timestamps_ns) < 0):
+            raise ValueError("Timestamps must be in ascending order")
+        with self._lock:
+            keep = np.ones(len(timestamps_ns), dtype=bool)
+            if self._next:
+                keep = timestamps_ns >= self._times[(self._next - 1) % self.capacity]
+            self.rejected += int(len(keep) - keep.sum())
+            timestamps_ns = timestamps_ns[keep][-self.capacity:]
+            count = len(timestamps_ns)
+            skipped = int(keep.sum()) - count
+            positions = (self._next + skipped + np.arange(count)) % self.capacity
+            for offset in (0, self.capacity):
+                self._times[positions + offset] = timestamps_ns
+                self._ids[positions + offset] = (-1 if ids is None else
+                                                 np.asarray(ids)[keep][-self.capacity:])
+                if self.width:
+                    self._values[positions + offset] = np.asarray(values)[keep][-self.capacity:]
+            self._next += skipped + count
+        return count
+
+    @property
+    def span(self) -> Optional[Tuple[int, int]]:
+        """Timestamps of the oldest and newest entry"""
+        times, _, _ = self._view()
+        return (int(times[0]), int(times[-1])) if len(times) else None
+
+    def nearest_indices(self, timestamps_ns: np.ndarray) -> np.ndarray:
+        """Position in window() of the entry nearest each timestamp; -1 when empty"""
+        times, _, _ = self._view()
+        timestamps_ns = np.asarray(timestamps_ns, dtype=np.int64)
+        if len(times) < 2:
+            return np.full(timestamps_ns.shape, len(times) - 1, dtype=np.intp)
+        after = np.clip(np.searchsorted(times, timestamps_ns), 1, len(times) - 1)
+        before = after - 1
+        closer_after = (times[after] - timestamps_ns) < (timestamps_ns - times[before])
+        return np.where(closer_after, after, before)
+
+    def nearest(self, timestamp_ns: int, tolerance_ns: int = None) -> Optional[Entry]:
+        """Entry closest in time, or None if there is none within tolerance"""
+        times, ids, values = self._view()
+        index = int(self.nearest_indices(np.array([timestamp_ns]))[0])
+        if index < 0 or (tolerance_ns is not None
+                         and abs(int(times[index]) - timestamp_ns) > tolerance_ns):
+            return None
+        return int(times[index]), int(ids[index]), values[index].copy()
+
+    def interpolate_many(self, timestamps_ns: np.ndarray) -> np.ndarray:
+        """Values linearly interpolated at each timestamp, NaN outside the span"""
+        times, _, values = self._view()
+        timestamps_ns = np.asarray(timestamps_ns, dtype=np.int64)
+        result = np.full((len(timestamps_ns), self.width), np.nan)
+        if not len(times):
+            return result
+        inside = (timestamps_ns >= times[0]) & (timestamps_ns <= times[-1])
+        wanted = timestamps_ns[inside]
+        if len(times) == 1:
+            after = before = np.zeros(len(wanted), dtype=np.intp)
+        else:
+            after = np.clip(np.searchsorted(times, wanted, side='right'), 1, len(times) - 1)
+            before = after - 1
+        gap = (times[after] - times[before]).astype(np.float64)
+        weight = np.divide(wanted - times[before], gap, out=np.zeros(len(wanted)), where=gap > 0)
+        result[inside] = values[before] + (values[after] - values[before]) * weight[:, None]
+        return result
+
+    def interpolate(self, timestamp_ns: int) -> Optional[np.ndarray]:
+        """Value linearly interpolated at a timestamp, None outside the span"""
+        value = self.interpolate_many(np.array([timestamp_ns]))[0]
+        return None if np.isnan(value).all() else value
+
+    def window(self, start_ns: int, end_ns: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Timestamps, ids and values of the entries in [start_ns, end_ns), as views"""
+        times, ids, values = self._view()
+        start, end = np.searchsorted(times, [start_ns, end_ns])
+        return times[start:end], ids[start:end], values[start:end]
+
+    def find_id(self, ident: int) -> Optional[Entry]:
+        """Entry with the given id, for series whose ids increase with time"""
+        times, ids, values = self._view()
+        index = int(np.searchsorted(ids, ident))
+        if index == len(ids) or ids[index] != ident:
+            return None
+        return int(times[index]), int(ids[index]), values[index].copy()
+
+
+def sample_values(samples: Iterable, fields: Sequence[str] = SAMPLE_FIELDS) -> np.ndarray:
+    """(N, len(fields)) array from CGSSample objects or their data dicts; NaN where missing"""
+    rows = [getattr(sample, 'data', sample) for sample in samples]
+    return np.array([[row.get(field, np.nan) for field in fields] for row in rows],
+                    dtype=np.float64).reshape(len(rows), len(fields))
+
+
+class AlignmentBuffer:
+    """Recent video frames and antenna samples on one time base.
+
+    Frames are kept by id and samples by a running sample number, both
+    with the time they were seen. Queries such as the sample at a frame's
+    time or the frames between two samples are O(log n) lookups, instead
+    of scanning one stream for every item of the other.
+
+    Both streams have to be stamped with the same clock: live, the frame
+    ring's time.time_ns() timestamps and samples stamped on arrival;
+    offline, the monotonic timestamps of the session log. Interpolation is
+    linear per field, so quaternion fields should be renormalised by the
+    caller.
+    """
+    def __init__(self, frame_capacity: int = DEFAULT_FRAME_CAPACITY,
+                 sample_capacity: int = DEFAULT_SAMPLE_CAPACITY,
+                 sample_fields: Sequence[str] = SAMPLE_FIELDS):
+        self.sample_fields = tuple(sample_fields)
+        self.frames = TimeSeries(frame_capacity)
+        self.samples = TimeSeries(sample_capacity, len(self.sample_fields))
+
+    def add_frame(self, frame_id: int, timestamp_ns: int) -> bool:
+        return self.frames.append(timestamp_ns, ident=frame_id)
+
+    def add_sample(self, timestamp_ns: int, sample) -> bool:
+        """Add one CGSSample, data dict or value row"""
+        if not isinstance(sample, np.ndarray):
+            sample = sample_values([sample], self.sample_fields)[0]
+        return self.samples.append(timestamp_ns, sample, self.samples.appended)
+
+    def add_message(self, message, timestamp_ns: int) -> int:
+        """Add the samples of a typed antenna sample or batch request; returns how many"""
+        if message.type == MessageTypes.UPDATE_ANTENNA_SAMPLE_REQUEST:
+            return int(self.add_sample(timestamp_ns, message.cgs_sample))
+        if message.type == MessageTypes.UPDATE_ANTENNA_SAMPLE_BATCH_REQUEST and len(message):
+            count = len(message)
+            first = self.samples.appended
+            return self.samples.extend(np.full(count, timestamp_ns, dtype=np.int64),
+                                       sample_values(message.cgs_samples, self.sample_fields),
+                                       np.arange(first, first + count))
+        return 0
+
+    def frame_time(self, frame_id: int) -> Optional[int]:
+        entry = self.frames.find_id(frame_id)
+        return entry[0] if entry is not None else None
+
+    def sample_at(self, timestamp_ns: int, interpolate: bool = True,
+                  tolerance_ns: int = None) -> Optional[np.ndarray]:
+        """Sample values at a time, interpolated or from the nearest sample"""
+        if interpolate:
+            return self.samples.interpolate(timestamp_ns)
+        entry = self.samples.nearest(timestamp_ns, tolerance_ns)
+        return entry[2] if entry is not None else None
+
+    def sample_at_frame(self, frame_id: int, interpolate: bool = True,
+                        tolerance_ns: int = None) -> Optional[np.ndarray]:
+        """Sample values at the time a frame was published"""
+        timestamp_ns = self.frame_time(frame_id)
+        if timestamp_ns is None:
+            return None
+        return self.sample_at(timestamp_ns, interpolate, tolerance_ns)
+
+    def frame_at(self, timestamp_ns: int, tolerance_ns: int = None) -> Optional[int]:
+        """Id of the frame closest in time"""
+        entry = self.frames.nearest(timestamp_ns, tolerance_ns)
+        return entry[1] if entry is not None else None
+
+    def frames_between(self, start_ns: int, end_ns: int) -> np.ndarray:
+        """Ids of the frames published in [start_ns, end_ns)"""
+        return self.frames.window(start_ns, end_ns)[1]
+
+    def frames_between_samples(self, first_sample: int, last_sample: int) -> np.ndarray:
+        """Ids of the frames published from one sample up to another, by sample number"""
+        first = self.samples.find_id(first_sample)
+        last = self.samples.find_id(last_sample)
+        if first is None or last is None:
+            return np.empty(0, dtype=np.int64)
+        return self.frames_between(first[0], last[0])
+
+    def samples_for_frame(self, frame_id: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Samples from a frame's time up to the next frame's, as views"""
+        entry = self.frames.find_id(frame_id)
+        if entry is None:
+            return self.samples.window(0, 0)
+        following = self.frames.window(entry[0] + 1, np.iinfo(np.int64).max)[0]
+        end_ns = int(following[0]) if len(following) else np.iinfo(np.int64).max
+        return self.samples.window(entry[0], end_ns)
+
+    @classmethod
+    def from_session_logs(cls, logs: List[SessionLog],
+                          sample_fields: Sequence[str] = SAMPLE_FIELDS) -> 'AlignmentBuffer':
+        """Index the frames and sent samples of recorded sessions, on their log timestamps"""
+        frame_times, frame_ids, sample_times, samples = [], [], [], []
+        for log in logs:
+            for record in log.records(kinds=(RECORD_FRAME, RECORD_MESSAGE_OUT)):
+                if record.kind == RECORD_FRAME:
+                    frame_times.append(record.timestamp_ns)
+                    frame_ids.append(record.frame[0])
+                    continue
+                payload = bytes(record.payload)
+                message = (binary_codec.decode(payload) if binary_codec.is_binary(payload)
+                           else decode_dict(json.loads(payload)))
+                if isinstance(message, dict) or message.type not in SAMPLE_TYPES:
+                    continue
+                batch = (message.cgs_samples if message.type == SAMPLE_TYPES[1]
+                         else [message.cgs_sample])
+                sample_times.extend([record.timestamp_ns] * len(batch))
+                samples.extend(batch)
+
+        buffer = cls(max(len(frame_times), 1), max(len(sample_times), 1), sample_fields)
+        if frame_times:
+            order = np.argsort(frame_times, kind='stable')
+            buffer.frames.extend(np.array(frame_times)[order], ids=np.array(frame_ids)[order])
+        if sample_times:
+            order = np.argsort(sample_times, kind='stable')
+            buffer.samples.extend(np.array(sample_times)[order],
+                                  sample_values(samples, sample_fields)[order],
+                                  np.arange(len(sample_times)))
+        return buffer
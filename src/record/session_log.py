@@ -0,0 +1,206 @@
+import mmap
+import os
+import struct
+import threading
+import time
+from bisect import bisect_left
+from typing import Iterator, Optional, Sequence
+
+# Log file: magic, then records of header + payload.
+# Index file: magic, then one (timestamp, offset) entry per record.
+LOG_MAGIC = b'SIMLOG01'
+INDEX_MAGIC = b'SIMIDX01'
+# kind, monotonic timestamp in ns, payload length
+RECORD_HEADER = struct.Struct('<BqI')
+# monotonic timestamp in ns, record offset in the log file
+INDEX_ENTRY = struct.Struct('<qQ')
+# frame id, frame timestamp in ns
+FRAME_RECORD = struct.Struct('<qq')
+
+RECORD_MESSAGE_IN = 1
+RECORD_MESSAGE_OUT = 2
+RECORD_FRAME = 3
+# Outgoing messages that get no response, such as streamed video frames
+RECORD_NOTIFY_OUT = 4
+# Responses to requests the peer sent us; never replayed
+RECORD_RESPONSE_OUT = 5
+
+LOG_SUFFIX = '.log'
+INDEX_SUFFIX = '.idx'
+WRITE_BUFFER_SIZE = 1024 * 1024
+
+
+class SessionRecorder:
+    """Appends messages and frame ids to an indexed session log.
+
+    Every record is stamped with time.monotonic_ns(), which is shared by
+    all processes on the host, so logs written by the communication
+    service and by the video loader can be merged on replay.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self._log = open(path + LOG_SUFFIX, 'wb', buffering=WRITE_BUFFER_SIZE)
+        self._index = open(path + INDEX_SUFFIX, 'wb', buffering=WRITE_BUFFER_SIZE)
+        self._log.write(LOG_MAGIC)
+        self._index.write(INDEX_MAGIC)
+        self._offset = len(LOG_MAGIC)
+        self._lock = threading.Lock()
+        self.records = 0
+
+    def record(self, kind: int, payload, timestamp_ns: int = None):
+        """Append one record; payload may be any bytes-like object"""
+        if timestamp_ns is None:
+            timestamp_ns = time.monotonic_ns()
+        size = len(payload)
+        with self._lock:
+            self._log.write(RECORD_HEADER.pack(kind, timestamp_ns, size))
+            self._log.write(payload)
+            self._index.write(INDEX_ENTRY.pack(timestamp_ns, self._offset))
+            self._offset += RECORD_HEADER.size + size
+            self.records += 1
+
+    def record_message_in(self, payload):
+        self.record(RECORD_MESSAGE_IN, payload)
+
+    def record_message_out(self, payload):
+        self.record(RECORD_MESSAGE_OUT, payload)
+
+    def record_notify_out(self, payload):
+        self.record(RECORD_NOTIFY_OUT, payload)
+
+    def record_frame(self, frame_id: int, frame_timestamp_ns: int = 0):
+        self.record(RECORD_FRAME, FRAME_RECORD.pack(frame_id, frame_timestamp_ns))
+
+    def flush(self):
+        with self._lock:
+            self._log.flush()
+            self._index.flush()
+
+    def close(self):
+        with self._lock:
+            self._log.close()
+            self._index.close()
+
+
+class LogRecord:
+    """A record viewed in place in the memory-mapped log"""
+    __slots__ = ('kind', 'timestamp_ns', 'payload')
+
+    def __init__(self, kind: int, timestamp_ns: int, payload: memoryview):
+        self.kind = kind
+        self.timestamp_ns = timestamp_ns
+        self.payload = payload
+
+    @property
+    def frame(self):
+        """(frame_id, frame_timestamp_ns) of a frame record"""
+        return FRAME_RECORD.unpack_from(self.payload)
+
+
+class _IndexTimestamps(Sequence):
+    """Timestamp column of the index, for bisecting without loading it"""
+    def __init__(self, view: memoryview):
+        self._view = view
+
+    def __len__(self):
+        return len(self._view) // 2
+
+    def __getitem__(self, index):
+        return self._view[index * 2]
+
+
+class SessionLog:
+    """Read-only, memory-mapped access to a recorded session.
+
+    Neither the log nor its index are read into memory; records are
+    located through the index and returned as views. If the index is
+    missing or shorter than the log (for example after a crash) it is
+    rebuilt by scanning the log once.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self._log_file = open(path + LOG_SUFFIX, 'rb')
+        self._log = mmap.mmap(self._log_file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._log[:len(LOG_MAGIC)] != LOG_MAGIC:
+            raise ValueError(f"{path + LOG_SUFFIX} is not a session log")
+        self._log_view = memoryview(self._log)
+
+        if not self._index_is_complete():
+            self.rebuild_index()
+        self._index_file = open(path + INDEX_SUFFIX, 'rb')
+        self._index = mmap.mmap(self._index_file.fileno(), 0, access=mmap.ACCESS_READ)
+        # A recorder that died mid-write may leave a torn last entry; it is ignored
+        entries = (len(self._index) - len(INDEX_MAGIC)) // INDEX_ENTRY.size
+        self._index_view = memoryview(self._index)[
+            len(INDEX_MAGIC):len(INDEX_MAGIC) + entries * INDEX_ENTRY.size].cast('q')
+        self._timestamps = _IndexTimestamps(self._index_view)
+
+    def _index_is_complete(self) -> bool:
+        index_path = self.path + INDEX_SUFFIX
+        if not os.path.exists(index_path):
+            return False
+        entries = (os.path.getsize(index_path) - len(INDEX_MAGIC)) // INDEX_ENTRY.size
+        if entries <= 0:
+            return len(self._log) == len(LOG_MAGIC)
+        with open(index_path, 'rb') as index:
+            index.seek(len(INDEX_MAGIC) + (entries - 1) * INDEX_ENTRY.size)
+            _, offset = INDEX_ENTRY.unpack(index.read(INDEX_ENTRY.size))
+        if offset + RECORD_HEADER.size > len(self._log):
+            return False
+        _, _, size = RECORD_HEADER.unpack_from(self._log, offset)
+        return offset + RECORD_HEADER.size + size == len(self._log)
+
+    def rebuild_index(self):
+        """Regenerate the index by scanning the log, dropping a torn last record"""
+        offset = len(LOG_MAGIC)
+        end = len(self._log)
+        with open(self.path + INDEX_SUFFIX, 'wb', buffering=WRITE_BUFFER_SIZE) as index:
+            index.write(INDEX_MAGIC)
+            while offset + RECORD_HEADER.size <= end:
+                _, timestamp_ns, size = RECORD_HEADER.unpack_from(self._log, offset)
+                if offset + RECORD_HEADER.size + size > end:
+                    break
+                index.write(INDEX_ENTRY.pack(timestamp_ns, offset))
+                offset += RECORD_HEADER.size + size
+
+    def __len__(self):
+        return len(self._timestamps)
+
+    @property
+    def start_ns(self) -> Optional[int]:
+        return self._timestamps[0] if len(self) else None
+
+    @property
+    def end_ns(self) -> Optional[int]:
+        return self._timestamps[len(self) - 1] if len(self) else None
+
+    def find(self, timestamp_ns: int) -> int:
+        """Index of the first record at or after timestamp_ns"""
+        return bisect_left(self._timestamps, timestamp_ns)
+
+    def record(self, index: int) -> LogRecord:
+        offset = self._index_view[index * 2 + 1]
+        kind, timestamp_ns, size = RECORD_HEADER.unpack_from(self._log, offset)
+        start = offset + RECORD_HEADER.size
+        return LogRecord(kind, timestamp_ns, self._log_view[start:start + size])
+
+    def records(self, start_ns: int = None, end_ns: int = None,
+                kinds: Sequence[int] = None) -> Iterator[LogRecord]:
+        """Iterate records in time order, optionally limited to [start_ns, end_ns) and kinds"""
+        index = 0 if start_ns is None else self.find(start_ns)
+        for index in range(index, len(self)):
+            record = self.record(index)
+            if end_ns is not None and record.timestamp_ns >= end_ns:
+                break
+            if kinds is None or record.kind in kinds:
+                yield record
+
+    def close(self):
+        """Unmap the log; views handed out before must no longer be used"""
+        self._timestamps = None
+        self._index_view.release()
+        self._log_view.release()
+        self._index.close()
+        self._log.close()
+        self._index_file.close()
+        self._log_file.close()
@@ -0,0 +1,172 @@
+import argparse
+import asyncio
+import heapq
+import json
+import logging
+import time
+import uuid
+from typing import Callable, List, Optional, Sequence
+
+from comm.messages.message_base import MessageBase, MessageTypes
+from comm.messages.registry import decode_dict
+from record.session_log import (RECORD_FRAME, RECORD_MESSAGE_OUT, RECORD_NOTIFY_OUT,
+                                LogRecord, SessionLog)
+
+AS_FAST_AS_POSSIBLE = 0
+
+
+class SessionReplayer:
+    """Re-drives recorded sessions against an algorithm.
+
+    Outgoing messages recorded by the simulator are sent again through a
+    connected CommunicationService, notifications such as streamed video
+    frames without waiting for a response, and recorded frame ids are
+    handed to an optional callback. Records from several logs are merged by their
+    monotonic timestamps and paced at `speed` times the recorded rate, or
+    sent back to back when speed is AS_FAST_AS_POSSIBLE.
+
+    Requests are sent with fresh ids, so logs of different sessions never
+    collide with each other or with requests of the live connection.
+    Recorded codec negotiations are skipped; the replaying connection
+    negotiates its own.
+    """
+    def __init__(self, logs: List[SessionLog], speed: float = 1.0):
+        self.logs = logs
+        self.speed = speed
+        self.sent = 0
+        self.notifications = 0
+        self.responses = 0
+        self.failures = 0
+        self.frames = 0
+        self.logger = logging.getLogger(self.__class__.__name__)
+
+    @property
+    def start_ns(self) -> Optional[int]:
+        """Time of the earliest record, or None if every log is empty"""
+        starts = [log.start_ns for log in self.logs if len(log)]
+        return min(starts) if starts else None
+
+    def merged_records(self, start_ns: int = None, end_ns: int = None,
+                       kinds: Sequence[int] = (RECORD_MESSAGE_OUT, RECORD_NOTIFY_OUT,
+                                               RECORD_FRAME)):
+        """All records of all logs in timestamp order"""
+        return heapq.merge(*(log.records(start_ns, end_ns, kinds) for log in self.logs),
+                           key=lambda record: record.timestamp_ns)
+
+    async def replay(self, comm_service, start_ns: int = None, end_ns: int = None,
+                     on_frame: Callable[[int, int], None] = None,
+                     on_response: Callable[[LogRecord, dict], None] = None):
+        """Replay [start_ns, end_ns) of the session and wait for every response"""
+        pending = set()
+        session_start = None
+        replay_start = time.monotonic_ns()
+
+        for record in self.merged_records(start_ns, end_ns):
+            if session_start is None:
+                session_start = record.timestamp_ns
+            if self.speed != AS_FAST_AS_POSSIBLE:
+                due = replay_start + (record.timestamp_ns - session_start) / self.speed
+                delay = (due - time.monotonic_ns()) / 1e9
+                if delay > 0:
+                    await asyncio.sleep(delay)
+
+            if record.kind == RECORD_FRAME:
+                self.frames += 1
+                if on_frame is not None:
+                    on_frame(*record.frame)
+                continue
+
+            # Payloads are views into the mapped log; send a stable copy
+            if record.kind == RECORD_NOTIFY_OUT:
+                await comm_service.notify_payload(bytes(record.payload))
+                self.notifications += 1
+                continue
+            future = await self._submit(comm_service, record)
+            if future is None:
+                continue
+            self.sent += 1
+            future.add_done_callback(
+                lambda done, record=record: self._on_response(done, record, on_response))
+            pending.add(future)
+            future.add_done_callback(pending.discard)
+
+        if pending:
+            await asyncio.wait(list(pending))
+
+    async def _submit(self, comm_service, record: LogRecord):
+        """Send a recorded request under a fresh id; None for records that are skipped"""
+        message = comm_service.decode_payload(bytes(record.payload))
+        if isinstance(message, dict):
+            message = decode_dict(message)
+        if message.get('type') == MessageTypes.CODEC_NEGOTIATION_REQUEST:
+            return None
+        if isinstance(message, MessageBase):
+            message.id = str(uuid.uuid4())
+            return await comm_service.submit(message)
+        message['id'] = str(uuid.uuid4())
+        return await comm_service.submit_payload(json.dumps(message).encode(), message['id'],
+                                                 message.get('type'))
+
+    def _on_response(self, future: asyncio.Future, record: LogRecord, on_response):
+        if future.cancelled() or future.exception() is not None:
+            self.failures += 1
+            return
+        self.responses += 1
+        if on_response is not None:
+            on_response(record, future.result())
+
+
+async def replay_session(paths: List[str], host: str, port: int, speed: float,
+                         start_offset: float = 0.0):
+    """Connect to an algorithm and replay the given session logs against it"""
+    from comm.comm_service import CommunicationService
+
+    logs = [SessionLog(path) for path in paths]
+    replayer = SessionReplayer(logs, speed)
+    if replayer.start_ns is None:
+        for log in logs:
+            log.close()
+        print(f"Nothing to replay in {', '.join(paths)}")
+        return
+    comm_service = CommunicationService(host=host, port=port)
+    receive_task = asyncio.create_task(comm_service.connect_client())
+    while not comm_service.connected.is_set() and not receive_task.done():
+        await asyncio.sleep(0.01)
+    if not comm_service.connected.is_set():
+        for log in logs:
+            log.close()
+        error = None if receive_task.cancelled() else receive_task.exception()
+        raise ConnectionError(f"Could not connect to the algorithm on {host}:{port}") from error
+
+    start_ns = replayer.start_ns + int(start_offset * 1e9)
+    started = time.perf_counter()
+    await replayer.replay(comm_service, start_ns=start_ns)
+    elapsed = time.perf_counter() - started
+    print(f"Replayed {replayer.sent} messages, {replayer.notifications} notifications and "
+          f"{replayer.frames} frames in {elapsed:.2f}s, "
+          f"{replayer.responses} responses, {replayer.failures} failures")
+
+    await comm_service.close()
+    await receive_task
+    for log in logs:
+        log.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded simulator sessions")
+    parser.add_argument('logs', nargs='+', help="Session log paths, without suffix")
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--speed', type=float, default=1.0,
+                        help="Replay rate multiplier, 0 for as fast as possible")
+    parser.add_argument('--start', type=float, default=0.0,
+                        help="Seconds into the session to start from")
+    args = parser.parse_args()
+    try:
+        asyncio.run(replay_session(args.logs, args.host, args.port, args.speed, args.start))
+    except ConnectionError as e:
+        raise SystemExit(str(e))
+
+
+if __name__ == '__main__':
+    main()
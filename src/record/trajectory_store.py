@@ -0,0 +1,293 @@
+import argparse
+import json
+import os
+import time
+from datetime import datetime
+from typing import Dict, Tuple
+
+import numpy as np
+
+META_FILE = 'meta.json'
+STORE_VERSION = 1
+# Rows added to a column file whenever it runs out of room
+CHUNK_ROWS = 1 << 16
+DEFAULT_FLUSH_EVERY = 1000
+POSITION_SHAPE = (4, 4)
+# x, y, radius, fid
+LUMEN_FIELDS = 4
+
+# Fixed-width columns: one row per response
+COLUMNS = {
+    'pc_time': (np.int64, ()),
+    'cgs_time_ns': (np.int64, ()),
+    'received_ns': (np.int64, ()),
+    'process_time': (np.float64, ()),
+    'node_id': (np.int64, ()),
+    'lg_ct_position': (np.float64, POSITION_SHAPE),
+    'lumen_start': (np.int64, ()),
+    'lumen_count': (np.int32, ()),
+    'selection_start': (np.int64, ()),
+    'selection_count': (np.int32, ()),
+}
+# Ragged columns: rows referenced by <name>_start and <name>_count above
+RAGGED_COLUMNS = {
+    'lumens': (np.int32, (LUMEN_FIELDS,)),
+    'selections': (np.int32, (LUMEN_FIELDS,)),
+}
+RAGGED_PREFIX = {'lumens': 'lumen', 'selections': 'selection'}
+
+
+class _Column:
+    """One column in its own file, memory mapped and grown in chunks"""
+    def __init__(self, path: str, dtype, shape: Tuple[int, ...], writable: bool):
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.shape = shape
+        self.writable = writable
+        self.row_bytes = self.dtype.itemsize * int(np.prod(shape, dtype=np.int64))
+        self.data = None
+        self.capacity = 0
+        if writable and not os.path.exists(path):
+            open(path, 'wb').close()
+        self._map(os.path.getsize(path) // self.row_bytes)
+
+    def _map(self, capacity: int):
+        self.data = None
+        self.capacity = capacity
+        if capacity:
+            self.data = np.memmap(self.path, dtype=self.dtype, mode='r+' if self.writable else 'r',
+                                  shape=(capacity,) + self.shape)
+
+    def reserve(self, rows: int):
+        """Make room for at least `rows` rows, growing by whole chunks"""
+        if rows <= self.capacity:
+            return
+        capacity = -(-rows // CHUNK_ROWS) * CHUNK_ROWS
+        if self.data is not None:
+            self.data.flush()
+        with open(self.path, 'r+b') as file:
+            file.truncate(capacity * self.row_bytes)
+        self._map(capacity)
+
+    def view(self, rows: int) -> np.ndarray:
+        if self.data is None:
+            return np.empty((0,) + self.shape, dtype=self.dtype)
+        return self.data[:rows]
+
+    def flush(self):
+        if self.data is not None:
+            self.data.flush()
+
+    def close(self):
+        self.flush()
+        self.data = None
+
+
+def _clock_ns(cgs_time) -> int:
+    """Nanoseconds since the epoch of a CGSClock or its dict form; 0 if unknown"""
+    timestamp = cgs_time.get('timestamp') if isinstance(cgs_time, dict) else getattr(
+        cgs_time, 'timestamp', None)
+    if isinstance(timestamp, str):
+        timestamp = datetime.fromisoformat(timestamp)
+    return int(timestamp.timestamp() * 1e6) * 1000 if timestamp else 0
+
+
+def _lumen_rows(lumens) -> np.ndarray:
+    if not lumens:
+        return np.empty((0, LUMEN_FIELDS), dtype=np.int32)
+    if isinstance(lumens[0], dict):
+        return np.array([(lumen['x'], lumen['y'], lumen['radius'], lumen.get('fid', 0))
+                         for lumen in lumens], dtype=np.int32)
+    return np.array([(lumen.x, lumen.y, lumen.radius, lumen.fid) for lumen in lumens],
+                    dtype=np.int32)
+
+
+def _position(matrix) -> np.ndarray:
+    position = np.full(POSITION_SHAPE, np.nan)
+    if matrix:
+        matrix = np.asarray(matrix, dtype=np.float64)
+        if matrix.ndim == 2:
+            rows, cols = min(matrix.shape[0], 4), min(matrix.shape[1], 4)
+            position[:rows, :cols] = matrix[:rows, :cols]
+    return position
+
+
+class TrajectoryStore:
+    """Append-only columnar store of UpdateAntennaSampleResponse outputs.
+
+    A store is a directory with one raw file per column plus meta.json.
+    Fixed-width columns hold one row per response: times, node id,
+    process time and the 4x4 lg_ct_position. Lumens and selections are
+    ragged; their rows live in their own files and each response points
+    at its slice with a start and count. Column files grow in chunks of
+    CHUNK_ROWS rows and are memory mapped, so readers get the columns as
+    NumPy views without loading or parsing anything.
+
+    Only rows counted in meta.json are visible. The writer updates it on
+    flush(), every `flush_every` rows and on close, so a crashed writer
+    leaves a readable store missing at most its last unflushed rows.
+    """
+    def __init__(self, path: str, mode: str = 'r', flush_every: int = DEFAULT_FLUSH_EVERY):
+        if mode not in ('r', 'a'):
+            raise ValueError(f"Unknown store mode '{mode}'")
+        self.path = path
+        self.writable = mode == 'a'
+        self.flush_every = flush_every
+        meta_path = os.path.join(path, META_FILE)
+        if os.path.exists(meta_path):
+            with open(meta_path) as file:
+                meta = json.load(file)
+            if meta.get('version') != STORE_VERSION:
+                raise ValueError(f"{path} is not a version {STORE_VERSION} trajectory store")
+        elif self.writable:
+            os.makedirs(path, exist_ok=True)
+            meta = {'version': STORE_VERSION, 'rows': 0, 'ragged_rows': {}, 'pc_time_sorted': True,
+                    'created_ns': time.time_ns()}
+        else:
+            raise FileNotFoundError(f"No trajectory store at {path}")
+        self.meta = meta
+        self.rows = meta['rows']
+        self.ragged_rows = {name: meta['ragged_rows'].get(name, 0) for name in RAGGED_COLUMNS}
+        self.pc_time_sorted = meta['pc_time_sorted']
+        self._columns: Dict[str, _Column] = {
+            name: _Column(os.path.join(path, f'{name}.bin'), dtype, shape, self.writable)
+            for name, (dtype, shape) in {**COLUMNS, **RAGGED_COLUMNS}.items()}
+        self._unflushed = 0
+
+    def __len__(self) -> int:
+        return self.rows
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        """A column as a view over its memory mapped file"""
+        rows = self.ragged_rows[name] if name in RAGGED_COLUMNS else self.rows
+        return self._columns[name].view(rows)
+
+    def append(self, response, received_ns: int = None):
+        """Store one response dict or message"""
+        if not self.writable:
+            raise PermissionError("Trajectory store is open read-only")
+        row = self.rows
+        for column in COLUMNS:
+            self._columns[column].reserve(row + 1)
+
+        pc_time = int(response.get('pc_time') or 0)
+        if row and pc_time < self._columns['pc_time'].data[row - 1]:
+            self.pc_time_sorted = False
+        self._columns['pc_time'].data[row] = pc_time
+        self._columns['cgs_time_ns'].data[row] = _clock_ns(response.get('cgs_time'))
+        self._columns['received_ns'].data[row] = time.time_ns() if received_ns is None else received_ns
+        self._columns['process_time'].data[row] = response.get('process_time') or 0.0
+        self._columns['node_id'].data[row] = response.get('node_id') or 0
+        self._columns['lg_ct_position'].data[row] = _position(response.get('lg_ct_position'))
+
+        for name, prefix in RAGGED_PREFIX.items():
+            items = _lumen_rows(response.get(name))
+            start = self.ragged_rows[name]
+            column = self._columns[name]
+            column.reserve(start + len(items))
+            column.view(start + len(items))[start:] = items
+            self._columns[f'{prefix}_start'].data[row] = start
+            self._columns[f'{prefix}_count'].data[row] = len(items)
+            self.ragged_rows[name] = start + len(items)
+
+        self.rows = row + 1
+        self._unflushed += 1
+        if self._unflushed >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        """Make every appended row visible to readers"""
+        if not self.writable:
+            return
+        for column in self._columns.values():
+            column.flush()
+        self.meta.update(rows=self.rows, ragged_rows=self.ragged_rows,
+                         pc_time_sorted=self.pc_time_sorted)
+        meta_path = os.path.join(self.path, META_FILE)
+        with open(meta_path + '.tmp', 'w') as file:
+            json.dump(self.meta, file)
+        os.replace(meta_path + '.tmp', meta_path)
+        self._unflushed = 0
+
+    def refresh(self):
+        """Pick up rows flushed by a writer since the store was opened"""
+        with open(os.path.join(self.path, META_FILE)) as file:
+            self.meta = json.load(file)
+        self.rows = self.meta['rows']
+        self.ragged_rows = dict(self.meta['ragged_rows'])
+        self.pc_time_sorted = self.meta['pc_time_sorted']
+        for column in self._columns.values():
+            column._map(os.path.getsize(column.path) // column.row_bytes)
+
+    def range(self, start_pc_time: int, end_pc_time: int):
+        """Rows with start_pc_time <= pc_time < end_pc_time.
+
+        A slice when pc_time was appended in order, found by binary search;
+        otherwise an array of row numbers from one vectorized scan.
+        """
+        pc_time = self['pc_time']
+        if self.pc_time_sorted:
+            start, end = np.searchsorted(pc_time, [start_pc_time, end_pc_time])
+            return slice(int(start), int(end))
+        return np.flatnonzero((pc_time >= start_pc_time) & (pc_time < end_pc_time))
+
+    def select(self, rows) -> Dict[str, np.ndarray]:
+        """Fixed-width columns for a slice or array of rows; slices stay views"""
+        return {name: self[name][rows] for name in COLUMNS}
+
+    def ragged(self, name: str, row: int) -> np.ndarray:
+        """The lumens or selections of one row, as a view"""
+        prefix = RAGGED_PREFIX[name]
+        start = int(self[f'{prefix}_start'][row])
+        return self[name][start:start + int(self[f'{prefix}_count'][row])]
+
+    def ragged_range(self, name: str, rows: slice) -> Tuple[np.ndarray, np.ndarray]:
+        """The lumens or selections of a slice of rows as one view, with each row's offset in it"""
+        prefix = RAGGED_PREFIX[name]
+        starts = self[f'{prefix}_start'][rows]
+        counts = self[f'{prefix}_count'][rows]
+        if not len(starts):
+            return self[name][:0], np.zeros(0, dtype=np.int64)
+        first = int(starts[0])
+        return self[name][first:int(starts[-1] + counts[-1])], starts - first
+
+    def close(self):
+        if self.writable:
+            self.flush()
+        for column in self._columns.values():
+            column.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarise a trajectory store")
+    parser.add_argument('path')
+    parser.add_argument('--start', type=int, default=None, help="First pc_time")
+    parser.add_argument('--end', type=int, default=None, help="pc_time to stop before")
+    args = parser.parse_args()
+
+    store = TrajectoryStore(args.path)
+    try:
+        pc_time = store['pc_time']
+        if not len(store):
+            print("Empty store")
+            return
+        start = pc_time.min() if args.start is None else args.start
+        end = pc_time.max() + 1 if args.end is None else args.end
+        started = time.perf_counter()
+        rows = store.range(start, end)
+        columns = store.select(rows)
+        elapsed = (time.perf_counter() - started) * 1e3
+        count = len(columns['pc_time'])
+        print(f"{len(store)} responses, {store.ragged_rows['lumens']} lumens, "
+              f"pc_time {'sorted' if store.pc_time_sorted else 'unsorted'}")
+        print(f"{count} responses in [{start}, {end}) found in {elapsed:.2f} ms")
+        if count:
+            process_time = columns['process_time']
+            print(f"process_time mean {process_time.mean():.3f}, max {process_time.max():.3f}; "
+                  f"{len(np.unique(columns['node_id']))} nodes")
+    finally:
+        store.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,245 @@
+import argparse
+import asyncio
+import concurrent.futures
+import itertools
+import json
+import multiprocessing as mp
+import os
+import re
+import time
+from typing import Any, Dict, List, Optional
+
+from bench.algorithm_process import (CONNECT_POLL_INTERVAL, DEFAULT_STARTUP_TIMEOUT,
+                                     AlgorithmProcess)
+from bench.load_bench import make_sample, run_stage
+from comm.comm_service import CommunicationService
+from comm.messages.message_base import InitContinuesRegistrationRequest
+from comm.messages.messages import (CGSClock, CGSSample, LoadPlanningDataRequest,
+                                    StartRegistrationRequest, StopRegistrationRequest,
+                                    TranslationVector, UpdateAntennaSampleRequest, Vector3)
+from video.channel_registry import ChannelRegistry
+from video.multi_source_loader import MultiSourceLoader
+
+DEFAULT_SAMPLE_RATE = 100.0
+DEFAULT_SAMPLE_DURATION = 10.0
+DEFAULT_FRAME_SIZE = (720, 720, 3)
+DEFAULT_WINDOW = 64
+SHM_NAME_PREFIX = 'scn'
+
+
+def load_scenarios(path: str) -> List[dict]:
+    """Scenarios of a JSON file holding one scenario or a list of them.
+
+    Relative paths in a scenario are taken relative to its file.
+    """
+    with open(path) as file:
+        data = json.load(file)
+    scenarios = data if isinstance(data, list) else [data]
+    base = os.path.dirname(os.path.abspath(path))
+    stem = os.path.splitext(os.path.basename(path))[0]
+    for index, scenario in enumerate(scenarios):
+        scenario.setdefault('name', stem if len(scenarios) == 1 else f'{stem}_{index}')
+        scenario['base_dir'] = base
+    return scenarios
+
+
+def shared_memory_name(scenario_name: str) -> str:
+    """A frame channel name private to one run of a scenario"""
+    safe = re.sub(r'[^A-Za-z0-9_]', '_', scenario_name)[:40]
+    return f'{SHM_NAME_PREFIX}_{safe}_{os.getpid()}_{time.monotonic_ns() % 1000000}'
+
+
+def _path(scenario: dict, path: Optional[str]) -> Optional[str]:
+    if not path:
+        return path
+    return path if os.path.isabs(path) else os.path.join(scenario['base_dir'], path)
+
+
+def sample_factory(scenario: dict):
+    """Samples of the scenario's sample file, looped, or synthetic ones"""
+    samples = scenario.get('samples', {})
+    sample_file = _path(scenario, samples.get('file'))
+    if not sample_file:
+        return make_sample
+    with open(sample_file) as file:
+        rows = [json.loads(line) for line in file if line.strip()]
+    if not rows:
+        raise ValueError(f"No samples in {sample_file}")
+
+    def make(index: int) -> UpdateAntennaSampleRequest:
+        return UpdateAntennaSampleRequest(pc_time=time.monotonic_ns() // 1000,
+                                          cgs_time=CGSClock(),
+                                          cgs_sample=CGSSample(dict(rows[index % len(rows)])))
+    return make
+
+
+async def _step(results: dict, name: str, client: CommunicationService, request) -> dict:
+    """Send one sequence step, recording its latency and whether it succeeded"""
+    started = time.perf_counter()
+    response = await client.send_message(request)
+    results['steps_ms'][name] = (time.perf_counter() - started) * 1000.0
+    if not response.get('success', True):
+        results['step_errors'][name] = response.get('error_message') or 'failed'
+    return response
+
+
+async def _run_sequence(scenario: dict, algorithm: AlgorithmProcess, shm_name: str,
+                        frame_shape, results: dict):
+    client = CommunicationService(host=algorithm.host, port=algorithm.port,
+                                  transport=algorithm.transport,
+                                  max_in_flight=scenario.get('window', DEFAULT_WINDOW),
+                                  codecs=[scenario['codec']] if scenario.get('codec') else None)
+    # e.g. {"policy": "latest", "max_queued": 1, "max_age": 0.5}
+    if scenario.get('overload'):
+        client.enable_sample_coalescing(**scenario['overload'])
+    if scenario.get('record'):
+        client.enable_recording(_path(scenario, scenario['record']))
+    receive_task = asyncio.create_task(client.connect_client())
+    try:
+        while not client.connected.is_set() and not receive_task.done():
+            await asyncio.sleep(CONNECT_POLL_INTERVAL)
+        if receive_task.done():
+            raise ConnectionError(f"Could not connect to {algorithm.host}:{algorithm.port}")
+        results['codec'] = client.codec
+
+        height, width, channels = frame_shape
+        planning = scenario.get('planning', {})
+        pst = scenario.get('pst_positions') or [[1.0, 0.0, 0.0], [0.0, 1.0, 0.0], [0.0, 0.0, 1.0]]
+        await _step(results, 'init', client, InitContinuesRegistrationRequest(
+            configuration_dir_path=_path(scenario, scenario.get('configuration_dir_path', '')),
+            shared_memory_name=shm_name,
+            frame_width=width, frame_height=height, color_bytes=channels))
+        await _step(results, 'load', client, LoadPlanningDataRequest(
+            skeleton_dir_path=_path(scenario, planning.get('skeleton_dir_path', '')),
+            data_dir_file_path=_path(scenario, planning.get('data_dir_file_path', '')),
+            target_position=Vector3(*planning.get('target_position', (0.0, 0.0, 0.0)))))
+        await _step(results, 'start', client, StartRegistrationRequest(
+            *(TranslationVector(*position) for position in pst[:3])))
+
+        samples = scenario.get('samples', {})
+        stage = await run_stage(client, samples.get('rate', DEFAULT_SAMPLE_RATE),
+                                samples.get('duration', DEFAULT_SAMPLE_DURATION),
+                                sample_factory(scenario))
+        results['stream'] = stage
+
+        await _step(results, 'stop', client, StopRegistrationRequest())
+    finally:
+        await client.close()
+        await receive_task
+
+
+def run_scenario(scenario: dict) -> Dict[str, Any]:
+    """Run one scenario's Init, Load, Start, stream and Stop sequence.
+
+    The scenario gets its own frame channel and, unless it names a running
+    algorithm, its own algorithm instance on a free port, so any number can
+    run side by side on one host.
+    """
+    results = {'name': scenario['name'], 'status': 'ok', 'error': '', 'steps_ms': {},
+               'step_errors': {}, 'stream': None}
+    shm_name = shared_memory_name(scenario['name'])
+    loader = algorithm = None
+    started = time.perf_counter()
+    try:
+        frame_shape = tuple(scenario.get('frame_shape', DEFAULT_FRAME_SIZE))
+        video = _path(scenario, scenario.get('video'))
+        if video:
+            loader = MultiSourceLoader([(shm_name, video)], fps=scenario.get('video_fps'),
+                                       speed=scenario.get('video_speed', 1.0))
+            loader.start()
+            registry = ChannelRegistry()
+            try:
+                channel = registry.wait_for(shm_name, DEFAULT_STARTUP_TIMEOUT)
+            finally:
+                registry.close()
+            if channel is None:
+                raise TimeoutError(f"Video {video} was not published")
+            frame_shape = channel.shape
+        results['shared_memory_name'] = shm_name if video else ''
+
+        algorithm = AlgorithmProcess(scenario, shm_name)
+        results['endpoint'] = f'{algorithm.host}:{algorithm.port}'
+
+        async def run():
+            await algorithm.start()
+            await _run_sequence(scenario, algorithm, shm_name, frame_shape, results)
+        asyncio.run(run())
+    except Exception as e:
+        results['status'] = 'failed'
+        results['error'] = f'{type(e).__name__}: {e}'
+    finally:
+        if algorithm is not None:
+            algorithm.stop()
+        if loader is not None:
+            loader.stop()
+            loader.cleanup()
+    if results['step_errors'] and results['status'] == 'ok':
+        results['status'] = 'step failed'
+    results['elapsed'] = time.perf_counter() - started
+    return results
+
+
+def format_summary(results: List[dict]) -> str:
+    """Per-scenario step latency, throughput and sample latency as a text table"""
+    header = (f"{'scenario':<24}{'status':<12}{'init':>8}{'load':>8}{'start':>8}{'stop':>8}"
+              f"{'sent':>8}{'resp':>8}{'fail':>6}{'thr/s':>9}{'p50 ms':>9}{'p99 ms':>9}"
+              f"{'p999 ms':>9}")
+    lines = [header, '-' * len(header)]
+    for result in results:
+        steps = result['steps_ms']
+        stream = result['stream'] or {}
+        latency = stream.get('latency_us', {})
+        step_text = ''.join(f"{steps[step]:>8.1f}" if step in steps else f"{'-':>8}"
+                            for step in ('init', 'load', 'start', 'stop'))
+        lines.append(f"{result['name'][:23]:<24}{result['status']:<12}{step_text}"
+                     f"{stream.get('sent', 0):>8}{stream.get('responses', 0):>8}"
+                     f"{stream.get('failures', 0):>6}{stream.get('throughput', 0.0):>9.1f}"
+                     f"{latency.get('p50', 0) / 1000:>9.2f}{latency.get('p99', 0) / 1000:>9.2f}"
+                     f"{latency.get('p999', 0) / 1000:>9.2f}")
+        if result['error']:
+            lines.append(f"  {result['error']}")
+        for step, error in result['step_errors'].items():
+            lines.append(f"  {step}: {error}")
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run registration scenarios headless, in parallel")
+    parser.add_argument('scenarios', nargs='+', help="Scenario JSON files")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                        help="Scenarios run at once")
+    parser.add_argument('--repeat', type=int, default=1, help="Runs of every scenario")
+    parser.add_argument('--output', default='', help="Write every result as JSON here")
+    parser.add_argument('--record', default='',
+                        help="Directory to record each run's session log to, for replay")
+    args = parser.parse_args()
+
+    scenarios = list(itertools.chain.from_iterable(load_scenarios(path) for path in args.scenarios))
+    if args.repeat > 1:
+        scenarios = [dict(scenario, name=f"{scenario['name']}#{run}")
+                     for scenario in scenarios for run in range(args.repeat)]
+    if args.record:
+        os.makedirs(args.record, exist_ok=True)
+        for scenario in scenarios:
+            scenario['record'] = os.path.join(os.path.abspath(args.record),
+                                              re.sub(r'[^A-Za-z0-9_.-]', '_', scenario['name']))
+    print(f"Running {len(scenarios)} scenarios on {args.workers} workers")
+
+    started = time.perf_counter()
+    with concurrent.futures.ProcessPoolExecutor(args.workers,
+                                                mp_context=mp.get_context('spawn')) as pool:
+        results = list(pool.map(run_scenario, scenarios))
+    elapsed = time.perf_counter() - started
+
+    print(format_summary(results))
+    failed = sum(result['status'] != 'ok' for result in results)
+    print(f"{len(results) - failed}/{len(results)} scenarios passed in {elapsed:.1f} s")
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=2)
+        print(f"Results written to {args.output}")
+    raise SystemExit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+import asyncio
+import concurrent.futures
+import threading
+from typing import Any, Callable, Coroutine
+
+from PyQt5.QtCore import QObject, pyqtSignal
+
+
+class AsyncBridge(QObject):
+    """Runs an asyncio event loop next to the Qt event loop.
+
+    The asyncio loop lives on its own thread and blocks on its sockets
+    while Qt blocks on window events, so neither has to poll the other.
+    Coroutines are scheduled from the GUI thread with submit(); completion
+    callbacks are delivered back on the GUI thread through a queued signal,
+    so they may touch widgets directly.
+    """
+    _completed = pyqtSignal(object, object)
+
+    def __init__(self, parent: QObject = None):
+        super().__init__(parent)
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run, name='AsyncBridge', daemon=True)
+        self._completed.connect(self._deliver)
+
+    def start(self):
+        self._thread.start()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+        # Give cancelled tasks a chance to unwind before the loop closes
+        tasks = asyncio.all_tasks(self.loop)
+        for task in tasks:
+            task.cancel()
+        self.loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+        self.loop.close()
+
+    def submit(self, coroutine: Coroutine,
+               on_done: Callable[[Any], None] = None) -> concurrent.futures.Future:
+        """Schedule a coroutine on the asyncio loop from any thread.
+
+        on_done receives the coroutine's result on the GUI thread; it is
+        not called if the coroutine fails or is cancelled.
+        """
+        future = asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+        if on_done is not None:
+            future.add_done_callback(lambda done: self._completed.emit(on_done, done))
+        return future
+
+    def _deliver(self, on_done: Callable[[Any], None], future: concurrent.futures.Future):
+        if not future.cancelled() and future.exception() is None:
+            on_done(future.result())
+
+    def run(self, coroutine: Coroutine, timeout: float = None) -> Any:
+        """Run a coroutine on the asyncio loop and block until it finishes"""
+        return self.submit(coroutine).result(timeout)
+
+    def stop(self):
+        """Stop the loop, cancelling whatever is still running on it"""
+        if self._thread.is_alive():
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self._thread.join()
@@ -0,0 +1,166 @@
+import collections
+import threading
+from typing import Callable, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from ui.overlay_renderer import OverlayRenderer
+from video.frame_sources import FrameSource
+
+DISPLAY_SIZE = (720, 720)
+READ_TIMEOUT = 0.1
+# One buffer being written, one waiting for the GUI and one on screen
+DISPLAY_BUFFERS = 3
+
+
+class DisplayFrame:
+    """A converted RGB frame, ready to be wrapped in a QImage"""
+    __slots__ = ('frame_id', 'timestamp_ns', 'image', 'buffer_index')
+
+    def __init__(self, frame_id: int, timestamp_ns: int, image: np.ndarray, buffer_index: int):
+        self.frame_id = frame_id
+        self.timestamp_ns = timestamp_ns
+        self.image = image
+        self.buffer_index = buffer_index
+
+
+class LatestQueue:
+    """Bounded queue that drops its oldest item instead of blocking the producer"""
+    def __init__(self, maxsize: int = 1, on_drop: Callable[[object], None] = None):
+        self._items = collections.deque()
+        self._maxsize = maxsize
+        self._on_drop = on_drop
+        self._condition = threading.Condition()
+        self.dropped = 0
+
+    def put(self, item):
+        with self._condition:
+            if len(self._items) >= self._maxsize:
+                stale = self._items.popleft()
+                self.dropped += 1
+                if self._on_drop is not None:
+                    self._on_drop(stale)
+            self._items.append(item)
+            self._condition.notify()
+
+    def get(self, timeout: float = None):
+        """Oldest item, waiting up to timeout; None if there is none"""
+        with self._condition:
+            if not self._items and not self._condition.wait_for(lambda: self._items, timeout):
+                return None
+            return self._items.popleft()
+
+    def get_nowait(self):
+        return self.get(timeout=0)
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+
+class FramePipeline:
+    """Acquires and converts frames on a worker thread.
+
+    The worker reads from a FrameSource, resizes straight into one of a few
+    preallocated RGB buffers and converts its colors in place, so a frame
+    is copied once between the source and the GUI. Converted frames go
+    through a latest-wins queue; the GUI takes them with get() and hands
+    each back with release() once it no longer needs its image. OpenCV
+    drops the GIL while it works, so a thread is enough to keep this off
+    the GUI thread. An OverlayRenderer, if given, paints the overlay
+    matching each frame id onto the converted buffer on the same thread.
+    """
+    def __init__(self, source: FrameSource, size: Tuple[int, int] = DISPLAY_SIZE,
+                 on_frame: Callable[[], None] = None, overlay: OverlayRenderer = None):
+        self.source = source
+        self.size = size
+        self.on_frame = on_frame
+        self.overlay = overlay
+        width, height = size
+        self._buffers = [np.empty((height, width, 3), dtype=np.uint8)
+                         for _ in range(DISPLAY_BUFFERS)]
+        self._free = collections.deque(range(DISPLAY_BUFFERS))
+        self._free_lock = threading.Lock()
+        self.queue = LatestQueue(1, on_drop=self.release)
+        self.frames = 0
+        self.torn = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='FramePipeline', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.source.close()
+
+    @property
+    def dropped(self) -> int:
+        return self.queue.dropped
+
+    def get(self) -> Optional[DisplayFrame]:
+        """The newest converted frame, if one is waiting"""
+        return self.queue.get_nowait()
+
+    def release(self, frame: DisplayFrame):
+        """Return a frame's buffer to the worker"""
+        with self._free_lock:
+            self._free.append(frame.buffer_index)
+
+    def _take_buffer(self) -> Optional[int]:
+        with self._free_lock:
+            return self._free.popleft() if self._free else None
+
+    def _convert(self, image: np.ndarray, buffer: np.ndarray):
+        """Resize and convert a source image into an RGB display buffer.
+
+        Channels a loader already publishes at display size in RGB are
+        only copied.
+        """
+        color = self.source.color
+        if color == 'gray':
+            if image.shape[:2] != buffer.shape[:2]:
+                image = cv2.resize(image, self.size)
+            cv2.cvtColor(image.reshape(image.shape[:2]), cv2.COLOR_GRAY2RGB, dst=buffer)
+        elif image.shape[:2] == buffer.shape[:2]:
+            if color == 'rgb':
+                np.copyto(buffer, image)
+            else:
+                cv2.cvtColor(image, cv2.COLOR_BGR2RGB, dst=buffer)
+        else:
+            cv2.resize(image, self.size, dst=buffer)
+            if color != 'rgb':
+                cv2.cvtColor(buffer, cv2.COLOR_BGR2RGB, dst=buffer)
+
+    def _run(self):
+        while not self._stop.is_set():
+            source_frame = self.source.read(READ_TIMEOUT)
+            if source_frame is None:
+                if self.source.ended:
+                    break
+                continue
+            buffer_index = self._take_buffer()
+            if buffer_index is None:
+                # The GUI still holds every buffer; skip rather than wait
+                continue
+
+            frame_id, timestamp_ns, image = source_frame
+            buffer = self._buffers[buffer_index]
+            self._convert(image, buffer)
+
+            # Shared memory sources may have reused the slot while we read it
+            if not self.source.is_valid():
+                self.torn += 1
+                self.release(DisplayFrame(frame_id, timestamp_ns, buffer, buffer_index))
+                continue
+
+            if self.overlay is not None:
+                self.overlay.render(buffer, frame_id)
+            self.frames += 1
+            self.queue.put(DisplayFrame(frame_id, timestamp_ns, buffer, buffer_index))
+            if self.on_frame is not None:
+                self.on_frame()
@@ -0,0 +1,224 @@
+import functools
+import threading
+import time
+from bisect import bisect_right
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from comm.metrics import LatencyHistogram
+
+DEFAULT_HISTORY = 64
+# RGB, as frames are overlaid after color conversion for display
+LUMEN_COLOR = (0, 255, 0)
+SELECTION_COLOR = (255, 0, 0)
+POSITION_COLOR = (255, 255, 0)
+LUMEN_THICKNESS = 1
+SELECTION_THICKNESS = 3
+CROSSHAIR_SIZE = 12
+# One RGB pixel as a single 3 byte value
+PIXEL = np.dtype('V3')
+
+
+def lumen_array(lumens: Sequence[Any]) -> np.ndarray:
+    """(N, 3) array of lumen x, y and radius from Lumen objects or dicts"""
+    if not lumens:
+        return np.empty((0, 3), dtype=np.float64)
+    if isinstance(lumens[0], dict):
+        return np.array([(lumen['x'], lumen['y'], lumen['radius']) for lumen in lumens],
+                        dtype=np.float64)
+    return np.array([(lumen.x, lumen.y, lumen.radius) for lumen in lumens], dtype=np.float64)
+
+
+@functools.lru_cache(maxsize=1024)
+def ring_stamp(radius: int, thickness: int) -> Tuple[np.ndarray, np.ndarray]:
+    """x and y offsets of the pixels of a ring of the given outer radius"""
+    extent = np.arange(-radius, radius + 1)
+    dy, dx = np.meshgrid(extent, extent, indexing='ij')
+    distance = np.hypot(dx, dy)
+    inner = max(radius - thickness, 0)
+    ring = (distance < radius + 0.5) & (distance >= inner + 0.5)
+    if not ring.any():
+        ring = distance < radius + 0.5
+    return dx[ring], dy[ring]
+
+
+def ring_pixels(circles: np.ndarray, thickness: int, width: int, height: int) -> np.ndarray:
+    """Flat pixel indices of the outlines of all circles at once.
+
+    circles is (N, 3) of x, y and radius in display pixels. Circles are
+    grouped by whole pixel radius and each group is drawn in one broadcast
+    of a cached ring stamp over its centres, instead of circle by circle.
+    Pixels where circles overlap may appear more than once.
+    """
+    if not len(circles):
+        return np.empty(0, dtype=np.intp)
+    centres = np.rint(circles[:, :2]).astype(np.intp)
+    radii = np.maximum(np.rint(circles[:, 2]).astype(np.intp), 1)
+    indices = []
+    for radius in np.unique(radii):
+        dx, dy = ring_stamp(int(radius), thickness)
+        group = centres[radii == radius]
+        x = group[:, 0:1] + dx
+        y = group[:, 1:2] + dy
+        inside = (x >= 0) & (x < width) & (y >= 0) & (y < height)
+        indices.append((y * width + x)[inside])
+    return np.concatenate(indices)
+
+
+def crosshair_pixels(x: float, y: float, size: int, width: int, height: int) -> np.ndarray:
+    """Flat pixel indices of a two pixel wide crosshair centred on (x, y)"""
+    offsets = np.arange(-size, size + 1)
+    cx, cy = int(round(x)), int(round(y))
+    along = np.concatenate([offsets, offsets])
+    across = np.repeat([0, 1], len(offsets))
+    xs = np.concatenate([cx + along, cx + across])
+    ys = np.concatenate([cy + across, cy + along])
+    inside = (xs >= 0) & (xs < width) & (ys >= 0) & (ys < height)
+    return np.unique(ys[inside] * width + xs[inside])
+
+
+class OverlayLayer:
+    """Pixels to paint for one response, as flat indices with one color per part.
+
+    Parts are painted in order, so later parts win where they overlap.
+    """
+    __slots__ = ('frame_id', 'parts')
+
+    def __init__(self, frame_id: int, parts: Sequence[Tuple[np.ndarray, Tuple[int, int, int]]]):
+        self.frame_id = frame_id
+        # Colors as 3 byte scalars, so a part is one scatter into a pixel view
+        self.parts = tuple((indices, np.array(color, dtype=np.uint8).view(PIXEL)[0])
+                           for indices, color in parts if len(indices))
+
+    @property
+    def pixels(self) -> int:
+        return sum(len(indices) for indices, _ in self.parts)
+
+    def apply(self, image: np.ndarray):
+        """Paint the layer onto a contiguous (H, W, 3) uint8 image in place"""
+        pixels = image.reshape(-1).view(PIXEL)
+        for indices, color in self.parts:
+            pixels[indices] = color
+
+
+class OverlayRenderer:
+    """Draws lumens, selections and the projected catheter position onto frames.
+
+    update() turns an UpdateAntennaSampleResponse into an OverlayLayer of
+    flat pixel indices, once per response; the lumen outlines are cached by
+    content, since the lumen map often stays the same while selections and
+    position move. render() then costs one scatter per color per frame,
+    proportional to the outline pixels rather than the frame size. Each
+    layer is kept under the frame id the sample was sent for, and a frame
+    is drawn with the newest layer computed for it or an earlier frame,
+    never with one computed for a later frame.
+
+    Lumen coordinates are in source frame pixels and scaled to the display
+    size. The catheter position is taken from the translation column of
+    lg_ct_position and mapped to pixels by `projection`, a 2x4 matrix
+    applied to (x, y, z, 1); by default x and y are used as pixels.
+    """
+    def __init__(self, display_size: Tuple[int, int] = (720, 720),
+                 source_size: Tuple[int, int] = None, projection: np.ndarray = None,
+                 history: int = DEFAULT_HISTORY):
+        self.width, self.height = display_size
+        self.source_size = tuple(source_size or display_size)
+        self.scale = self._scale_for(self.source_size)
+        if projection is None:
+            projection = np.array([[1.0, 0.0, 0.0, 0.0], [0.0, 1.0, 0.0, 0.0]])
+        self.projection = np.asarray(projection, dtype=np.float64)
+        self.history = history
+        self._frame_ids: List[int] = []
+        self._layers: List[OverlayLayer] = []
+        self._lock = threading.Lock()
+        self._lumen_cache: Dict[bytes, np.ndarray] = {}
+        self.build_time = LatencyHistogram()
+        self.render_time = LatencyHistogram()
+
+    def _scale_for(self, source_size: Tuple[int, int]) -> np.ndarray:
+        source_width, source_height = source_size
+        return np.array([self.width / source_width, self.height / source_height, 1.0])
+
+    def set_source_size(self, source_size: Tuple[int, int]):
+        """Change the frame size response coordinates refer to.
+
+        Layers and outlines computed for the previous size are dropped.
+        """
+        source_size = tuple(source_size)
+        if source_size == self.source_size:
+            return
+        self.source_size = source_size
+        self.scale = self._scale_for(source_size)
+        self._lumen_cache = {}
+        self.clear()
+
+    def _lumen_outline(self, lumens: np.ndarray, thickness: int) -> np.ndarray:
+        key = lumens.tobytes() + bytes((thickness,))
+        indices = self._lumen_cache.get(key)
+        if indices is None:
+            if len(self._lumen_cache) >= self.history:
+                self._lumen_cache.clear()
+            indices = ring_pixels(lumens * self.scale, thickness, self.width, self.height)
+            self._lumen_cache[key] = indices
+        return indices
+
+    def project(self, lg_ct_position) -> Optional[Tuple[float, float]]:
+        """Display pixel of the catheter position, or None if there is none"""
+        if lg_ct_position is None or len(lg_ct_position) < 3:
+            return None
+        matrix = np.asarray(lg_ct_position, dtype=np.float64)
+        if matrix.ndim != 2 or matrix.shape[1] < 4:
+            return None
+        x, y = self.projection @ np.append(matrix[:3, 3], 1.0)
+        return x * self.scale[0], y * self.scale[1]
+
+    def build(self, response, frame_id: int) -> OverlayLayer:
+        """Compute the layer for a response dict or message"""
+        started = time.perf_counter()
+        parts = []
+        lumens = self._lumen_outline(lumen_array(response.get('lumens') or []), LUMEN_THICKNESS)
+        parts.append((lumens, LUMEN_COLOR))
+        selections = self._lumen_outline(lumen_array(response.get('selections') or []),
+                                         SELECTION_THICKNESS)
+        parts.append((selections, SELECTION_COLOR))
+        position = self.project(response.get('lg_ct_position'))
+        if position is not None:
+            parts.append((crosshair_pixels(*position, CROSSHAIR_SIZE, self.width, self.height),
+                          POSITION_COLOR))
+
+        layer = OverlayLayer(frame_id, parts)
+        self.build_time.record((time.perf_counter() - started) * 1e6)
+        return layer
+
+    def update(self, response, frame_id: int) -> OverlayLayer:
+        """Build and keep the layer for the response to a sample sent at frame_id"""
+        layer = self.build(response, frame_id)
+        with self._lock:
+            position = bisect_right(self._frame_ids, frame_id)
+            self._frame_ids.insert(position, frame_id)
+            self._layers.insert(position, layer)
+            if len(self._layers) > self.history:
+                del self._frame_ids[0]
+                del self._layers[0]
+        return layer
+
+    def layer_for(self, frame_id: int) -> Optional[OverlayLayer]:
+        """Newest layer computed for frame_id or an earlier frame"""
+        with self._lock:
+            position = bisect_right(self._frame_ids, frame_id)
+            return self._layers[position - 1] if position else None
+
+    def render(self, image: np.ndarray, frame_id: int) -> Optional[OverlayLayer]:
+        """Paint the matching layer onto a display frame in place"""
+        started = time.perf_counter()
+        layer = self.layer_for(frame_id)
+        if layer is not None:
+            layer.apply(image)
+        self.render_time.record((time.perf_counter() - started) * 1e6)
+        return layer
+
+    def clear(self):
+        with self._lock:
+            self._frame_ids.clear()
+            self._layers.clear()
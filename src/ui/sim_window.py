@@ -9,16 +9,42 @@ from comm.messages.vector3 import Vector3
 from comm.messages.message_base import InitContinuesRegistrationRequest
 from comm.messages.messages import CGSClock, CGSSample, LoadPlanningDataRequest, StartRegistrationRequest, StopRegistrationRequest, TranslationVector, UpdateAntennaSampleRequest
 # from algoSimEnv.Lib import cv2
+import argparse
+import asyncio
 import numpy as np
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QVBoxLayout, QHBoxLayout, QPushButton, QWidget, QLabel)
 from PyQt5.QtGui import QImage, QPixmap
-from PyQt5.QtCore import Qt, QTimer
+from PyQt5.QtCore import Qt, QTimer, pyqtSignal
 
 from comm.comm_service import CommunicationService, MessageTypes
+from comm.sample_coalescer import OVERLOAD_LATEST, OVERLOAD_POLICIES, SampleDropped
+from comm.shm_transport import TCP_TRANSPORT, TRANSPORTS
+from ui.async_bridge import AsyncBridge
+from ui.frame_pipeline import DISPLAY_SIZE, FramePipeline
+from ui.overlay_renderer import OverlayRenderer
+from record.trajectory_store import TrajectoryStore
+from video.channel_registry import ChannelRegistry
+from video.frame_sources import CameraSource, FileSource, FrameSource, RingSource
+
+RECONNECT_DELAY = 1.0
+DEFAULT_CHANNEL = 'video_frame_shm'
+CHANNEL_WAIT = 5.0
+CONNECT_WAIT = 5.0
+SAMPLE_STREAM_RATE = 100.0
+STATUS_INTERVAL_MS = 250
 
 class VideoRegistrationApp(QMainWindow):
-    def __init__(self):
+    # Emitted from the frame pipeline thread, delivered on the GUI thread
+    frame_ready = pyqtSignal()
+
+    def __init__(self, frame_source: FrameSource = None, trajectory_store: TrajectoryStore = None,
+                 transport: str = TCP_TRANSPORT, algorithm_channel: str = None,
+                 overload: str = OVERLOAD_LATEST, record_path: str = None):
         super().__init__()
+        self.transport = transport
+        self.algorithm_channel = algorithm_channel
+        self.overload = overload
+        self.record_path = record_path
         self.setWindowTitle("Video Registration Application")
         self.setGeometry(100, 100, 1000, 800)
 
@@ -43,13 +69,14 @@ class VideoRegistrationApp(QMainWindow):
         buttons_layout = QVBoxLayout()
         main_layout.addLayout(buttons_layout)
 
-        # Create 6 buttons
+        # Create 7 buttons
         button_texts = [
             "Init Continuous Registration",
             "Load Planning Data",
             "Start Registration",
             "Stop Registration",
             "Update Antenna Sample",
+            "Stream Antenna Samples",
             "Exit"
         ]
 
@@ -60,26 +87,63 @@ class VideoRegistrationApp(QMainWindow):
             buttons_layout.addWidget(button)
             self.buttons.append(button)
 
-        # Connect button clicks
-        self.buttons[0].clicked.connect(self.on_init_continuous_registration)
-        self.buttons[1].clicked.connect(self.on_load_planning_data)
-        self.buttons[2].clicked.connect(self.on_start_registration)
-        self.buttons[3].clicked.connect(self.on_stop_registration)
-        self.buttons[4].clicked.connect(self.on_update_antenna_sample)
-        self.buttons[5].clicked.connect(self.close)
-
-        # Video capture setup
-        self.capture = cv2.VideoCapture(0)  # Use default camera
-        self.timer = QTimer(self)
-        self.timer.timeout.connect(self.update_frame)
-        self.timer.start(30)  # 30 FPS
-
-        # Communication service
+        # Live connection and latency counters
+        self.status_label = QLabel()
+        self.status_label.setFixedWidth(250)
+        self.status_label.setWordWrap(True)
+        buttons_layout.addWidget(self.status_label)
+
+        # Connect button clicks; async slots run on the asyncio loop
+        self.buttons[0].clicked.connect(lambda: self.run_async(self.on_init_continuous_registration))
+        self.buttons[1].clicked.connect(lambda: self.run_async(self.on_load_planning_data))
+        self.buttons[2].clicked.connect(lambda: self.run_async(self.on_start_registration))
+        self.buttons[3].clicked.connect(lambda: self.run_async(self.on_stop_registration))
+        self.buttons[4].clicked.connect(lambda: self.run_async(self.on_update_antenna_sample))
+        self.buttons[5].clicked.connect(self.on_toggle_sample_stream)
+        self.buttons[6].clicked.connect(self.close)
+
+        # Frames are acquired and converted on a worker thread; the GUI
+        # thread only wraps the newest one for display
+        self.displayed_frame_id = None
+        self.frame_source = frame_source or CameraSource(0)
+        # Lumens and selections from sample responses, drawn by the pipeline.
+        # Their coordinates are pixels of the channel the algorithm reads.
+        _, (height, width, _) = self.video_channel()
+        self.overlay = OverlayRenderer(DISPLAY_SIZE, source_size=(width, height))
+        self.frame_pipeline = FramePipeline(self.frame_source,
+                                            on_frame=self.frame_ready.emit,
+                                            overlay=self.overlay)
+        self.frame_ready.connect(self.update_frame)
+        self.frame_pipeline.start()
+
+        # Communication service, kept connected on the asyncio loop thread
         self.comm_service = self.setup_communication_service()
+        self.async_bridge = AsyncBridge(self)
+        self.async_bridge.start()
+        self.connection_future = self.async_bridge.submit(self.maintain_connection())
+
+        # Optional columnar store keeping every sample response
+        self.trajectory_store = trajectory_store
+
+        # Continuous sample streaming, toggled from the GUI
+        self.stream_future = None
+        self.streamed_samples = 0
+        self.streamed_responses = 0
+        self.streamed_failures = 0
+        self.streamed_superseded = 0
+
+        self.status_timer = QTimer(self)
+        self.status_timer.timeout.connect(self.update_status)
+        self.status_timer.start(STATUS_INTERVAL_MS)
 
     def setup_communication_service(self):
         """Setup communication service"""
-        comm_service = CommunicationService()
+        comm_service = CommunicationService(transport=self.transport)
+        # Keep streamed samples current when the algorithm falls behind
+        if self.overload != 'off':
+            comm_service.enable_sample_coalescing(policy=self.overload)
+        if self.record_path:
+            comm_service.enable_recording(self.record_path)
         
         # Register message handlers
         comm_service.register_handler(
@@ -99,34 +163,126 @@ class VideoRegistrationApp(QMainWindow):
         }
         return response
 
+    async def maintain_connection(self):
+        """Keep the client connection up, reconnecting whenever it drops"""
+        while True:
+            await self.comm_service.connect_client()
+            await self.comm_service.disconnect()
+            await asyncio.sleep(RECONNECT_DELAY)
+
+    def run_async(self, slot):
+        """Run an async slot on the asyncio loop once the service is connected"""
+        async def when_connected():
+            try:
+                await asyncio.wait_for(self.comm_service.connected.wait(), CONNECT_WAIT)
+            except asyncio.TimeoutError:
+                print(f"Not connected to {self.comm_service.host}:{self.comm_service.port}")
+                return
+            await slot()
+        return self.async_bridge.submit(when_connected())
+
+    def on_toggle_sample_stream(self):
+        """Start or stop streaming antenna samples"""
+        if self.stream_future is None:
+            self.stream_future = self.async_bridge.submit(self.stream_antenna_samples())
+            self.buttons[5].setText("Stop Streaming Samples")
+        else:
+            self.stream_future.cancel()
+            self.stream_future = None
+            self.buttons[5].setText("Stream Antenna Samples")
+
+    async def stream_antenna_samples(self, rate: float = SAMPLE_STREAM_RATE):
+        """Send samples at a fixed rate without waiting for each response"""
+        loop = asyncio.get_running_loop()
+        interval = 1.0 / rate
+        due = loop.time()
+        while True:
+            if not self.comm_service.connected.is_set():
+                await self.comm_service.connected.wait()
+                due = loop.time()
+            request = UpdateAntennaSampleRequest(
+                pc_time=int(datetime.now().timestamp()),
+                cgs_time=CGSClock(),
+                cgs_sample=CGSSample()
+            )
+            try:
+                future = await self.comm_service.submit_sample(request)
+                # The overlay belongs to the frame on screen when the sample was taken
+                frame_id = self.displayed_frame_id or 0
+                future.add_done_callback(
+                    lambda done, frame_id=frame_id: self.on_streamed_sample_done(done, frame_id))
+                self.streamed_samples += 1
+            except Exception as e:
+                print(f"Error streaming antenna sample: {e}")
+            due += interval
+            await asyncio.sleep(max(0.0, due - loop.time()))
+
+    def on_streamed_sample_done(self, future: asyncio.Future, frame_id: int):
+        if not future.cancelled() and isinstance(future.exception(), SampleDropped):
+            self.streamed_superseded += 1
+        elif future.cancelled() or future.exception() is not None:
+            self.streamed_failures += 1
+        else:
+            self.streamed_responses += 1
+            self.overlay.update(future.result(), frame_id)
+            if self.trajectory_store is not None:
+                self.trajectory_store.append(future.result())
+
+    def update_status(self):
+        """Refresh the connection, in-flight and round trip counters"""
+        comm_service = self.comm_service
+        state = "connected" if comm_service.connected.is_set() else "disconnected"
+        lines = [f"{comm_service.host}:{comm_service.port} {state} ({comm_service.codec})",
+                 f"In flight: {comm_service.in_flight}",
+                 f"Streamed: {self.streamed_samples} sent, {self.streamed_responses} answered, "
+                 f"{self.streamed_failures} failed, {self.streamed_superseded} superseded"]
+        for message_type, stats in list(comm_service.metrics.types.items()):
+            if stats.requests:
+                lines.append(f"{message_type}: {stats.responses}/{stats.requests}, rtt "
+                             f"p50 {stats.round_trip.percentile(50.0) / 1000:.1f} ms, "
+                             f"p99 {stats.round_trip.percentile(99.0) / 1000:.1f} ms")
+        lines.append(f"Frame {self.displayed_frame_id}, {self.frame_pipeline.dropped} superseded")
+        if self.overlay.render_time.count:
+            lines.append(f"Overlay p99 {self.overlay.render_time.percentile(99.0):.0f} us")
+        self.status_label.setText("\n".join(lines))
+
     def update_frame(self):
-        """Update video frame"""
-        ret, frame = self.capture.read()
-        if ret:
-            # Resize frame to 720x720
-            frame = cv2.resize(frame, (720, 720))
-            
-            # Convert to RGB
-            frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            
-            # Convert to QImage
-            h, w, ch = frame_rgb.shape
-            bytes_per_line = ch * w
-            qt_image = QImage(frame_rgb.data, w, h, bytes_per_line, QImage.Format_RGB888)
-            
-            # Set pixmap
-            pixmap = QPixmap.fromImage(qt_image)
-            self.video_label.setPixmap(pixmap)
+        """Display the newest frame converted by the pipeline"""
+        frame = self.frame_pipeline.get()
+        if frame is None:
+            return
+        h, w, ch = frame.image.shape
+        qt_image = QImage(frame.image.data, w, h, ch * w, QImage.Format_RGB888)
+        # The pixmap holds its own copy, so the buffer can go back to the pipeline
+        self.video_label.setPixmap(QPixmap.fromImage(qt_image))
+        self.displayed_frame_id = frame.frame_id
+        self.frame_pipeline.release(frame)
+
+    def video_channel(self):
+        """Name and frame shape of the channel the algorithm should read frames from"""
+        if isinstance(self.frame_source, RingSource) and not self.algorithm_channel:
+            reader = self.frame_source.reader
+            return self.frame_source.name, (reader.height, reader.width, reader.channels)
+        name = self.algorithm_channel or DEFAULT_CHANNEL
+        registry = ChannelRegistry()
+        try:
+            channel = registry.lookup(name)
+        finally:
+            registry.close()
+        return name, channel.shape if channel is not None else (720, 720, 3)
 
     async def on_init_continuous_registration(self):
         """Initialize continuous registration"""
         try:
+            channel_name, (height, width, channels) = self.video_channel()
             request = InitContinuesRegistrationRequest(
                 configuration_dir_path='/path/to/config',
-                shared_memory_name='video_frame_shm',
-                frame_width=720,
-                frame_height=720
+                shared_memory_name=channel_name,
+                frame_width=width,
+                frame_height=height,
+                color_bytes=channels
             )
+            self.overlay.set_source_size((width, height))
             response = await self.comm_service.send_message(request)
             print("Init Continuous Registration Response:", response)
         except Exception as e:
@@ -175,27 +331,74 @@ class VideoRegistrationApp(QMainWindow):
                 cgs_time=CGSClock(),
                 cgs_sample=CGSSample()
             )
+            frame_id = self.displayed_frame_id or 0
             response = await self.comm_service.send_message(request)
+            self.overlay.update(response, frame_id)
+            if self.trajectory_store is not None:
+                self.trajectory_store.append(response)
             print("Update Antenna Sample Response:", response)
         except Exception as e:
             print(f"Error in update antenna sample: {e}")
 
     def closeEvent(self, event):
         """Handle application close"""
-        self.capture.release()
-        self.timer.stop()
+        self.status_timer.stop()
+        if self.stream_future is not None:
+            self.stream_future.cancel()
+        self.connection_future.cancel()
+        try:
+            self.async_bridge.run(self.comm_service.close(), timeout=2.0)
+        except Exception as e:
+            print(f"Error closing communication service: {e}")
+        self.async_bridge.stop()
+        if self.trajectory_store is not None:
+            print(f"Stored {len(self.trajectory_store)} responses in {self.trajectory_store.path}")
+            self.trajectory_store.close()
+        self.frame_pipeline.stop()
+        print(f"Displayed frames: {self.frame_pipeline.frames} converted, "
+              f"{self.frame_pipeline.dropped} superseded, {self.frame_pipeline.torn} torn")
         event.accept()
 
+def parse_args(argv) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Video registration simulator")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument('--camera', type=int, default=0, help="Camera index")
+    source.add_argument('--file', help="Video file, looped at its native rate")
+    source.add_argument('--ring', help="Name of a frame channel published by a loader")
+    parser.add_argument('shared_memory_name', nargs='?', help="Same as --ring")
+    parser.add_argument('--store', help="Trajectory store directory to append responses to")
+    parser.add_argument('--transport', choices=TRANSPORTS, default=TCP_TRANSPORT,
+                        help="How to reach the algorithm; shm needs it on this host")
+    parser.add_argument('--algorithm-channel',
+                        help="Frame channel to hand the algorithm, e.g. a loader variant "
+                             "such as video.roi; default the displayed one")
+    parser.add_argument('--overload', choices=('off',) + OVERLOAD_POLICIES, default=OVERLOAD_LATEST,
+                        help="What happens to streamed samples the algorithm cannot keep up with")
+    parser.add_argument('--record', help="Session log to record every message to, for replay")
+    args, _ = parser.parse_known_args(argv)
+    return args
+
+def frame_source_from_args(args: argparse.Namespace) -> FrameSource:
+    """Webcam, video file or the shared memory ring written by video_loader_writer"""
+    if args.ring or args.shared_memory_name:
+        return RingSource(args.ring or args.shared_memory_name, timeout=CHANNEL_WAIT)
+    if args.file:
+        return FileSource(args.file)
+    return CameraSource(args.camera)
+
+def trajectory_store_from_args(args: argparse.Namespace) -> TrajectoryStore:
+    """Store for sample responses, if --store was given"""
+    return TrajectoryStore(args.store, 'a') if args.store else None
+
 def run_app():
     """Run the application"""
-    import asyncio
-    
-    # Create event loop
-    loop = asyncio.get_event_loop()
-    
-    # Create application
+    # Create application; the asyncio loop is started by the window's AsyncBridge
     app = QApplication(sys.argv)
-    window = VideoRegistrationApp()
+
+    args = parse_args(sys.argv[1:])
+    window = VideoRegistrationApp(frame_source_from_args(args), trajectory_store_from_args(args),
+                                  args.transport, args.algorithm_channel, args.overload,
+                                  args.record)
     window.show()
     
     # Run the event loop
@@ -0,0 +1,303 @@
+import argparse
+import os
+import tempfile
+import time
+from multiprocessing import resource_tracker, shared_memory
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from video.frame_ring import FrameRingReader, pid_alive
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+REGISTRY_ENV = 'ALGO_SIM_CHANNEL_REGISTRY'
+DEFAULT_REGISTRY_NAME = 'algo_sim_channels'
+DEFAULT_CAPACITY = 64
+REGISTRY_MAGIC = 0x4C4E484353  # 'SCHNL'
+HEADER_WORDS = 8
+HDR_MAGIC = 0
+HDR_CAPACITY = 1
+MAX_NAME_BYTES = 63
+ATTACH_POLL_INTERVAL = 0.05
+
+ENTRY_DTYPE = np.dtype([
+    ('name', f'S{MAX_NAME_BYTES + 1}'),
+    ('dtype', 'S16'),
+    ('height', '<i8'),
+    ('width', '<i8'),
+    ('channels', '<i8'),
+    ('fps', '<f8'),
+    ('pid', '<i8'),
+    ('created_ns', '<i8'),
+])
+
+
+class ChannelExistsError(FileExistsError):
+    """A live producer already publishes a channel of that name"""
+
+
+class Channel:
+    """A registry entry: one producer publishing frames into a named frame ring"""
+    __slots__ = ('name', 'shape', 'dtype', 'fps', 'pid', 'created_ns')
+
+    def __init__(self, name: str, shape: Tuple[int, int, int], dtype: str, fps: float,
+                 pid: int, created_ns: int):
+        self.name = name
+        self.shape = shape
+        self.dtype = dtype
+        self.fps = fps
+        self.pid = pid
+        self.created_ns = created_ns
+
+    @property
+    def alive(self) -> bool:
+        return pid_alive(self.pid)
+
+    def to_dict(self) -> dict:
+        return {'name': self.name, 'shape': list(self.shape), 'dtype': self.dtype,
+                'fps': self.fps, 'pid': self.pid, 'created_ns': self.created_ns}
+
+    def __repr__(self):
+        return (f'Channel({self.name!r}, shape={self.shape}, dtype={self.dtype!r}, '
+                f'fps={self.fps:g}, pid={self.pid})')
+
+
+class _RegistryLock:
+    """Exclusive lock across processes, on a lock file next to the registry"""
+    def __init__(self, path: str):
+        self.path = path
+        self._file = None
+
+    def __enter__(self):
+        self._file = open(self.path, 'a+b')
+        if fcntl is not None:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+        else:
+            self._file.seek(0)
+            msvcrt.locking(self._file.fileno(), msvcrt.LK_LOCK, 1)
+        return self
+
+    def __exit__(self, *exc_info):
+        if fcntl is not None:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+        else:
+            self._file.seek(0)
+            msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+        self._file.close()
+        self._file = None
+
+
+def unlink_segment(name: str) -> bool:
+    """Remove a shared memory segment by name; False if there was none"""
+    try:
+        shm = shared_memory.SharedMemory(name=name)
+    except FileNotFoundError:
+        return False
+    shm.close()
+    shm.unlink()
+    return True
+
+
+class ChannelRegistry:
+    """Small shared memory table of the frame channels published on this host.
+
+    Every producer lists its channel here under the name of its frame ring,
+    with the frame shape, dtype, rate and its pid, so consumers can find
+    channels by name instead of agreeing on segment names up front. The
+    table is created by whichever process gets there first and outlives
+    it. Entries whose producer has died are treated as absent, and prune()
+    removes them together with the ring segment they left behind.
+    """
+    def __init__(self, name: str = None, capacity: int = DEFAULT_CAPACITY):
+        self.name = name or os.environ.get(REGISTRY_ENV, DEFAULT_REGISTRY_NAME)
+        self._lock = _RegistryLock(os.path.join(tempfile.gettempdir(), f'{self.name}.lock'))
+        with self._lock:
+            try:
+                self._shm = shared_memory.SharedMemory(name=self.name)
+            except FileNotFoundError:
+                self._shm = shared_memory.SharedMemory(
+                    name=self.name, create=True,
+                    size=HEADER_WORDS * 8 + capacity * ENTRY_DTYPE.itemsize)
+                header = np.ndarray((HEADER_WORDS,), dtype=np.int64, buffer=self._shm.buf)
+                header[:] = 0
+                np.ndarray((capacity,), dtype=ENTRY_DTYPE, buffer=self._shm.buf,
+                           offset=HEADER_WORDS * 8)[:] = np.zeros(1, dtype=ENTRY_DTYPE)
+                header[HDR_CAPACITY] = capacity
+                header[HDR_MAGIC] = REGISTRY_MAGIC
+                del header
+            # The table is shared by every process, none of them may remove it on exit
+            resource_tracker.unregister(self._shm._name, 'shared_memory')
+        self._header = np.ndarray((HEADER_WORDS,), dtype=np.int64, buffer=self._shm.buf)
+        if int(self._header[HDR_MAGIC]) != REGISTRY_MAGIC:
+            self.close()
+            raise ValueError(f"Shared memory '{self.name}' is not a channel registry")
+        self.capacity = int(self._header[HDR_CAPACITY])
+        self._entries = np.ndarray((self.capacity,), dtype=ENTRY_DTYPE, buffer=self._shm.buf,
+                                   offset=HEADER_WORDS * 8)
+
+    @staticmethod
+    def _channel(entry) -> Channel:
+        return Channel(entry['name'].decode(), (int(entry['height']), int(entry['width']),
+                                                int(entry['channels'])),
+                       entry['dtype'].decode(), float(entry['fps']), int(entry['pid']),
+                       int(entry['created_ns']))
+
+    def _find(self, name: str) -> Optional[int]:
+        matches = np.flatnonzero((self._entries['name'] == name.encode())
+                                 & (self._entries['pid'] != 0))
+        return int(matches[0]) if len(matches) else None
+
+    def _remove_stale(self, index: int) -> str:
+        """Clear a dead producer's entry and the ring it left; caller holds the lock"""
+        name = self._entries[index]['name'].decode()
+        self._entries[index] = np.zeros(1, dtype=ENTRY_DTYPE)
+        unlink_segment(name)
+        return name
+
+    def claim(self, name: str):
+        """Make sure a channel name is free before creating its ring.
+
+        Raises ChannelExistsError if a live producer publishes it. A channel
+        left behind by a crashed producer is removed along with its ring.
+        """
+        if len(name.encode()) > MAX_NAME_BYTES:
+            raise ValueError(f"Channel name '{name}' is longer than {MAX_NAME_BYTES} bytes")
+        with self._lock:
+            index = self._find(name)
+            if index is not None:
+                pid = int(self._entries[index]['pid'])
+                if pid != os.getpid() and pid_alive(pid):
+                    raise ChannelExistsError(f"Channel '{name}' is published by pid {pid}")
+                self._remove_stale(index)
+
+    def publish(self, name: str, shape: Tuple[int, int, int], fps: float,
+                dtype: str = 'uint8', pid: int = None) -> Channel:
+        """List a channel whose ring has been created by this process"""
+        if len(name.encode()) > MAX_NAME_BYTES:
+            raise ValueError(f"Channel name '{name}' is longer than {MAX_NAME_BYTES} bytes")
+        pid = pid or os.getpid()
+        with self._lock:
+            index = self._find(name)
+            if index is not None:
+                existing = int(self._entries[index]['pid'])
+                if existing != pid and pid_alive(existing):
+                    raise ChannelExistsError(f"Channel '{name}' is published by pid {existing}")
+            else:
+                free = np.flatnonzero(self._entries['pid'] == 0)
+                if not len(free):
+                    free = [index for index, entry in enumerate(self._entries)
+                            if not pid_alive(int(entry['pid']))]
+                    if not free:
+                        raise RuntimeError(f"Channel registry '{self.name}' is full")
+                    self._remove_stale(free[0])
+                index = int(free[0])
+            height, width, channels = shape
+            self._entries[index] = (name.encode(), dtype.encode(), height, width, channels,
+                                    fps, pid, time.time_ns())
+            return self._channel(self._entries[index])
+
+    def unpublish(self, name: str):
+        """Remove a channel's entry; its producer unlinks the ring itself"""
+        with self._lock:
+            index = self._find(name)
+            if index is not None:
+                self._entries[index] = np.zeros(1, dtype=ENTRY_DTYPE)
+
+    def _live(self) -> List[Channel]:
+        return [channel for channel in map(self._channel, self._entries)
+                if channel.pid and channel.alive]
+
+    def channels(self) -> List[Channel]:
+        """Channels whose producer is still running"""
+        with self._lock:
+            return self._live()
+
+    def lookup(self, name: str) -> Optional[Channel]:
+        with self._lock:
+            index = self._find(name)
+            if index is None:
+                return None
+            channel = self._channel(self._entries[index])
+            return channel if channel.alive else None
+
+    def is_stale(self, name: str) -> bool:
+        """Whether a channel is listed but its producer has died"""
+        with self._lock:
+            index = self._find(name)
+            return index is not None and not pid_alive(int(self._entries[index]['pid']))
+
+    def wait_for(self, name: str, timeout: float = None) -> Optional[Channel]:
+        """Wait until a channel is published; None on timeout"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            channel = self.lookup(name)
+            if channel is not None:
+                return channel
+            if deadline is not None and time.monotonic() >= deadline:
+                return None
+            time.sleep(ATTACH_POLL_INTERVAL)
+
+    def prune(self) -> List[str]:
+        """Remove channels of producers that died, unlinking their rings"""
+        with self._lock:
+            return [self._remove_stale(index) for index, entry in enumerate(self._entries)
+                    if entry['pid'] and not pid_alive(int(entry['pid']))]
+
+    def close(self):
+        self._header = self._entries = None
+        self._shm.close()
+
+
+def open_channel(name: str, timeout: float = None,
+                 registry: ChannelRegistry = None) -> FrameRingReader:
+    """Attach a ring reader to a channel, waiting up to timeout for it to be published.
+
+    Rings created without the registry can still be attached by name.
+    """
+    owned = registry is None
+    registry = registry or ChannelRegistry()
+    try:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            # A crashed producer's ring may linger until pruned; never attach to it
+            if not registry.is_stale(name):
+                try:
+                    return FrameRingReader(name)
+                except (FileNotFoundError, ValueError):
+                    pass  # Not created yet, or its header is not written yet
+            if deadline is not None and time.monotonic() >= deadline:
+                raise FileNotFoundError(f"No frame channel '{name}'")
+            time.sleep(ATTACH_POLL_INTERVAL)
+    finally:
+        if owned:
+            registry.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="List or clean up shared memory frame channels")
+    parser.add_argument('--registry', help=f"Registry name (default ${REGISTRY_ENV} or "
+                                           f"{DEFAULT_REGISTRY_NAME})")
+    parser.add_argument('--prune', action='store_true',
+                        help="Remove channels left behind by crashed producers")
+    args = parser.parse_args()
+
+    registry = ChannelRegistry(args.registry)
+    try:
+        if args.prune:
+            for name in registry.prune():
+                print(f"Removed stale channel {name}")
+        for channel in registry.channels():
+            height, width, channels = channel.shape
+            print(f"{channel.name:<32}{width}x{height}x{channels} {channel.dtype:<8}"
+                  f"{channel.fps:>8.2f} fps  pid {channel.pid}")
+    finally:
+        registry.close()
+
+
+if __name__ == '__main__':
+    main()
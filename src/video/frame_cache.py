@@ -0,0 +1,235 @@
+import argparse
+import hashlib
+import mmap
+import os
+import struct
+from typing import List, Optional
+
+import cv2
+import numpy as np
+
+# Cache file: header, padding up to DATA_OFFSET, then raw uint8 frames back
+# to back. Files are written under a temporary name and renamed once
+# complete, so a partially decoded video is never served.
+CACHE_MAGIC = b'SIMFRM01'
+# magic, height, width, channels, reserved, fps, frame count
+CACHE_HEADER = struct.Struct('<8sIIIIdQ')
+DATA_OFFSET = 64
+CACHE_SUFFIX = '.frames'
+
+CACHE_DIR_ENV = 'ALGO_SIM_FRAME_CACHE'
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'algo_simulator', 'frames')
+DEFAULT_MAX_BYTES = 8 * 1024 ** 3
+
+
+def video_key(video_path: str) -> str:
+    """Cache key of a video; changes whenever the file is replaced or modified"""
+    stat = os.stat(video_path)
+    identity = f'{os.path.abspath(video_path)}|{stat.st_mtime_ns}|{stat.st_size}'
+    return hashlib.sha1(identity.encode()).hexdigest()
+
+
+class CachedVideo:
+    """Decoded frames of one video, memory-mapped from the cache.
+
+    Besides indexed access to `frames`, it mimics the parts of
+    cv2.VideoCapture the loader uses (read, get, set, release), so either
+    can serve as the frame source.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as cache_file:
+            self._mmap = mmap.mmap(cache_file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.height, self.width, self.channels, _, self.fps, self.frame_count = \
+            CACHE_HEADER.unpack_from(self._mmap, 0)
+        if magic != CACHE_MAGIC:
+            self._mmap.close()
+            raise ValueError(f"{path} is not a frame cache file")
+        self.frames = np.frombuffer(self._mmap, dtype=np.uint8, offset=DATA_OFFSET,
+                                    count=self.frame_count * self.frame_size)
+        self.frames = self.frames.reshape(self.frame_count, self.height, self.width, self.channels)
+        self.position = 0
+
+    @property
+    def frame_size(self) -> int:
+        return self.height * self.width * self.channels
+
+    def __len__(self) -> int:
+        return self.frame_count
+
+    def __getitem__(self, index: int) -> np.ndarray:
+        return self.frames[index]
+
+    def isOpened(self) -> bool:
+        return self._mmap is not None
+
+    def read(self, image: np.ndarray = None):
+        """Copy the next frame into `image`, or return a read-only view of it"""
+        if self.position >= self.frame_count:
+            return False, None
+        frame = self.frames[self.position]
+        self.position += 1
+        if image is None:
+            return True, frame
+        np.copyto(image, frame)
+        return True, image
+
+    def get(self, prop: int) -> float:
+        values = {cv2.CAP_PROP_FRAME_WIDTH: self.width,
+                  cv2.CAP_PROP_FRAME_HEIGHT: self.height,
+                  cv2.CAP_PROP_FRAME_COUNT: self.frame_count,
+                  cv2.CAP_PROP_FPS: self.fps,
+                  cv2.CAP_PROP_POS_FRAMES: self.position}
+        return float(values.get(prop, 0.0))
+
+    def set(self, prop: int, value: float) -> bool:
+        if prop != cv2.CAP_PROP_POS_FRAMES:
+            return False
+        self.position = min(max(int(value), 0), self.frame_count)
+        return True
+
+    def release(self):
+        if self._mmap is not None:
+            # Views into the map must be dropped before it can be closed
+            self.frames = None
+            self._mmap.close()
+            self._mmap = None
+
+    close = release
+
+
+class FrameCache:
+    """Decodes videos once into raw memory-mapped frame files.
+
+    Entries are keyed by video path, mtime and size, so an edited video is
+    decoded again. The total size is capped at `max_bytes`; the least
+    recently used entries are evicted first, with the cache file's mtime
+    serving as its last use time.
+    """
+    def __init__(self, cache_dir: str = None, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir or os.environ.get(CACHE_DIR_ENV, DEFAULT_CACHE_DIR)
+        self.max_bytes = max_bytes
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def path_for(self, video_path: str) -> str:
+        return os.path.join(self.cache_dir, video_key(video_path) + CACHE_SUFFIX)
+
+    def get(self, video_path: str) -> Optional[CachedVideo]:
+        """The cached frames of a video, or None on a miss"""
+        path = self.path_for(video_path)
+        try:
+            cached = CachedVideo(path)
+        except (FileNotFoundError, ValueError, struct.error):
+            return None
+        os.utime(path)
+        return cached
+
+    def open(self, video_path: str) -> Optional[CachedVideo]:
+        """The cached frames of a video, decoding it first on a miss.
+
+        Returns None if the video cannot be opened or does not fit in the cache.
+        """
+        cached = self.get(video_path)
+        if cached is None and self.build(video_path):
+            cached = self.get(video_path)
+        return cached
+
+    def build(self, video_path: str) -> bool:
+        """Decode a video into the cache; returns whether an entry was written"""
+        cap = cv2.VideoCapture(video_path)
+        if not cap.isOpened():
+            return False
+
+        width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        estimated_size = DATA_OFFSET + int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) * width * height * 3
+        if estimated_size > self.max_bytes:
+            cap.release()
+            return False
+        self.evict(self.max_bytes - estimated_size)
+
+        path = self.path_for(video_path)
+        temp_path = f'{path}.{os.getpid()}.tmp'
+        frame_count = channels = 0
+        try:
+            with open(temp_path, 'wb') as cache_file:
+                cache_file.seek(DATA_OFFSET)
+                while True:
+                    ret, frame = cap.read()
+                    if not ret:
+                        break
+                    channels = frame.shape[2] if frame.ndim == 3 else 1
+                    cache_file.write(memoryview(np.ascontiguousarray(frame)).cast('B'))
+                    frame_count += 1
+                cache_file.seek(0)
+                cache_file.write(CACHE_HEADER.pack(CACHE_MAGIC, height, width, channels, 0,
+                                                   fps, frame_count))
+            os.replace(temp_path, path)
+        finally:
+            cap.release()
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        return True
+
+    def prewarm(self, video_paths: List[str]) -> List[str]:
+        """Make sure the given videos are cached; returns those that are"""
+        warmed = []
+        for video_path in video_paths:
+            cached = self.open(video_path)
+            if cached is not None:
+                cached.release()
+                warmed.append(video_path)
+        return warmed
+
+    def entries(self) -> List[os.DirEntry]:
+        """Cache files, least recently used first"""
+        entries = [entry for entry in os.scandir(self.cache_dir)
+                   if entry.name.endswith(CACHE_SUFFIX)]
+        return sorted(entries, key=lambda entry: entry.stat().st_mtime_ns)
+
+    @property
+    def size(self) -> int:
+        return sum(entry.stat().st_size for entry in self.entries())
+
+    def evict(self, target_bytes: int = None):
+        """Remove least recently used entries until at most target_bytes remain.
+
+        Readers that still have an entry mapped keep their frames; the file
+        is only released once they close it.
+        """
+        if target_bytes is None:
+            target_bytes = self.max_bytes
+        entries = self.entries()
+        total = sum(entry.stat().st_size for entry in entries)
+        for entry in entries:
+            if total <= target_bytes:
+                break
+            total -= entry.stat().st_size
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+
+    def clear(self):
+        self.evict(0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the decoded video frame cache")
+    parser.add_argument('videos', nargs='*', help="Videos to pre-warm")
+    parser.add_argument('--cache-dir', default=None)
+    parser.add_argument('--max-gb', type=float, default=DEFAULT_MAX_BYTES / 1024 ** 3)
+    parser.add_argument('--clear', action='store_true', help="Remove every cached video")
+    args = parser.parse_args()
+
+    cache = FrameCache(args.cache_dir, int(args.max_gb * 1024 ** 3))
+    if args.clear:
+        cache.clear()
+    for video_path in cache.prewarm(args.videos):
+        print(f"Cached {video_path}")
+    print(f"{len(cache.entries())} videos, {cache.size / 1024 ** 2:.1f} MB in {cache.cache_dir}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,306 @@
+import argparse
+import io
+import os
+import time
+from typing import Optional, Union
+
+import cv2
+import numpy as np
+
+from video.frame_cache import video_key
+
+# Index file next to the video: an .npz archive of per frame arrays
+INDEX_SUFFIX = '.frameindex'
+INDEX_VERSION = 1
+# Seeks that land somewhere unexpected are retried this many key frames earlier
+SEEK_RETRIES = 3
+
+
+def index_path(video_path: str) -> str:
+    return video_path + INDEX_SUFFIX
+
+
+def parse_position(position: Union[int, str], index: 'FrameIndex') -> int:
+    """Frame number of a position given as a frame number or a time.
+
+    Plain integers are frame numbers. Times may be given in seconds with
+    an 's' suffix ('12.5s') or as [hh:]mm:ss[.fff] ('40:00').
+    """
+    if isinstance(position, int):
+        return position
+    text = position.strip()
+    if text.endswith('s'):
+        return index.frame_at_time(float(text[:-1]))
+    if ':' in text:
+        seconds = 0.0
+        for part in text.split(':'):
+            seconds = seconds * 60 + float(part)
+        return index.frame_at_time(seconds)
+    return int(text)
+
+
+class FrameIndex:
+    """Per frame presentation times and key frame positions of a video.
+
+    Built once by reading the video's packets without decoding them, and
+    stored next to the video so later runs load it instantly. It is
+    rebuilt whenever the video file changes. Seeking to any frame costs
+    at most one GOP of decoding: jump to the key frame before it, then
+    decode forward.
+    """
+    def __init__(self, video_id: str, fps: float, width: int, height: int,
+                 pts: np.ndarray, times_ms: np.ndarray, keyframes: np.ndarray,
+                 packet_sizes: np.ndarray):
+        self.video_id = video_id
+        self.fps = fps
+        self.width = width
+        self.height = height
+        self.pts = pts
+        self.times_ms = times_ms
+        self.keyframes = keyframes
+        self.packet_sizes = packet_sizes
+
+    def __len__(self) -> int:
+        return len(self.pts)
+
+    @property
+    def frame_count(self) -> int:
+        return len(self.pts)
+
+    @property
+    def duration(self) -> float:
+        """Seconds from the first frame to the end of the last one"""
+        if not len(self.times_ms):
+            return 0.0
+        return (self.times_ms[-1] - self.times_ms[0]) / 1000 + 1 / (self.fps or 1)
+
+    @property
+    def max_gop(self) -> int:
+        """Most frames decoded to reach any frame after a key frame seek"""
+        if not len(self.keyframes):
+            return self.frame_count
+        return int(np.diff(np.append(self.keyframes, self.frame_count)).max())
+
+    @classmethod
+    def build(cls, video_path: str) -> 'FrameIndex':
+        """Scan a video's packets, demuxing without decoding"""
+        cap = cv2.VideoCapture(video_path)
+        if not cap.isOpened():
+            raise IOError(f"Could not open video {video_path}")
+        try:
+            fps = cap.get(cv2.CAP_PROP_FPS)
+            width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+            height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+            # Raw mode hands out the encoded packets instead of decoded frames
+            if not cap.set(cv2.CAP_PROP_FORMAT, -1):
+                raise IOError(f"Cannot read the packets of {video_path}")
+            pts, times_ms, is_key, sizes = [], [], [], []
+            while True:
+                ret, packet = cap.read()
+                if not ret:
+                    break
+                is_key.append(bool(cap.get(cv2.CAP_PROP_LRF_HAS_KEY_FRAME)))
+                pts.append(int(cap.get(cv2.CAP_PROP_PTS)))
+                times_ms.append(cap.get(cv2.CAP_PROP_POS_MSEC))
+                sizes.append(packet.size if packet is not None else 0)
+        finally:
+            cap.release()
+        # Packets come in decode order; frame numbers count in display order
+        pts = np.array(pts, dtype=np.int64)
+        order = np.argsort(pts, kind='stable')
+        return cls(video_key(video_path), fps, width, height, pts[order],
+                   np.array(times_ms, dtype=np.float64)[order],
+                   np.flatnonzero(np.array(is_key, dtype=bool)[order]),
+                   np.array(sizes, dtype=np.int64)[order])
+
+    def save(self, path: str):
+        """Write the index, replacing any previous one in a single rename"""
+        buffer = io.BytesIO()
+        np.savez(buffer, version=INDEX_VERSION, video_id=self.video_id, fps=self.fps,
+                 width=self.width, height=self.height, pts=self.pts, times_ms=self.times_ms,
+                 keyframes=self.keyframes, packet_sizes=self.packet_sizes)
+        temp_path = f'{path}.{os.getpid()}.tmp'
+        with open(temp_path, 'wb') as index_file:
+            index_file.write(buffer.getbuffer())
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> 'FrameIndex':
+        with np.load(path) as data:
+            if int(data['version']) != INDEX_VERSION:
+                raise ValueError(f"{path} is not a version {INDEX_VERSION} frame index")
+            return cls(str(data['video_id']), float(data['fps']), int(data['width']),
+                       int(data['height']), data['pts'], data['times_ms'], data['keyframes'],
+                       data['packet_sizes'])
+
+    @classmethod
+    def for_video(cls, video_path: str) -> 'FrameIndex':
+        """The stored index of a video, building and storing it if missing or stale"""
+        path = index_path(video_path)
+        try:
+            index = cls.load(path)
+            if index.video_id == video_key(video_path):
+                return index
+        except (FileNotFoundError, ValueError, KeyError, OSError):
+            pass
+        index = cls.build(video_path)
+        try:
+            index.save(path)
+        except OSError as e:
+            print(f"Could not store frame index next to {video_path}: {e}")
+        return index
+
+    def keyframe_before(self, frame: int) -> int:
+        """Last key frame at or before a frame"""
+        position = int(np.searchsorted(self.keyframes, frame, side='right')) - 1
+        return int(self.keyframes[position]) if position >= 0 else 0
+
+    def frame_at_time(self, seconds: float) -> int:
+        """Frame on screen `seconds` after the first frame"""
+        if not len(self.times_ms):
+            return 0
+        target = self.times_ms[0] + seconds * 1000
+        # Allow for float rounding in the times read back from the container
+        frame = int(np.searchsorted(self.times_ms, target + 1e-6, side='right')) - 1
+        return min(max(frame, 0), self.frame_count)
+
+    def time_of(self, frame: int) -> float:
+        """Seconds from the first frame to a frame"""
+        return (self.times_ms[frame] - self.times_ms[0]) / 1000
+
+    def frame_of_pts(self, pts: int) -> Optional[int]:
+        frame = int(np.searchsorted(self.pts, pts))
+        return frame if frame < len(self.pts) and self.pts[frame] == pts else None
+
+
+class IndexedVideo:
+    """A video capture whose frame seeks go through a FrameIndex.
+
+    Mimics the parts of cv2.VideoCapture the loader uses (read, get, set,
+    release), like CachedVideo. Setting CAP_PROP_POS_FRAMES jumps to the
+    key frame before the target and decodes forward from there, checking
+    where the jump actually landed by the frame's presentation timestamp.
+    Containers that seek inexactly are retried from earlier key frames,
+    and decoded from the start as a last resort.
+    """
+    def __init__(self, video_path: str, index: FrameIndex = None):
+        self.video_path = video_path
+        self.index = index or FrameIndex.for_video(video_path)
+        self.capture = cv2.VideoCapture(video_path)
+        # Frame the next read returns
+        self.position = 0
+        # Whether that frame has been grabbed already and only needs retrieving
+        self._grabbed = False
+        self.seeks = 0
+        self.frames_skipped = 0
+        self.seek_time = 0.0
+
+    def isOpened(self) -> bool:
+        return self.capture.isOpened()
+
+    def read(self, image: np.ndarray = None):
+        if self._grabbed:
+            self._grabbed = False
+            ret, image = self.capture.retrieve(image)
+        else:
+            ret, image = self.capture.read(image)
+        if ret:
+            self.position += 1
+        return ret, image
+
+    def get(self, prop: int) -> float:
+        if prop == cv2.CAP_PROP_POS_FRAMES:
+            return float(self.position)
+        if prop == cv2.CAP_PROP_FRAME_COUNT:
+            return float(self.index.frame_count)
+        return self.capture.get(prop)
+
+    def set(self, prop: int, value: float) -> bool:
+        if prop != cv2.CAP_PROP_POS_FRAMES:
+            return self.capture.set(prop, value)
+        self.seek(int(value))
+        return True
+
+    def seek(self, frame: int):
+        """Position the capture so the next read returns `frame`"""
+        started = time.perf_counter()
+        frame = min(max(frame, 0), self.index.frame_count)
+        if frame != self.position:
+            if self.position < frame <= self.position + self.index.max_gop:
+                # Decoding forward is no dearer than a jump
+                self._skip_to(frame)
+            else:
+                self._jump_to(frame)
+        self.seeks += 1
+        self.seek_time += time.perf_counter() - started
+
+    def _jump_to(self, frame: int):
+        keyframe = self.index.keyframe_before(frame)
+        for _ in range(SEEK_RETRIES):
+            self.capture.set(cv2.CAP_PROP_POS_FRAMES, keyframe)
+            self._grabbed = self.capture.grab()
+            landed = self.index.frame_of_pts(int(self.capture.get(cv2.CAP_PROP_PTS))) \
+                if self._grabbed else None
+            if landed is not None and landed <= frame:
+                self.position = landed
+                self._skip_to(frame)
+                return
+            if keyframe == 0:
+                break
+            keyframe = self.index.keyframe_before(keyframe - 1)
+        # The container cannot be trusted to seek at all: decode from the start
+        self.capture.release()
+        self.capture = cv2.VideoCapture(self.video_path)
+        self.position = 0
+        self._grabbed = False
+        self._skip_to(frame)
+
+    def _skip_to(self, frame: int):
+        """Decode forward to a frame without converting any to BGR"""
+        while self.position < frame:
+            if not self.capture.grab():
+                self._grabbed = False
+                break
+            self.position += 1
+            self.frames_skipped += 1
+
+    def release(self):
+        self.capture.release()
+
+    close = release
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build a video's frame index and time seeks")
+    parser.add_argument('video')
+    parser.add_argument('--rebuild', action='store_true', help="Ignore a stored index")
+    parser.add_argument('--seek', nargs='*', default=[],
+                        help="Positions to seek to: frame numbers, 12.5s or mm:ss")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    if args.rebuild:
+        index = FrameIndex.build(args.video)
+        index.save(index_path(args.video))
+    else:
+        index = FrameIndex.for_video(args.video)
+    elapsed = (time.perf_counter() - started) * 1e3
+    print(f"{index.frame_count} frames, {index.duration:.1f} s at {index.fps:.2f} fps, "
+          f"{len(index.keyframes)} key frames, longest GOP {index.max_gop} frames "
+          f"({elapsed:.1f} ms to load or build)")
+
+    if args.seek:
+        video = IndexedVideo(args.video, index)
+        for position in args.seek:
+            frame = parse_position(position, index)
+            started = time.perf_counter()
+            video.seek(frame)
+            ret, _ = video.read()
+            elapsed = (time.perf_counter() - started) * 1e3
+            print(f"{position}: frame {frame} at {index.time_of(min(frame, len(index) - 1)):.3f} s "
+                  f"read in {elapsed:.1f} ms" + ("" if ret else " (past the end)"))
+        video.release()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+import math
+import time
+
+from comm.metrics import LatencyHistogram
+
+# Sleeping overshoots by up to a scheduler tick, so the last stretch before
+# a deadline is spent spinning instead.
+SPIN_THRESHOLD_NS = 200_000
+UNPACED = 0
+
+
+class FramePacer:
+    """Releases frames on a fixed schedule of monotonic deadlines.
+
+    Frame n is due at start + n * interval, so time spent decoding,
+    copying or waiting never accumulates into drift. When the producer
+    falls more than `max_lag` intervals behind, the schedule is rebased
+    instead of publishing a burst of frames to catch up. A target fps of
+    UNPACED releases frames as fast as they are produced.
+    """
+    def __init__(self, fps: float, speed: float = 1.0, max_lag: float = 1.0):
+        if fps < 0 or speed <= 0:
+            raise ValueError("fps must be non-negative and speed positive")
+        self.fps = fps
+        self.speed = speed
+        self.max_lag = max_lag
+        self.interval_ns = int(1e9 / (fps * speed)) if fps else 0
+        self.lateness = LatencyHistogram()
+        self.frames = 0
+        self.late_frames = 0
+        self.rebases = 0
+        self._start_ns = None
+        self._first_ns = None
+        self._last_ns = None
+        self._index = 0
+        self._interval_sum = 0.0
+        self._interval_squares = 0.0
+
+    @property
+    def target_fps(self) -> float:
+        return self.fps * self.speed
+
+    def wait(self) -> int:
+        """Block until the next frame is due; returns the release time in ns"""
+        now = time.monotonic_ns()
+        if self._start_ns is None:
+            self._start_ns = now
+        if self.interval_ns:
+            deadline = self._start_ns + self._index * self.interval_ns
+            if now - deadline > self.max_lag * self.interval_ns:
+                self._start_ns = now - self._index * self.interval_ns
+                deadline = now
+                self.rebases += 1
+            remaining = deadline - now
+            if remaining > SPIN_THRESHOLD_NS:
+                time.sleep((remaining - SPIN_THRESHOLD_NS) / 1e9)
+            while time.monotonic_ns() < deadline:
+                pass
+            now = time.monotonic_ns()
+            late = now - deadline
+            self.lateness.record(late / 1000)
+            if late > self.interval_ns // 2:
+                self.late_frames += 1
+        self._index += 1
+        self._released(now)
+        return now
+
+    def _released(self, now: int):
+        if self._last_ns is not None:
+            interval = (now - self._last_ns) / 1e6
+            self._interval_sum += interval
+            self._interval_squares += interval * interval
+        else:
+            self._first_ns = now
+        self._last_ns = now
+        self.frames += 1
+
+    def stats(self) -> dict:
+        """Achieved rate, inter-frame interval spread and lateness against the schedule"""
+        intervals = self.frames - 1
+        mean = self._interval_sum / intervals if intervals > 0 else 0.0
+        variance = self._interval_squares / intervals - mean * mean if intervals > 0 else 0.0
+        elapsed = (self._last_ns - self._first_ns) / 1e9 if intervals > 0 else 0.0
+        return {
+            'frames': self.frames,
+            'target_fps': self.target_fps,
+            'achieved_fps': intervals / elapsed if elapsed > 0 else 0.0,
+            'interval_mean_ms': mean,
+            'interval_jitter_ms': math.sqrt(max(variance, 0.0)),
+            'lateness_us': self.lateness.snapshot(),
+            'late_frames': self.late_frames,
+            'rebases': self.rebases,
+        }
@@ -0,0 +1,410 @@
+import os
+import time
+from multiprocessing import resource_tracker, shared_memory
+from typing import List, Optional
+
+import numpy as np
+
+# Shared memory layout, all headers are int64 words:
+#   ring header    RING_HEADER_WORDS
+#   reader table   MAX_READERS * READER_WORDS
+#   slot headers   slots * SLOT_HEADER_WORDS
+#   slot data      slots * slot_bytes (each slot starts on a 64 byte boundary)
+RING_MAGIC = 0x474E495246  # 'FRING'
+RING_HEADER_WORDS = 16
+HDR_MAGIC = 0
+HDR_SLOTS = 1
+HDR_SLOT_BYTES = 2
+HDR_HEIGHT = 3
+HDR_WIDTH = 4
+HDR_CHANNELS = 5
+HDR_LATEST = 6
+HDR_STATE = 7
+HDR_COLOR = 8
+
+# Pixel formats, stored in the header as their index; old rings read as BGR
+COLORS = ('bgr', 'rgb', 'gray')
+
+STATE_RUNNING = 1
+STATE_ENDED = 2
+
+MAX_READERS = 16
+READER_WORDS = 4
+RDR_PID = 0
+RDR_LAST_FRAME_ID = 1
+RDR_DROPPED = 2
+RDR_ACKED = 3
+
+SLOT_HEADER_WORDS = 8
+SLOT_SEQ = 0
+SLOT_FRAME_ID = 1
+SLOT_TIMESTAMP = 2
+SLOT_HEIGHT = 3
+SLOT_WIDTH = 4
+SLOT_CHANNELS = 5
+
+ALIGNMENT = 64
+POLL_INTERVAL = 0.0005
+
+
+def _align(size: int) -> int:
+    return (size + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def attach_shared_memory(name: str) -> shared_memory.SharedMemory:
+    """Attach to an existing segment without handing it to this process's resource tracker"""
+    shm = shared_memory.SharedMemory(name=name)
+    # The tracker would otherwise unlink the producer's segment when we exit
+    _untrack(shm)
+    return shm
+
+
+def _untrack(shm: shared_memory.SharedMemory):
+    if os.name == 'posix':
+        resource_tracker.unregister(shm._name, 'shared_memory')
+
+
+def _unlink_untracked(shm: shared_memory.SharedMemory):
+    """Unlink a segment that was taken out of the resource tracker"""
+    if os.name == 'posix':
+        # unlink() unregisters the segment again, so it has to be registered first
+        resource_tracker.register(shm._name, 'shared_memory')
+    shm.unlink()
+
+
+class RingFrame:
+    """A frame read from the ring, viewed in place unless copied"""
+    __slots__ = ('frame_id', 'timestamp_ns', 'image', 'slot', 'seq', '_slot_header')
+
+    def __init__(self, frame_id, timestamp_ns, image, slot, seq, slot_header):
+        self.frame_id = frame_id
+        self.timestamp_ns = timestamp_ns
+        self.image = image
+        self.slot = slot
+        self.seq = seq
+        self._slot_header = slot_header
+
+    def is_valid(self) -> bool:
+        """Check the writer has not reused the slot since the frame was read.
+
+        Zero-copy consumers should call this after they are done with
+        `image` and discard their result if it returns False.
+        """
+        return int(self._slot_header[SLOT_SEQ]) == self.seq
+
+
+class _RingLayout:
+    """Numpy views over a ring segment"""
+    def __init__(self, shm: shared_memory.SharedMemory, slots: int, slot_bytes: int):
+        self.shm = shm
+        self.slots = slots
+        self.slot_bytes = slot_bytes
+        offset = 0
+        self.header = np.ndarray((RING_HEADER_WORDS,), dtype=np.int64,
+                                 buffer=shm.buf, offset=offset)
+        offset += RING_HEADER_WORDS * 8
+        self.readers = np.ndarray((MAX_READERS, READER_WORDS), dtype=np.int64,
+                                  buffer=shm.buf, offset=offset)
+        offset += MAX_READERS * READER_WORDS * 8
+        self.slot_headers = np.ndarray((slots, SLOT_HEADER_WORDS), dtype=np.int64,
+                                       buffer=shm.buf, offset=offset)
+        offset = _align(offset + slots * SLOT_HEADER_WORDS * 8)
+        self.slot_data = np.ndarray((slots, slot_bytes), dtype=np.uint8,
+                                    buffer=shm.buf, offset=offset)
+
+    @staticmethod
+    def segment_size(slots: int, slot_bytes: int) -> int:
+        headers = (RING_HEADER_WORDS + MAX_READERS * READER_WORDS
+                   + slots * SLOT_HEADER_WORDS) * 8
+        return _align(headers) + slots * slot_bytes
+
+    def slot_image(self, slot: int, height: int, width: int, channels: int) -> np.ndarray:
+        return self.slot_data[slot, :height * width * channels].reshape(
+            height, width, channels)
+
+    def release(self):
+        # Views must go before the segment can be closed
+        self.header = self.readers = self.slot_headers = self.slot_data = None
+
+
+class FrameRing:
+    """Writer side of an N-slot shared-memory frame ring.
+
+    Every slot is guarded by a sequence counter that is odd while the slot
+    is being written, so readers can detect torn reads without locking. The
+    writer never waits for readers; slow readers skip ahead and the frames
+    they missed are counted as dropped.
+
+    The segment is kept out of the resource tracker, which is shared with
+    readers started from the same parent and would otherwise see it
+    unregistered twice. A ring left behind by a crashed writer is removed
+    through the channel registry instead.
+    """
+    def __init__(self, name: str, height: int, width: int, channels: int = 3,
+                 slots: int = 8, color: str = 'bgr'):
+        if slots < 2:
+            raise ValueError("A frame ring needs at least two slots")
+        if color not in COLORS:
+            raise ValueError(f"Unknown pixel format '{color}', expected one of {COLORS}")
+        self.name = name
+        self.height = height
+        self.width = width
+        self.channels = channels
+        self.slots = slots
+        self.color = color
+        slot_bytes = _align(height * width * channels)
+        self._shm = shared_memory.SharedMemory(
+            name=name, create=True, size=_RingLayout.segment_size(slots, slot_bytes))
+        _untrack(self._shm)
+        self._layout = _RingLayout(self._shm, slots, slot_bytes)
+
+        header = self._layout.header
+        header[:] = 0
+        self._layout.readers[:] = 0
+        self._layout.slot_headers[:] = 0
+        self._layout.slot_headers[:, SLOT_FRAME_ID] = -1
+        header[HDR_SLOTS] = slots
+        header[HDR_SLOT_BYTES] = slot_bytes
+        header[HDR_HEIGHT] = height
+        header[HDR_WIDTH] = width
+        header[HDR_CHANNELS] = channels
+        header[HDR_LATEST] = -1
+        header[HDR_STATE] = STATE_RUNNING
+        header[HDR_COLOR] = COLORS.index(color)
+        # Magic goes last so readers never attach to a half initialised ring
+        header[HDR_MAGIC] = RING_MAGIC
+
+        self._next_frame_id = 0
+        self._writing_slot = None
+
+    @property
+    def latest_frame_id(self) -> int:
+        return int(self._layout.header[HDR_LATEST])
+
+    def begin_frame(self) -> np.ndarray:
+        """Claim the next slot and return a writable view to decode into"""
+        slot = self._next_frame_id % self.slots
+        slot_header = self._layout.slot_headers[slot]
+        slot_header[SLOT_SEQ] += 1  # odd: write in progress
+        self._writing_slot = slot
+        return self._layout.slot_image(slot, self.height, self.width, self.channels)
+
+    def commit_frame(self, timestamp_ns: int = None) -> int:
+        """Publish the frame written into the slot claimed by begin_frame"""
+        slot = self._writing_slot
+        slot_header = self._layout.slot_headers[slot]
+        frame_id = self._next_frame_id
+        slot_header[SLOT_FRAME_ID] = frame_id
+        slot_header[SLOT_TIMESTAMP] = time.time_ns() if timestamp_ns is None else timestamp_ns
+        slot_header[SLOT_HEIGHT] = self.height
+        slot_header[SLOT_WIDTH] = self.width
+        slot_header[SLOT_CHANNELS] = self.channels
+        slot_header[SLOT_SEQ] += 1  # even: stable again
+        self._layout.header[HDR_LATEST] = frame_id
+        self._next_frame_id += 1
+        self._writing_slot = None
+        return frame_id
+
+    def abort_frame(self):
+        """Give up a claimed slot, leaving it marked empty; no-op if none is claimed"""
+        if self._writing_slot is None:
+            return
+        slot_header = self._layout.slot_headers[self._writing_slot]
+        slot_header[SLOT_FRAME_ID] = -1
+        slot_header[SLOT_SEQ] += 1
+        self._writing_slot = None
+
+    def write(self, frame: np.ndarray, timestamp_ns: int = None) -> int:
+        """Copy a frame into the next slot and publish it"""
+        self.begin_frame()[:] = frame
+        return self.commit_frame(timestamp_ns)
+
+    def mark_ended(self):
+        """Tell readers no more frames will be published"""
+        self._layout.header[HDR_STATE] = STATE_ENDED
+
+    def reader_stats(self) -> List[dict]:
+        """Per-reader progress and dropped frame counts"""
+        return [{'pid': int(entry[RDR_PID]),
+                 'last_frame_id': int(entry[RDR_LAST_FRAME_ID]),
+                 'dropped': int(entry[RDR_DROPPED]),
+                 'acked': int(entry[RDR_ACKED])}
+                for entry in self._layout.readers if entry[RDR_PID]]
+
+    def wait_acked(self, frame_id: int, timeout: float = None) -> bool:
+        """Wait until at least one reader is attached and every reader has
+        acknowledged frame_id. Returns False on timeout.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        readers = self._layout.readers
+        while True:
+            attached = readers[:, RDR_PID] != 0
+            lagging = attached & (readers[:, RDR_ACKED] < frame_id)
+            if attached.any() and not lagging.any():
+                return True
+            # A reader that died without detaching would block us forever
+            for index in lagging.nonzero()[0]:
+                if not pid_alive(int(readers[index, RDR_PID])):
+                    readers[index, RDR_PID] = 0
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(POLL_INTERVAL)
+
+    def close(self, unlink: bool = True):
+        """Release the ring, removing the segment by default"""
+        self._layout.release()
+        self._shm.close()
+        if unlink:
+            _unlink_untracked(self._shm)
+
+
+class FrameRingReader:
+    """Reader side of a FrameRing.
+
+    Frames are returned as views into shared memory unless `copy=True` is
+    passed. Each reader keeps track of the last frame it consumed and counts
+    frames the writer overwrote before it got to them.
+    """
+    def __init__(self, name: str):
+        self.name = name
+        self._shm = attach_shared_memory(name)
+        header = np.ndarray((RING_HEADER_WORDS,), dtype=np.int64, buffer=self._shm.buf)
+        if int(header[HDR_MAGIC]) != RING_MAGIC:
+            del header
+            self._shm.close()
+            raise ValueError(f"Shared memory '{name}' is not a frame ring")
+        self._layout = _RingLayout(self._shm, int(header[HDR_SLOTS]),
+                                   int(header[HDR_SLOT_BYTES]))
+        del header
+        self.slots = self._layout.slots
+        self.height = int(self._layout.header[HDR_HEIGHT])
+        self.width = int(self._layout.header[HDR_WIDTH])
+        self.channels = int(self._layout.header[HDR_CHANNELS])
+        self.color = COLORS[int(self._layout.header[HDR_COLOR])]
+
+        self.last_frame_id: Optional[int] = None
+        self.dropped = 0
+        self._entry = self._register()
+
+    def _register(self):
+        """Claim a row in the shared reader table, if one is free"""
+        readers = self._layout.readers
+        for index in range(MAX_READERS):
+            pid = int(readers[index, RDR_PID])
+            if pid == 0 or not pid_alive(pid):
+                readers[index] = 0
+                readers[index, RDR_PID] = os.getpid()
+                readers[index, RDR_LAST_FRAME_ID] = -1
+                readers[index, RDR_ACKED] = -1
+                return readers[index]
+        return None
+
+    @property
+    def latest_frame_id(self) -> int:
+        return int(self._layout.header[HDR_LATEST])
+
+    @property
+    def ended(self) -> bool:
+        return int(self._layout.header[HDR_STATE]) == STATE_ENDED
+
+    def _read_slot(self, slot: int, frame_id: int, copy: bool) -> Optional[RingFrame]:
+        """Read one slot, returning None if it is mid-write or holds another frame"""
+        slot_header = self._layout.slot_headers[slot]
+        seq = int(slot_header[SLOT_SEQ])
+        if seq & 1 or int(slot_header[SLOT_FRAME_ID]) != frame_id:
+            return None
+        timestamp_ns = int(slot_header[SLOT_TIMESTAMP])
+        image = self._layout.slot_image(slot, int(slot_header[SLOT_HEIGHT]),
+                                        int(slot_header[SLOT_WIDTH]),
+                                        int(slot_header[SLOT_CHANNELS]))
+        if copy:
+            image = image.copy()
+        if int(slot_header[SLOT_SEQ]) != seq:
+            return None
+        return RingFrame(frame_id, timestamp_ns, image, slot, seq, slot_header)
+
+    def _advance(self, frame: RingFrame) -> RingFrame:
+        """Record consumption of a frame and count anything skipped over"""
+        if self.last_frame_id is not None and frame.frame_id > self.last_frame_id + 1:
+            self.dropped += frame.frame_id - self.last_frame_id - 1
+        self.last_frame_id = frame.frame_id
+        if self._entry is not None:
+            self._entry[RDR_LAST_FRAME_ID] = frame.frame_id
+            self._entry[RDR_DROPPED] = self.dropped
+        return frame
+
+    def latest(self, copy: bool = False) -> Optional[RingFrame]:
+        """Return the most recently published frame"""
+        while True:
+            frame_id = self.latest_frame_id
+            if frame_id < 0:
+                return None
+            frame = self._read_slot(frame_id % self.slots, frame_id, copy)
+            if frame is not None:
+                return self._advance(frame)
+
+    def next_after(self, frame_id: int, copy: bool = False) -> Optional[RingFrame]:
+        """Return the frame following frame_id, or the oldest still available.
+
+        Returns None if no newer frame has been published yet.
+        """
+        while True:
+            latest = self.latest_frame_id
+            wanted = frame_id + 1
+            if wanted > latest:
+                return None
+            # The slot after the newest one may already be under rewrite
+            oldest = latest - self.slots + 2
+            if wanted < oldest:
+                wanted = oldest
+            frame = self._read_slot(wanted % self.slots, wanted, copy)
+            if frame is not None:
+                return self._advance(frame)
+
+    def wait_next(self, timeout: float = None, copy: bool = False) -> Optional[RingFrame]:
+        """Wait for the frame after the last one consumed by this reader.
+
+        Returns None on timeout or once the writer has ended the stream.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            if self.last_frame_id is None:
+                frame = self.latest(copy)
+            else:
+                frame = self.next_after(self.last_frame_id, copy)
+            if frame is not None:
+                return frame
+            if self.ended:
+                return None
+            if deadline is not None and time.monotonic() >= deadline:
+                return None
+            time.sleep(POLL_INTERVAL)
+
+    def ack(self, frame_id: int = None):
+        """Acknowledge a frame, by default the last one consumed.
+
+        Only matters to a writer publishing in lockstep, which holds back
+        the next frame until every reader has acknowledged the previous one.
+        """
+        if frame_id is None:
+            frame_id = self.last_frame_id
+        if self._entry is not None and frame_id is not None:
+            self._entry[RDR_ACKED] = frame_id
+
+    def close(self):
+        """Detach from the ring"""
+        if self._entry is not None:
+            self._entry[RDR_PID] = 0
+            self._entry = None
+        self._layout.release()
+        self._shm.close()
+
+
+def pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
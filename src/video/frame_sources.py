@@ -0,0 +1,132 @@
+import time
+from typing import Optional, Tuple
+
+import cv2
+import numpy as np
+
+from video.frame_pacer import FramePacer
+from video.channel_registry import open_channel
+
+# A source frame: id, timestamp in ns and the BGR image. The image may be a
+# view into memory the source reuses, so it is only valid until the next read.
+SourceFrame = Tuple[int, int, np.ndarray]
+
+
+class FrameSource:
+    """Something frames can be pulled from, one at a time, off the GUI thread"""
+    # Pixel format of the images read: bgr, rgb or gray
+    color = 'bgr'
+
+    def read(self, timeout: float = None) -> Optional[SourceFrame]:
+        """Block for the next frame; None on timeout or at the end of the source"""
+        raise NotImplementedError
+
+    def is_valid(self) -> bool:
+        """Whether the image of the last frame read is still intact"""
+        return True
+
+    @property
+    def ended(self) -> bool:
+        return False
+
+    def close(self):
+        pass
+
+
+class CameraSource(FrameSource):
+    """Frames from a local camera, paced by the camera itself"""
+    def __init__(self, index: int = 0):
+        self.capture = cv2.VideoCapture(index)
+        if not self.capture.isOpened():
+            raise IOError(f"Could not open camera {index}")
+        self._frame_id = -1
+        self._image = None
+
+    def read(self, timeout: float = None) -> Optional[SourceFrame]:
+        ret, image = self.capture.read(self._image)
+        if not ret:
+            return None
+        self._image = image
+        self._frame_id += 1
+        return self._frame_id, time.time_ns(), image
+
+    def close(self):
+        self.capture.release()
+
+
+class FileSource(FrameSource):
+    """Frames of a video file at its native rate times `speed`, optionally looping"""
+    def __init__(self, path: str, speed: float = 1.0, loop: bool = True):
+        self.capture = cv2.VideoCapture(path)
+        if not self.capture.isOpened():
+            raise IOError(f"Could not open video {path}")
+        self.loop = loop
+        self.pacer = FramePacer(self.capture.get(cv2.CAP_PROP_FPS) or 30.0, speed)
+        self._frame_id = -1
+        self._image = None
+        self._ended = False
+
+    @property
+    def ended(self) -> bool:
+        return self._ended
+
+    def read(self, timeout: float = None) -> Optional[SourceFrame]:
+        ret, image = self.capture.read(self._image)
+        if not ret and self.loop and self._frame_id >= 0:
+            self.capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ret, image = self.capture.read(self._image)
+        if not ret:
+            self._ended = True
+            return None
+        self._image = image
+        self._frame_id += 1
+        self.pacer.wait()
+        return self._frame_id, time.time_ns(), image
+
+    def close(self):
+        self.capture.release()
+
+
+class RingSource(FrameSource):
+    """Frames published by video_loader_writer into a shared memory frame ring.
+
+    The ring is looked up by channel name, waiting up to `timeout` seconds
+    for its producer to publish it. Images are read in place from the ring,
+    so is_valid() has to be checked after they have been used. Frames are
+    acknowledged as soon as they are read, which keeps a lockstep writer
+    from waiting on a display. The id and timestamp of every frame read
+    are added to `alignment`, an AlignmentBuffer, when one is given.
+    """
+    def __init__(self, shared_memory_name: str, timeout: float = None, alignment=None):
+        self.name = shared_memory_name
+        self.alignment = alignment
+        self.reader = open_channel(shared_memory_name, timeout)
+        self._frame = None
+
+    @property
+    def ended(self) -> bool:
+        return self.reader.ended
+
+    @property
+    def dropped(self) -> int:
+        return self.reader.dropped
+
+    @property
+    def color(self) -> str:
+        return self.reader.color
+
+    def read(self, timeout: float = None) -> Optional[SourceFrame]:
+        self._frame = frame = self.reader.wait_next(timeout)
+        if frame is None:
+            return None
+        self.reader.ack(frame.frame_id)
+        if self.alignment is not None:
+            self.alignment.add_frame(frame.frame_id, frame.timestamp_ns)
+        return frame.frame_id, frame.timestamp_ns, frame.image
+
+    def is_valid(self) -> bool:
+        return self._frame is not None and self._frame.is_valid()
+
+    def close(self):
+        self._frame = None
+        self.reader.close()
@@ -0,0 +1,180 @@
+import time
+from typing import Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from comm.metrics import LatencyHistogram
+from video.channel_registry import ChannelRegistry
+from video.frame_ring import COLORS, FrameRing
+
+# Variant channels are published as '<channel>.<variant>'
+VARIANT_SEPARATOR = '.'
+
+_CONVERSIONS = {'rgb': cv2.COLOR_BGR2RGB, 'gray': cv2.COLOR_BGR2GRAY}
+
+
+class FrameVariant:
+    """One format a loader publishes next to its native BGR frames.
+
+    Steps are applied in a fixed order whatever order they are given in:
+    crop to the region of interest, resize, then convert colors.
+    """
+    __slots__ = ('name', 'size', 'color', 'roi')
+
+    def __init__(self, name: str, size: Tuple[int, int] = None, color: str = 'bgr',
+                 roi: Tuple[int, int, int, int] = None):
+        if not name or VARIANT_SEPARATOR in name:
+            raise ValueError(f"Invalid variant name '{name}'")
+        if color not in COLORS:
+            raise ValueError(f"Unknown pixel format '{color}', expected one of {COLORS}")
+        self.name = name
+        self.size = tuple(size) if size else None
+        self.color = color
+        self.roi = tuple(roi) if roi else None
+
+    @classmethod
+    def parse(cls, spec: str) -> 'FrameVariant':
+        """Variant of a spec such as 'display:720x720:rgb' or 'tip:roi=100,80,320,320:gray'.
+
+        After the name come any of: WIDTHxHEIGHT, roi=X,Y,WIDTH,HEIGHT and
+        a pixel format (bgr, rgb or gray), separated by colons.
+        """
+        name, *steps = spec.split(':')
+        size = roi = None
+        color = 'bgr'
+        for step in steps:
+            step = step.strip().lower()
+            if step in COLORS:
+                color = step
+            elif step.startswith('roi='):
+                roi = tuple(int(value) for value in step[4:].split(','))
+                if len(roi) != 4:
+                    raise ValueError(f"A region of interest is X,Y,WIDTH,HEIGHT, not '{step}'")
+            elif 'x' in step:
+                size = tuple(int(value) for value in step.split('x'))
+            else:
+                raise ValueError(f"Unknown step '{step}' in frame variant '{spec}'")
+        return cls(name.strip(), size, color, roi)
+
+    def shape(self, height: int, width: int) -> Tuple[int, int, int]:
+        """Shape of this variant of a height x width frame"""
+        if self.size is not None:
+            width, height = self.size
+        elif self.roi is not None:
+            width, height = self.roi[2:]
+        return height, width, 1 if self.color == 'gray' else 3
+
+    def __repr__(self):
+        return (f'FrameVariant({self.name!r}, size={self.size}, color={self.color!r}, '
+                f'roi={self.roi})')
+
+
+def variant_channel(channel: str, variant: str) -> str:
+    return f'{channel}{VARIANT_SEPARATOR}{variant}'
+
+
+class FramePreprocessor:
+    """Publishes every configured variant of a loader's frames, each in its own ring.
+
+    Each variant is listed in the channel registry as
+    '<channel>.<variant>', so a consumer attaches to the format it needs
+    and reads it in place like any other channel. Every variant is
+    computed once per source frame, straight into its ring slot; crops
+    are views, and a resize shared by several variants is done once into
+    a preallocated buffer. Variants are committed together with the
+    source frame, so frame ids match across all of a loader's channels.
+    """
+    def __init__(self, channel: str, height: int, width: int, variants: List[FrameVariant],
+                 registry: ChannelRegistry, fps: float, ring_slots: int):
+        names = [variant.name for variant in variants]
+        if len(set(names)) != len(names):
+            raise ValueError(f"Variant names must be unique: {names}")
+        self.variants = variants
+        self.registry = registry
+        self.rings: List[FrameRing] = []
+        # Resize buffers, for variants converted after resizing or sharing a resize
+        self._resized: Dict[tuple, np.ndarray] = {}
+        keys = [(variant.roi, variant.size) for variant in variants]
+        self._shared = {key for key in keys if keys.count(key) > 1}
+        self.process_time = LatencyHistogram()
+        try:
+            for variant in variants:
+                self._check_roi(variant, height, width)
+                name = variant_channel(channel, variant.name)
+                shape = variant.shape(height, width)
+                registry.claim(name)
+                self.rings.append(FrameRing(name, *shape, slots=ring_slots, color=variant.color))
+                registry.publish(name, shape, fps)
+                key = (variant.roi, variant.size)
+                if variant.size is not None and key not in self._resized \
+                        and (key in self._shared or variant.color != 'bgr'):
+                    self._resized[key] = np.empty(shape[:2] + (3,), dtype=np.uint8)
+        except Exception:
+            self.close()
+            raise
+
+    @staticmethod
+    def _check_roi(variant: FrameVariant, height: int, width: int):
+        if variant.roi is None:
+            return
+        x, y, roi_width, roi_height = variant.roi
+        if x < 0 or y < 0 or roi_width <= 0 or roi_height <= 0 \
+                or x + roi_width > width or y + roi_height > height:
+            raise ValueError(f"Region of interest of variant '{variant.name}' is outside "
+                             f"the {width}x{height} frame")
+
+    def prepare(self, frame: np.ndarray):
+        """Compute every variant of a BGR frame into its ring's next slot"""
+        started = time.perf_counter()
+        resized = {}
+        for variant, ring in zip(self.variants, self.rings):
+            slot = ring.begin_frame()
+            key = (variant.roi, variant.size)
+            source = resized.get(key)
+            if source is None:
+                source = frame
+                if variant.roi is not None:
+                    x, y, roi_width, roi_height = variant.roi
+                    source = frame[y:y + roi_height, x:x + roi_width]
+                if variant.size is not None:
+                    # A BGR variant nobody else shares a resize with is resized in place
+                    source = cv2.resize(source, variant.size,
+                                        dst=self._resized.get(key, slot))
+                resized[key] = source
+            if variant.color != 'bgr':
+                cv2.cvtColor(source, _CONVERSIONS[variant.color],
+                             dst=slot.reshape(slot.shape[:2]) if variant.color == 'gray' else slot)
+            elif source is not slot:
+                np.copyto(slot, source)
+        self.process_time.record((time.perf_counter() - started) * 1e6)
+
+    def commit(self, timestamp_ns: int):
+        for ring in self.rings:
+            ring.commit_frame(timestamp_ns)
+
+    def abort(self):
+        """Give up the slots claimed by prepare(), including by one that failed midway"""
+        for ring in self.rings:
+            ring.abort_frame()
+
+    def mark_ended(self):
+        for ring in self.rings:
+            ring.mark_ended()
+
+    def stats(self) -> dict:
+        return {'variants': [variant.name for variant in self.variants],
+                'process_us': self.process_time.snapshot()}
+
+    def close(self):
+        for ring in self.rings:
+            self.registry.unpublish(ring.name)
+            ring.close()
+        self.rings = []
+        self._resized = {}
+
+
+def parse_variants(specs: Optional[List]) -> List[FrameVariant]:
+    """Variants given as FrameVariant objects or spec strings"""
+    return [spec if isinstance(spec, FrameVariant) else FrameVariant.parse(spec)
+            for spec in specs or ()]
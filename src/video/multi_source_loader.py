@@ -0,0 +1,138 @@
+import argparse
+import multiprocessing as mp
+import os
+import signal
+import sys
+from typing import List, Tuple, Union
+
+from video.channel_registry import ChannelRegistry
+from video.frame_cache import FrameCache
+from video.frame_variants import parse_variants
+from video.video_loader_writer import DEFAULT_RING_SLOTS, video_loader_writer
+
+CAMERA_PREFIX = 'camera:'
+
+
+def parse_source(spec: str) -> Tuple[str, Union[str, int]]:
+    """Channel name and source of 'name=path', 'name=camera:N' or a bare path.
+
+    A bare path publishes under the file's name without its extension.
+    """
+    name, separator, source = spec.partition('=')
+    if not separator:
+        name, source = os.path.splitext(os.path.basename(spec))[0], spec
+    if source.startswith(CAMERA_PREFIX):
+        source = int(source[len(CAMERA_PREFIX):])
+    return name, source
+
+
+def _publish(source, name: str, options: dict, cache_dir: str):
+    """Loader process body: publish one source until it ends or is terminated"""
+    # Turn terminate() into a normal exit so the ring and registry entry are cleaned up
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    frame_cache = FrameCache(cache_dir) if cache_dir else None
+    video_loader_writer(source, name, frame_cache=frame_cache, **options)
+
+
+class MultiSourceLoader:
+    """Decodes several videos or cameras in parallel, one process per source.
+
+    Each source publishes its own frame ring, listed in the channel registry
+    under its name. Sources that die without cleaning up are pruned from
+    the registry, with their rings, once their process has exited.
+    """
+    def __init__(self, sources: List[Tuple[str, Union[str, int]]], ring_slots=DEFAULT_RING_SLOTS,
+                 fps=None, speed=1.0, lockstep=False, ack_timeout=None, registry_name=None,
+                 cache_dir=None, start=None, end=None, loop_segment=False, variants=None):
+        names = [name for name, _ in sources]
+        if len(set(names)) != len(names):
+            raise ValueError(f"Channel names must be unique: {names}")
+        self.sources = sources
+        self.registry_name = registry_name
+        self.cache_dir = cache_dir
+        self.options = {'ring_slots': ring_slots, 'fps': fps, 'speed': speed,
+                        'lockstep': lockstep, 'ack_timeout': ack_timeout,
+                        'registry_name': registry_name, 'start': start, 'end': end,
+                        'loop_segment': loop_segment,
+                        'variants': parse_variants(variants)}
+        self._context = mp.get_context('spawn')
+        self.processes = {}
+
+    def start(self):
+        for name, source in self.sources:
+            process = self._context.Process(target=_publish, name=f'loader-{name}',
+                                            args=(source, name, self.options, self.cache_dir))
+            process.start()
+            self.processes[name] = process
+
+    def join(self, timeout: float = None):
+        for process in self.processes.values():
+            process.join(timeout)
+
+    def stop(self, timeout: float = 5.0):
+        """Terminate every loader, killing those that do not exit in time"""
+        for process in self.processes.values():
+            if process.is_alive():
+                process.terminate()
+        for process in self.processes.values():
+            process.join(timeout)
+            if process.is_alive():
+                process.kill()
+                process.join()
+
+    def cleanup(self) -> List[str]:
+        """Remove channels left behind by loaders that crashed"""
+        registry = ChannelRegistry(self.registry_name)
+        try:
+            return registry.prune()
+        finally:
+            registry.close()
+
+    def exit_codes(self) -> dict:
+        return {name: process.exitcode for name, process in self.processes.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Publish several videos or cameras "
+                                                 "to shared memory frame channels")
+    parser.add_argument('sources', nargs='+',
+                        help="name=video_path, name=camera:INDEX, or a video path")
+    parser.add_argument('--slots', type=int, default=DEFAULT_RING_SLOTS)
+    parser.add_argument('--fps', type=float, default=None,
+                        help="Publish rate, default each video's native rate; 0 for unpaced")
+    parser.add_argument('--speed', type=float, default=1.0)
+    parser.add_argument('--lockstep', action='store_true',
+                        help="Wait for readers to acknowledge each frame")
+    parser.add_argument('--ack-timeout', type=float, default=None)
+    parser.add_argument('--registry', default=None, help="Channel registry name")
+    parser.add_argument('--cache-dir', default=None,
+                        help="Decoded frame cache directory, off by default")
+    parser.add_argument('--start', default=None,
+                        help="First frame of every video: a frame number, 12.5s or mm:ss")
+    parser.add_argument('--end', default=None, help="Frame or time to stop before")
+    parser.add_argument('--loop-segment', action='store_true',
+                        help="Play the segment from --start to --end over and over")
+    parser.add_argument('--variant', action='append', default=[], dest='variants',
+                        help="Extra format published as <name>.<variant>, e.g. "
+                             "display:720x720:rgb or tip:roi=100,80,320,320:gray")
+    args = parser.parse_args()
+
+    loader = MultiSourceLoader([parse_source(spec) for spec in args.sources], args.slots,
+                               args.fps, args.speed, args.lockstep, args.ack_timeout,
+                               args.registry, args.cache_dir, args.start, args.end,
+                               args.loop_segment, args.variants)
+    loader.start()
+    try:
+        loader.join()
+    except KeyboardInterrupt:
+        print("Stopping loaders")
+    finally:
+        loader.stop()
+        for name in loader.cleanup():
+            print(f"Removed stale channel {name}")
+        for name, code in loader.exit_codes().items():
+            print(f"{name}: exit code {code}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,13 +1,52 @@
 import cv2
-import numpy as np
-from multiprocessing import shared_memory
-import multiprocessing as mp
 import time
 
-def video_loader_writer(video_path, shared_memory_name):
-    # Open the video
-    cap = cv2.VideoCapture(video_path)
-    
+from record.session_log import SessionRecorder
+from video.channel_registry import ChannelRegistry
+from video.frame_cache import FrameCache
+from video.frame_index import FrameIndex, IndexedVideo, parse_position
+from video.frame_pacer import UNPACED, FramePacer
+from video.frame_ring import FrameRing
+from video.frame_variants import FramePreprocessor, parse_variants
+
+DEFAULT_RING_SLOTS = 8
+DEFAULT_FPS = 30.0
+
+
+def video_loader_writer(video_path, shared_memory_name, ring_slots=DEFAULT_RING_SLOTS,
+                        record_path=None, frame_cache: FrameCache = None, fps=None,
+                        speed=1.0, lockstep=False, ack_timeout=None, registry_name=None,
+                        start=None, end=None, loop_segment=False, variants=None):
+    """Publish the frames of a video into a shared memory frame ring.
+
+    video_path may also be a camera index. The ring is listed in the
+    channel registry under shared_memory_name for consumers to discover.
+    Frames are paced at `fps` times `speed`; fps defaults to the video's
+    native rate and 0 publishes as fast as possible. Cameras pace
+    themselves and are not paced by default. In lockstep mode a frame is
+    only published once every reader has acknowledged the previous one,
+    or `ack_timeout` seconds have passed.
+
+    Playback can be limited to the segment [start, end) of a file, given
+    as frame numbers or times ('12.5s', 'mm:ss'), and looped. Seeking
+    goes through the frame index stored next to the video, built on first
+    use, so reaching any point costs at most one GOP of decoding.
+
+    `variants` (FrameVariant objects or specs like 'display:720x720:rgb')
+    are computed once per frame and published next to the native frames
+    as channels named '<shared_memory_name>.<variant>'. Lockstep only
+    waits on readers of the native channel.
+    """
+    camera = isinstance(video_path, int)
+    segment = start is not None or end is not None or loop_segment
+    if camera and segment:
+        raise ValueError("Segments can only be played from video files")
+    # Open the video, from the decoded frame cache when one is given
+    cap = frame_cache.open(video_path) if frame_cache is not None and not camera else None
+    index = FrameIndex.for_video(video_path) if segment else None
+    if cap is None:
+        cap = IndexedVideo(video_path, index) if segment else cv2.VideoCapture(video_path)
+
     if not cap.isOpened():
         print("Error: Could not open video")
         return
@@ -16,48 +55,119 @@ def video_loader_writer(video_path, shared_memory_name):
     frame_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
     frame_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
     total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    native_fps = cap.get(cv2.CAP_PROP_FPS) or DEFAULT_FPS
+    if fps is None:
+        fps = UNPACED if camera else native_fps
+    pacer = FramePacer(fps, speed)
 
-    # Create shared memory for metadata
-    metadata_shm = shared_memory.SharedMemory(name='video_metadata', create=True, size=16)
-    metadata_array = np.ndarray((4,), dtype=np.int32, buffer=metadata_shm.buf)
-    
-    # Create shared memory for frame
-    frame_shm = shared_memory.SharedMemory(name=shared_memory_name, create=True, size=frame_width * frame_height * 3)
-    frame_array = np.ndarray((frame_height, frame_width, 3), dtype=np.uint8, buffer=frame_shm.buf)
+    start_frame = parse_position(start, index) if start is not None else 0
+    end_frame = parse_position(end, index) if end is not None else float('inf')
+    if start_frame:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+    position = start_frame
+    segment_loops = 0
 
-    frame_id = 0
+    # Create the shared memory frame ring and list it in the channel registry;
+    # a ring left by a crashed loader of the same name is cleaned up first
+    registry = ChannelRegistry(registry_name)
+    ring = preprocessor = None
     try:
-        while True:
-            ret, frame = cap.read()
-            if not ret:
-                # Signal end of video
-                metadata_array[0] = -1
-                break
+        registry.claim(shared_memory_name)
+        ring = FrameRing(shared_memory_name, frame_height, frame_width, 3, slots=ring_slots)
+        if variants:
+            preprocessor = FramePreprocessor(shared_memory_name, frame_height, frame_width,
+                                             parse_variants(variants), registry,
+                                             (fps or native_fps) * speed, ring_slots)
+    except Exception:
+        if ring is not None:
+            ring.close()
+        registry.close()
+        cap.release()
+        raise
+    registry.publish(shared_memory_name, (frame_height, frame_width, 3),
+                     (fps or native_fps) * speed)
+
+    # Optionally log every published frame id for session replay
+    recorder = SessionRecorder(record_path) if record_path else None
 
-            # Update metadata
-            metadata_array[0] = frame_id  # Frame ID
-            metadata_array[1] = frame_height  # Frame Height
-            metadata_array[2] = frame_width   # Frame Width
-            metadata_array[3] = 1  # Frame available flag
+    slot = frame = None
+    frame_id = -1
+    ack_timeouts = 0
+    try:
+        while True:
+            try:
+                # Decode straight into the next ring slot
+                slot = ring.begin_frame()
+                ret, frame = cap.read(slot) if position < end_frame else (False, None)
+                if not ret and loop_segment and position > start_frame:
+                    # Back to the start of the segment
+                    cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+                    position = start_frame
+                    segment_loops += 1
+                    ret, frame = cap.read(slot)
+                if not ret:
+                    # Signal end of video
+                    ring.abort_frame()
+                    ring.mark_ended()
+                    if preprocessor is not None:
+                        preprocessor.mark_ended()
+                    break
 
-            # Copy frame to shared memory
-            frame_array[:] = frame
+                if frame.ctypes.data != slot.ctypes.data:
+                    slot[:] = frame
+                position += 1
+                if preprocessor is not None:
+                    preprocessor.prepare(slot)
 
-            frame_id += 1
-            time.sleep(1/30)  # Control frame rate
+                # The next frame is decoded while the consumer works on this one
+                if lockstep and frame_id >= 0 and not ring.wait_acked(frame_id, ack_timeout):
+                    ack_timeouts += 1
+                pacer.wait()
+                timestamp_ns = time.time_ns()
+                frame_id = ring.commit_frame(timestamp_ns)
+                if preprocessor is not None:
+                    preprocessor.commit(timestamp_ns)
+            except BaseException:
+                # Leave no slot half written, and tell readers nothing more is coming
+                ring.abort_frame()
+                ring.mark_ended()
+                if preprocessor is not None:
+                    preprocessor.abort()
+                    preprocessor.mark_ended()
+                raise
+            if recorder is not None:
+                recorder.record_frame(frame_id, timestamp_ns)
 
     finally:
         cap.release()
-        metadata_shm.close()
-        metadata_shm.unlink()
-        frame_shm.close()
-        frame_shm.unlink()
+        if recorder is not None:
+            recorder.close()
+        stats = pacer.stats()
+        print(f"Published {stats['frames']} frames at {stats['achieved_fps']:.2f} fps "
+              f"(target {stats['target_fps']:.2f}), jitter {stats['interval_jitter_ms']:.3f} ms, "
+              f"lateness p99 {stats['lateness_us']['p99']:.0f} us, "
+              f"{stats['late_frames']} late, {ack_timeouts} ack timeouts")
+        if segment:
+            print(f"Segment [{start_frame}, {min(end_frame, position)}) played "
+                  f"{segment_loops + 1} times")
+        for reader in ring.reader_stats():
+            print(f"Reader {reader['pid']} dropped {reader['dropped']} frames")
+        # Drop our views of the ring before closing it
+        slot = frame = None
+        if preprocessor is not None:
+            process_us = preprocessor.stats()['process_us']
+            print(f"Preprocessed {len(preprocessor.variants)} variants in "
+                  f"p50 {process_us['p50']:.0f} us, p99 {process_us['p99']:.0f} us")
+            preprocessor.close()
+        registry.unpublish(shared_memory_name)
+        registry.close()
+        ring.close()
 
 def main():
     video_path = 'your_video.mp4'  # Replace with your video path
     shared_memory_name = 'video_frame_shm'
-    
+
     video_loader_writer(video_path, shared_memory_name)
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()